@@ -0,0 +1,412 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+'''
+Benchmarks the bundling and upload hot paths against synthetic notebooks.
+
+Each scenario runs in a fresh Python process so that its peak RSS is its own,
+and so that import_bundlers measures what loading the bundlers adds to the
+notebook server startup.
+Results can be saved as a baseline and later runs compared against it:
+
+    python benchmarks/bench_bundlers.py --save benchmarks/baseline.json
+    python benchmarks/bench_bundlers.py --compare benchmarks/baseline.json
+
+Comparing exits with a non-zero status if any scenario got slower or bigger
+than the baseline by more than the tolerance.
+'''
+
+import argparse
+import base64
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from os.path import join as pjoin
+
+# Synthetic workload sizes
+SIZES = {
+    'small': dict(cells=20, output_kb=4, ref_files=5, ref_kb=16,
+                  components=50, component_kb=8),
+    'medium': dict(cells=200, output_kb=64, ref_files=50, ref_kb=128,
+                   components=1000, component_kb=16),
+    'large': dict(cells=1000, output_kb=256, ref_files=200, ref_kb=1024,
+                  components=5000, component_kb=16),
+}
+
+SCENARIOS = [
+    'import_bundlers',
+    'make_upload_bundle',
+    'make_upload_bundle_warm',
+    'bundle_declarative_widgets',
+    'server_download',
+    'send_file',
+]
+
+# Metrics compared against baselines
+COMPARED = ['wall_time', 'peak_rss_kb']
+
+
+def make_workload(root, cells, output_kb, ref_files, ref_kb, components,
+                  component_kb):
+    '''
+    Creates a notebook with code cells carrying base64 image outputs, data
+    files it references and a fake declarative widgets extension with a
+    components tree. Returns the notebook path.
+    '''
+    nb_dir = pjoin(root, 'notebooks')
+    data_dir = pjoin(nb_dir, 'data')
+    os.makedirs(data_dir)
+    for i in range(ref_files):
+        with open(pjoin(data_dir, 'file{}.csv'.format(i)), 'w') as f:
+            f.write(('{},{},{}\n'.format(i, i * 2, i * 3)) * (ref_kb * 100))
+
+    png = base64.b64encode(os.urandom(output_kb * 768)).decode('ascii')
+    nb_cells = [{
+        'cell_type': 'markdown',
+        'metadata': {},
+        'source': '<!--associate:\ndata/\n-->'
+    }, {
+        'cell_type': 'code',
+        'execution_count': 1,
+        'metadata': {},
+        'outputs': [],
+        'source': '%%html\n<link rel="import" href="urth_components/'
+                  'urth-core-function/urth-core-function.html" '
+                  'is="urth-core-import">'
+    }]
+    for i in range(cells):
+        nb_cells.append({
+            'cell_type': 'code',
+            'execution_count': i + 2,
+            'metadata': {},
+            'outputs': [{
+                'output_type': 'display_data',
+                'metadata': {},
+                'data': {'image/png': png, 'text/plain': '<Figure>'}
+            }],
+            'source': 'plot({})'.format(i)
+        })
+    notebook = {
+        'cells': nb_cells,
+        'metadata': {'kernelspec': {'name': 'python3',
+                                    'display_name': 'Python 3',
+                                    'language': 'python'}},
+        'nbformat': 4,
+        'nbformat_minor': 0
+    }
+    nb_path = pjoin(nb_dir, 'bench.ipynb')
+    with open(nb_path, 'w') as f:
+        json.dump(notebook, f)
+
+    widgets_dir = pjoin(root, 'jupyter', 'nbextensions', 'urth_widgets')
+    os.makedirs(pjoin(widgets_dir, 'js'))
+    with open(pjoin(widgets_dir, 'js', 'main.js'), 'w') as f:
+        f.write('define([], function() {});\n' * 1000)
+    components_dir = pjoin(widgets_dir, 'urth_components')
+    for i in range(components):
+        component = pjoin(components_dir, 'component-{}'.format(i // 10))
+        if not os.path.isdir(component):
+            os.makedirs(component)
+        with open(pjoin(component, 'element-{}.html'.format(i)), 'w') as f:
+            f.write('<dom-module id="element-{}"></dom-module>\n'.format(i) *
+                    (component_kb * 24))
+    return nb_path
+
+
+class MockContentsManager(object):
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+
+
+class MockRequest(object):
+    host = 'localhost:8888'
+    protocol = 'http'
+    headers = {}
+
+
+class MockHandler(object):
+    '''Stands in for the notebook server bundler handler.'''
+    def __init__(self, root_dir):
+        import notebook.bundler.tools
+        self.settings = {'base_url': '/',
+                         'contents_manager': MockContentsManager(root_dir)}
+        self.tools = notebook.bundler.tools
+        self.request = MockRequest()
+        self.bytes_written = 0
+        self.last_redirect = None
+
+    def set_header(self, name, value):
+        pass
+
+    def write(self, chunk):
+        self.bytes_written += len(chunk)
+
+    def flush(self):
+        from tornado import gen
+        return gen.maybe_future(None)
+
+    def finish(self):
+        pass
+
+    def redirect(self, location):
+        self.last_redirect = location
+
+
+def start_dashboard_server():
+    '''
+    Starts a stand-in dashboard server accepting uploads on a local port.
+    Returns the server and a list of the sizes of the bodies it received.
+    '''
+    try:
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        from socketserver import ThreadingMixIn
+    except ImportError:
+        from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+        from SocketServer import ThreadingMixIn
+    received = []
+
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    class UploadHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            remaining = int(self.headers.get('Content-Length', 0))
+            size = 0
+            while remaining > 0:
+                data = self.rfile.read(min(remaining, 64 * 1024))
+                if not data:
+                    break
+                size += len(data)
+                remaining -= len(data)
+            received.append(size)
+            body = json.dumps({'link': 'http://localhost/dashboards/bench'})
+            body = body.encode('utf-8')
+            self.send_response(201)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), UploadHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, received
+
+
+def count_files(path):
+    return sum(len(filenames) for _, _, filenames in os.walk(path))
+
+
+def peak_rss_kb():
+    '''Returns the peak RSS of the current process in kilobytes.'''
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    peak = usage.ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+class MockWebApp(object):
+    '''Stands in for the notebook server Tornado application.'''
+    def __init__(self):
+        self.settings = {'base_url': '/'}
+        self.handlers = []
+
+    def add_handlers(self, host_pattern, host_handlers):
+        self.handlers.extend(host_handlers)
+
+
+class MockNotebookApp(object):
+    '''Stands in for the notebook server application.'''
+    def __init__(self):
+        self.web_app = MockWebApp()
+
+
+def run_import():
+    '''
+    Times loading the server extension and both bundlers, as the notebook
+    server does, in a process that has not imported them yet. Counts the
+    modules loaded as files touched.
+    '''
+    root = tempfile.mkdtemp()
+    os.environ['DASHBOARD_BUNDLER_STAGING_DIR'] = root
+    try:
+        loaded = set(sys.modules)
+        start = time.time()
+        import dashboards_bundlers
+        dashboards_bundlers.load_jupyter_server_extension(MockNotebookApp())
+        import dashboards_bundlers.server_download
+        import dashboards_bundlers.server_upload
+        wall_time = time.time() - start
+        files_touched = len(set(sys.modules) - loaded)
+        # Wait for the staging area started in the background
+        from dashboards_bundlers.staging import get_area
+        get_area().start()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {'wall_time': wall_time, 'bytes_written': 0,
+            'files_touched': files_touched, 'peak_rss_kb': peak_rss_kb()}
+
+
+def run_scenario(name, size):
+    '''
+    Runs one scenario in the current process and returns its metrics. Only
+    the bundler work itself is timed, not the workload generation.
+    '''
+    if name == 'import_bundlers':
+        return run_import()
+    root = tempfile.mkdtemp()
+    try:
+        nb_path = make_workload(root, **SIZES[size])
+        os.environ['JUPYTER_PATH'] = pjoin(root, 'jupyter')
+        os.environ['DASHBOARD_BUNDLER_CACHE_DIR'] = pjoin(root, 'cache')
+
+        from tornado.ioloop import IOLoop
+        from dashboards_bundlers import server_download, server_upload
+        from dashboards_bundlers.zipstream import read_fragment_index
+        handler = MockHandler(os.path.dirname(nb_path))
+        staging = pjoin(root, 'staging', 'bench')
+        metrics = {}
+
+        if name == 'make_upload_bundle_warm':
+            # Fill the widget asset cache first
+            server_upload.make_upload_bundle(nb_path, staging, handler.tools)
+
+        if name in ('make_upload_bundle', 'make_upload_bundle_warm'):
+            start = time.time()
+            bundle_path = server_upload.make_upload_bundle(nb_path, staging,
+                                                           handler.tools)
+            metrics['wall_time'] = time.time() - start
+            metrics['bytes_written'] = os.path.getsize(bundle_path)
+            metrics['files_touched'] = count_files(staging) + 1
+        elif name == 'bundle_declarative_widgets':
+            start = time.time()
+            server_upload.bundle_declarative_widgets(staging, nb_path)
+            metrics['wall_time'] = time.time() - start
+            metrics['bytes_written'] = sum(
+                os.path.getsize(pjoin(r, f))
+                for r, _, fs in os.walk(staging) for f in fs)
+            metrics['files_touched'] = count_files(staging)
+        elif name == 'server_download':
+            model = {'path': os.path.basename(nb_path)}
+            start = time.time()
+            IOLoop.current().run_sync(
+                lambda: server_download.bundle(handler, model))
+            metrics['wall_time'] = time.time() - start
+            metrics['bytes_written'] = handler.bytes_written
+            files, fragments = server_upload.list_bundle_contents(
+                nb_path, handler.tools)
+            metrics['files_touched'] = len(files)
+            for fragment in fragments:
+                with fragment:
+                    metrics['files_touched'] += len(
+                        read_fragment_index(fragment))
+        elif name == 'send_file':
+            server, received = start_dashboard_server()
+            os.environ['DASHBOARD_SERVER_URL'] = 'http://127.0.0.1:{}'.format(
+                server.server_address[1])
+            bundle_path = server_upload.make_upload_bundle(nb_path, staging,
+                                                           handler.tools)
+            start = time.time()
+            IOLoop.current().run_sync(
+                lambda: server_upload.send_file(bundle_path, 'bench', handler))
+            metrics['wall_time'] = time.time() - start
+            metrics['bytes_written'] = sum(received)
+            metrics['files_touched'] = 1
+            server.shutdown()
+        else:
+            raise ValueError('Unknown scenario {}'.format(name))
+
+        metrics['peak_rss_kb'] = peak_rss_kb()
+        return metrics
+    finally:
+        shutil.rmtree(root, True)
+
+
+def run_isolated(name, size):
+    '''Runs a scenario in a child process and returns its metrics.'''
+    output = subprocess.check_output([
+        sys.executable, os.path.abspath(__file__), '--run', name,
+        '--size', size
+    ])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    '''Returns a list of regressions of results relative to baseline.'''
+    regressions = []
+    for key, metrics in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        for metric in COMPARED:
+            limit = base[metric] * (1 + tolerance)
+            if metrics[metric] > limit:
+                regressions.append('{} {}: {:.3f} > {:.3f} (baseline {:.3f})'
+                                   .format(key, metric, metrics[metric],
+                                           limit, base[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', choices=sorted(SIZES), action='append',
+                        help='workload size (repeatable, default: small)')
+    parser.add_argument('--scenario', choices=SCENARIOS, action='append',
+                        help='scenario to run (repeatable, default: all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per scenario, keeping the fastest')
+    parser.add_argument('--save', metavar='PATH',
+                        help='save results as a baseline JSON file')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='compare results with a baseline JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative regression (default: 0.25)')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    sizes = args.size or ['small']
+
+    if args.run:
+        print(json.dumps(run_scenario(args.run, sizes[0])))
+        return 0
+
+    results = {}
+    print('{:<40} {:>10} {:>12} {:>14} {:>8}'.format(
+        'scenario', 'seconds', 'peak RSS KB', 'bytes written', 'files'))
+    for size in sizes:
+        for name in args.scenario or SCENARIOS:
+            runs = [run_isolated(name, size) for _ in range(args.repeat)]
+            best = min(runs, key=lambda m: m['wall_time'])
+            key = '{}[{}]'.format(name, size)
+            results[key] = best
+            print('{:<40} {:>10.3f} {:>12} {:>14} {:>8}'.format(
+                key, best['wall_time'], best['peak_rss_kb'],
+                best['bytes_written'], best['files_touched']))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
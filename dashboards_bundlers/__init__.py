@@ -16,3 +16,34 @@ def _jupyter_bundlerextension_paths():
                 'module_name': 'dashboards_bundlers.server_download',
                 'group': 'download'
             }]
+
+
+def _jupyter_server_extension_paths():
+    '''API for notebook server extension installation'''
+    return [{
+        'module': 'dashboards_bundlers'
+    }]
+
+
+def load_jupyter_server_extension(nb_app):
+    '''
+    Serves the bundler metrics at /dashboards_bundlers/metrics in the
+    Prometheus text format, and the progress of background deploy jobs at
+    /dashboards_bundlers/jobs/<id>. Removes the staging directories left
+    behind by notebook servers that died mid-bundle in the background.
+    '''
+    from notebook.utils import url_path_join
+    from .executor import run_in_executor
+    from .handlers import JobHandler, MetricsHandler
+    from .staging import get_area
+
+    run_in_executor(get_area().start)
+
+    web_app = nb_app.web_app
+    base_url = web_app.settings['base_url']
+    web_app.add_handlers('.*$', [
+        (url_path_join(base_url, '/dashboards_bundlers/metrics'),
+         MetricsHandler),
+        (url_path_join(base_url, '/dashboards_bundlers/jobs/(\\w+)'),
+         JobHandler)
+    ])
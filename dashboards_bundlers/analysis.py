@@ -0,0 +1,125 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import io
+import os
+import threading
+from collections import OrderedDict
+from .components import find_component_references
+
+# Number of parsed notebooks to keep around between requests
+CACHE_ENTRIES = 16
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# notebook.bundler.tools temporarily changes the working directory while
+# expanding file references, so bundler threads must take turns using it
+tools_lock = threading.Lock()
+
+
+class NotebookAnalysis(object):
+    '''
+    Everything the bundling stages need to know about a notebook, gathered
+    from a single parse of the notebook file.
+    '''
+    def __init__(self, abs_nb_path, notebook, stat=None):
+        '''
+        :param abs_nb_path: The path to the notebook
+        :param notebook: The parsed notebook, in the version 4 format
+        :param stat: os.stat result of the notebook when it was read
+        '''
+        self.path = abs_nb_path
+        self.notebook = notebook
+        self.stat = stat or os.stat(abs_nb_path)
+        self._reference_patterns = None
+
+    @property
+    def metadata(self):
+        '''The notebook metadata.'''
+        return self.notebook.metadata
+
+    @property
+    def uses_declarative_widgets(self):
+        '''True if any of the cells in the notebook reference declarative widgets.'''
+        # Using find instead of a regex to help future-proof changes that might
+        # be to how user's will use urth-core-import
+        # (i.e. <link is=urth-core-import> vs. <urth-core-import>)
+        return any(cell.get('source').find('urth-core-') != -1
+                   for cell in self.notebook.cells)
+
+    @property
+    def component_references(self):
+        '''
+        The set of files under urth_components imported by the notebook
+        cells, relative to urth_components.
+        '''
+        refs = set()
+        for cell in self.notebook.cells:
+            refs.update(find_component_references(cell.get('source')))
+        return refs
+
+    def get_reference_patterns(self, tools):
+        '''
+        Returns the file reference patterns found in the notebook cells in the
+        manner supported by notebook.bundler.tools.
+        '''
+        if self._reference_patterns is None:
+            patterns = []
+            for cell in self.notebook.cells:
+                patterns.extend(tools.get_cell_reference_patterns(cell) or [])
+            self._reference_patterns = patterns
+        return self._reference_patterns
+
+    def get_file_references(self, tools):
+        '''
+        Returns the set of files referenced by the notebook, relative to its
+        directory, like notebook.bundler.tools.get_file_references but without
+        reading the notebook again. Patterns are expanded against the current
+        contents of the notebook directory on every call.
+        '''
+        patterns = self.get_reference_patterns(tools)
+        if not patterns:
+            return set()
+        with tools_lock:
+            return tools.expand_references(os.path.dirname(self.path),
+                                           patterns)
+
+
+def read_notebook(abs_nb_path):
+    '''
+    Reads a notebook as version 4 without validating it against the full
+    notebook schema, which dominates the cost of reading notebooks with large
+    outputs. nbformat is imported on the first read rather than when the
+    bundlers are loaded, as it pulls in jsonschema.
+    '''
+    import nbformat
+    from nbformat import reader
+    with io.open(abs_nb_path, encoding='utf-8') as f:
+        notebook = reader.reads(f.read())
+    if notebook.nbformat != 4:
+        notebook = nbformat.convert(notebook, 4)
+    return notebook
+
+
+def analyze(abs_nb_path):
+    '''
+    Returns the NotebookAnalysis of a notebook, reusing the analysis from a
+    previous request while the notebook size and modification time are
+    unchanged.
+    '''
+    key = os.path.abspath(abs_nb_path)
+    st = os.stat(abs_nb_path)
+    with _cache_lock:
+        analysis = _cache.pop(key, None)
+        if (analysis is not None and analysis.stat.st_mtime == st.st_mtime and
+                analysis.stat.st_size == st.st_size):
+            _cache[key] = analysis
+            return analysis
+
+    analysis = NotebookAnalysis(abs_nb_path, read_notebook(abs_nb_path), st)
+    with _cache_lock:
+        _cache[key] = analysis
+        while len(_cache) > CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return analysis
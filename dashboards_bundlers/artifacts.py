@@ -0,0 +1,306 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+'''
+Content-addressed store of bundle artifacts shared by every notebook server
+pointed at it, such as all the single-user servers of a JupyterHub. Widget
+asset fragments are stored under keys derived from the contents of their
+inputs, so each one is compressed once by whichever server needs it first
+and then reused by all of them. Every user sharing the store can write to
+it, so fragments read from it are checked against the local files first.
+
+Bundle archives hold the notebooks and data files of a user, so they are
+only stored with DASHBOARD_BUNDLER_ARTIFACT_STORE_BUNDLES set, under keys
+private to the user and readable by the user alone. They are then reused by
+the other notebook servers of the same user.
+
+The store is a directory set by DASHBOARD_BUNDLER_ARTIFACT_STORE, or any
+location understood by the ArtifactStore subclass named by
+DASHBOARD_BUNDLER_ARTIFACT_BACKEND.
+'''
+
+import errno
+import getpass
+import hashlib
+import importlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from tornado.log import app_log
+
+# Seconds after which an abandoned temporary file is garbage
+_TMP_TTL = 3600
+# Garbage collect once this fraction of the size bound was written, or this
+# many seconds after the last collection, rather than on every put
+_GC_FRACTION = 0.1
+_GC_INTERVAL = 60
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store_location():
+    '''
+    Returns the location of the shared artifact store, from
+    DASHBOARD_BUNDLER_ARTIFACT_STORE, or None if it is disabled (default).
+    '''
+    return os.getenv('DASHBOARD_BUNDLER_ARTIFACT_STORE') or None
+
+
+def store_size():
+    '''
+    Returns the maximum total size in bytes of the shared artifact store,
+    from DASHBOARD_BUNDLER_ARTIFACT_STORE_SIZE (default 1 GiB).
+    '''
+    return int(os.getenv('DASHBOARD_BUNDLER_ARTIFACT_STORE_SIZE') or
+               1024 * 1024 * 1024)
+
+
+def share_bundles():
+    '''
+    True if bundle archives should be stored too, from
+    DASHBOARD_BUNDLER_ARTIFACT_STORE_BUNDLES (default: no).
+    '''
+    return os.getenv('DASHBOARD_BUNDLER_ARTIFACT_STORE_BUNDLES', '').lower() in ['yes', 'true']
+
+
+def private_key(key):
+    '''
+    Returns a key for the artifact of the given key that is private to the
+    current user, so that identical artifacts of different users are stored
+    apart.
+    '''
+    if hasattr(os, 'getuid'):
+        owner = str(os.getuid())
+    else:
+        owner = getpass.getuser()
+    return hashlib.sha256(u'{}\0{}'.format(owner, key).encode('utf-8')) \
+        .hexdigest()
+
+
+def store_backend():
+    '''
+    Returns the ArtifactStore subclass implementing the shared store, from
+    the dotted name in DASHBOARD_BUNDLER_ARTIFACT_BACKEND (default:
+    FileArtifactStore).
+    '''
+    name = os.getenv('DASHBOARD_BUNDLER_ARTIFACT_BACKEND')
+    if not name:
+        return FileArtifactStore
+    module_name, _, class_name = name.rpartition('.')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def get_store():
+    '''
+    Returns the shared artifact store for the current settings or None if
+    it is disabled.
+    '''
+    location = store_location()
+    if location is None:
+        return None
+    backend, max_size = store_backend(), store_size()
+    key = (backend, location, max_size)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = backend(location, max_size)
+        return store
+
+
+class ArtifactStore(object):
+    '''
+    Interface of shared artifact stores. Keys are hex digests of the
+    contents the artifacts were built from, so an artifact never changes
+    once stored and concurrent writers of a key write the same bytes.
+    Implementations must make artifacts visible only once complete, and keep
+    artifacts that are being read readable.
+    '''
+    def __init__(self, location, max_size):
+        '''
+        :param location: Where the artifacts are kept
+        :param max_size: Total size in bytes above which artifacts are
+            garbage collected
+        '''
+        self.location = location
+        self.max_size = max_size
+
+    def open(self, key):
+        '''
+        Returns the artifact for key opened for reading in binary mode, or
+        None if there is no such artifact.
+        '''
+        raise NotImplementedError
+
+    def put(self, key, write, private=False):
+        '''
+        Stores the artifact for key by calling write with a binary file
+        object.
+
+        :param private: Make the artifact readable by its owner only
+        '''
+        raise NotImplementedError
+
+    def gc(self):
+        '''
+        Removes the least recently used artifacts until the store fits
+        within its size bound.
+        '''
+        raise NotImplementedError
+
+    def copy_or_create(self, key, write, f, private=False, verify=None):
+        '''
+        Writes the artifact for key to the binary file object f, storing it
+        with write first if it is not in the store yet. Returns True if the
+        artifact was found in the store.
+
+        :param private: Make a stored artifact readable by its owner only
+        :param verify: Callable given a seekable binary file holding a copy
+            of the artifact read from the store, returning False if it must
+            not be used. Artifacts failing it are written with write instead.
+        '''
+        src = self.open(key)
+        found = src is not None
+        if not found:
+            self.put(key, write, private)
+            src = self.open(key)
+            if src is None:
+                # Garbage collected already: the store is too small for it
+                write(f)
+                return found
+        with src:
+            if verify is None:
+                shutil.copyfileobj(src, f)
+                return found
+            # Check a copy of our own, since the stored artifact could change
+            # while being read
+            with tempfile.TemporaryFile() as copy:
+                shutil.copyfileobj(src, copy)
+                copy.seek(0)
+                if not verify(copy):
+                    app_log.warning('Ignoring invalid artifact %s in %s', key,
+                                    self.location)
+                    write(f)
+                    return False
+                copy.seek(0)
+                shutil.copyfileobj(copy, f)
+        return found
+
+
+class FileArtifactStore(ArtifactStore):
+    '''
+    Artifact store in a directory, which can be on a filesystem shared by
+    several hosts. Artifacts are written to temporary files renamed into
+    place and made read-only, so readers only ever see complete artifacts.
+    Files that are open stay readable when they are garbage collected.
+
+    The directory must be writable by every user sharing it, like a group
+    writable directory with the setgid bit set.
+    '''
+    def __init__(self, location, max_size):
+        super(FileArtifactStore, self).__init__(location, max_size)
+        self._gc_lock = threading.Lock()
+        self._written = 0
+        self._last_gc = 0
+
+    def path(self, key):
+        '''Returns the path at which the artifact for key is stored.'''
+        return os.path.join(self.location, key[:2], key)
+
+    def open(self, key):
+        path = self.path(key)
+        try:
+            f = open(path, 'rb')
+        except IOError as ex:
+            # Missing, or the private artifact of another user
+            if ex.errno not in (errno.ENOENT, errno.EACCES):
+                raise
+            return None
+        try:
+            # Mark as recently used for garbage collection
+            os.utime(path, None)
+        except OSError:
+            # Owned by another user
+            pass
+        return f
+
+    def put(self, key, write, private=False):
+        shard = os.path.dirname(self.path(key))
+        try:
+            os.makedirs(shard)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+        else:
+            # Let the other users sharing the store add to the new shard
+            os.chmod(shard, 0o2775)
+        fd, tmp_path = tempfile.mkstemp(dir=shard, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+                size = f.tell()
+            os.chmod(tmp_path, 0o400 if private else 0o444)
+            path = self.path(key)
+            if os.name == 'nt' and os.path.exists(path):
+                # Another writer stored the same contents first
+                os.remove(tmp_path)
+            else:
+                os.rename(tmp_path, path)
+        except:
+            os.remove(tmp_path)
+            raise
+        self._maybe_gc(size)
+
+    def _maybe_gc(self, size):
+        '''
+        Garbage collects after enough bytes were written or enough time has
+        passed, since each collection walks the whole store.
+        '''
+        with self._gc_lock:
+            self._written += size
+            now = time.time()
+            if (self._written < self.max_size * _GC_FRACTION and
+                    now - self._last_gc < _GC_INTERVAL):
+                return
+            self._written = 0
+            self._last_gc = now
+        self.gc()
+
+    def gc(self):
+        entries = []
+        total = 0
+        expired = time.time() - _TMP_TTL
+        for root, dirs, filenames in os.walk(self.location):
+            for name in filenames:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if name.startswith('.tmp-'):
+                    if st.st_mtime < expired:
+                        _remove(path)
+                    continue
+                entries.append((st.st_mtime, path, st.st_size))
+                total += st.st_size
+
+        entries.sort()
+        for _, path, size in entries:
+            if total <= self.max_size:
+                break
+            if _remove(path):
+                app_log.debug('Removed %s from artifact store', path)
+            total -= size
+
+
+def _remove(path):
+    '''
+    Removes a file, returning False if it was removed already or cannot be
+    removed by this user.
+    '''
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,248 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+'''
+Bundles or deploys many notebooks at once, without a notebook server.
+
+    python -m dashboards_bundlers.batch [--output DIR] [--jobs N] PATH ...
+
+Each PATH is a notebook, a directory searched recursively for notebooks or a
+glob pattern. Without --output, every notebook is deployed to the dashboard
+servers configured by the same DASHBOARD_SERVER_* environment variables as
+the Deploy as menu item. With --output, the bundles are written to DIR
+instead, as the Download as menu item would produce them.
+
+Notebooks are processed concurrently. Widget assets are indexed and
+compressed once, then shared by every notebook that uses them.
+'''
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from os.path import join as pjoin
+import notebook.bundler.tools
+from . import staging
+from .executor import max_workers
+from .metrics import RequestMetrics
+from .server_upload import (deploy, get_dashboard_servers, make_upload_bundle,
+                            staging_estimate)
+
+
+def find_notebooks(patterns):
+    '''
+    Returns the sorted absolute paths of the notebooks matched by the given
+    notebook paths, directories and glob patterns, skipping checkpoints.
+    '''
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, filenames in os.walk(pattern):
+                dirs[:] = [d for d in dirs if d != '.ipynb_checkpoints']
+                found.update(pjoin(root, f) for f in filenames
+                             if f.endswith('.ipynb'))
+        else:
+            found.update(glob.glob(pattern))
+    return sorted(os.path.abspath(path) for path in found
+                  if path.endswith('.ipynb') and
+                  '.ipynb_checkpoints' not in path.split(os.sep))
+
+
+class Result(object):
+    '''Outcome of bundling or deploying one notebook.'''
+    def __init__(self, notebook_path):
+        self.notebook = notebook_path
+        self.ok = False
+        self.seconds = 0.0
+        self.bytes = 0
+        self.link = None
+        self.error = None
+        self.unchanged = False
+        # Outcome of the upload to each dashboard server
+        self.targets = []
+
+    def to_dict(self):
+        return dict(notebook=self.notebook, ok=self.ok, seconds=self.seconds,
+                    bytes=self.bytes, link=self.link, error=self.error,
+                    unchanged=self.unchanged, targets=self.targets)
+
+
+def process_notebook(abs_nb_path, output_dir=None, protocol='http',
+                     hostname='localhost', port='', force=False):
+    '''
+    Bundles a notebook into output_dir, or deploys it to the dashboard server
+    if output_dir is None. Returns a Result rather than raising.
+
+    Like the Deploy as menu item, deploys of unchanged notebooks are skipped
+    when DASHBOARD_SERVER_SKIP_UNCHANGED is set, unless forced.
+
+    :param abs_nb_path: The path to the notebook
+    :param output_dir: Directory in which to write the bundle
+    :param protocol: Protocol interpolated into DASHBOARD_SERVER_URL
+    :param hostname: Hostname interpolated into DASHBOARD_SERVER_URL
+    :param port: Port interpolated into DASHBOARD_SERVER_URL
+    :param force: Deploy even if unchanged since the last deploy
+    '''
+    result = Result(abs_nb_path)
+    metrics = RequestMetrics('batch', abs_nb_path)
+    start = time.time()
+    try:
+        if output_dir is None:
+            deployed = deploy(abs_nb_path, notebook.bundler.tools,
+                              get_dashboard_servers(protocol, hostname, port),
+                              protocol, hostname, port, force, metrics)
+            result.link = deployed.link
+            result.unchanged = deployed.unchanged
+            result.bytes = deployed.bytes
+            result.targets = [str(target) for target in deployed.targets]
+        else:
+            result.link, result.bytes = write_bundle(abs_nb_path, output_dir,
+                                                     metrics)
+        result.ok = True
+        metrics.done('unchanged' if result.unchanged else 'success')
+    except Exception as ex:
+        result.error = str(ex) or ex.__class__.__name__
+        metrics.done('error')
+    finally:
+        result.seconds = time.time() - start
+    return result
+
+
+def write_bundle(abs_nb_path, output_dir, metrics):
+    '''
+    Bundles a notebook into output_dir as the Download as menu item would.
+    Returns the path and size of the bundle.
+    '''
+    notebook_name = os.path.splitext(os.path.basename(abs_nb_path))[0]
+    area = staging.get_area()
+    tmp_dir = None
+    try:
+        with metrics.stage('queue'):
+            tmp_dir = area.acquire(staging_estimate(
+                abs_nb_path, notebook.bundler.tools, area)).result()
+        bundled = make_upload_bundle(abs_nb_path, pjoin(tmp_dir, notebook_name),
+                                     notebook.bundler.tools, metrics=metrics)
+        dest = pjoin(output_dir, notebook_name + os.path.splitext(bundled)[1])
+        shutil.copyfile(bundled, dest)
+        return dest, os.path.getsize(dest)
+    finally:
+        if tmp_dir is not None:
+            area.release(tmp_dir)
+
+
+def run(notebook_paths, output_dir=None, jobs=None, on_result=None, **kwargs):
+    '''
+    Processes the given notebooks with at most jobs at a time. Returns the
+    list of Results in the order of notebook_paths.
+
+    :param notebook_paths: Absolute paths of the notebooks
+    :param output_dir: Directory in which to write bundles instead of
+        deploying them
+    :param jobs: Number of notebooks to process concurrently (default:
+        DASHBOARD_BUNDLER_MAX_WORKERS)
+    :param on_result: Callable invoked with each Result as it completes
+    :param kwargs: Passed to process_notebook
+    '''
+    # Notebooks are deployed under their file name, so two notebooks with the
+    # same name would overwrite each other
+    names = {}
+    results = [None] * len(notebook_paths)
+    todo = []
+    for i, path in enumerate(notebook_paths):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name in names:
+            result = results[i] = Result(path)
+            result.error = 'Same dashboard name as {}'.format(names[name])
+            if on_result:
+                on_result(result)
+        else:
+            names[name] = path
+            todo.append(i)
+
+    if output_dir is not None and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    pool = ThreadPoolExecutor(max_workers=jobs or max_workers())
+    try:
+        futures = dict((pool.submit(process_notebook, notebook_paths[i],
+                                    output_dir, **kwargs), i) for i in todo)
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            if on_result:
+                on_result(results[i])
+    finally:
+        pool.shutdown()
+    return results
+
+
+def summarize(results, seconds):
+    '''Returns aggregate counts and throughput of a batch run.'''
+    succeeded = [r for r in results if r.ok]
+    total_bytes = sum(r.bytes for r in succeeded)
+    return dict(notebooks=len(results), succeeded=len(succeeded),
+                failed=len(results) - len(succeeded), bytes=total_bytes,
+                seconds=seconds,
+                notebooks_per_second=len(succeeded) / seconds if seconds else 0.0,
+                bytes_per_second=total_bytes / seconds if seconds else 0.0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m dashboards_bundlers.batch',
+        description='Bundle or deploy notebooks as Jupyter dashboards.')
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help='notebook, directory or glob pattern')
+    parser.add_argument('--output', metavar='DIR',
+                        help='write bundles to DIR instead of deploying them')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='notebooks to process concurrently')
+    parser.add_argument('--protocol', default='http',
+                        help='{protocol} in DASHBOARD_SERVER_URL')
+    parser.add_argument('--hostname', default='localhost',
+                        help='{hostname} in DASHBOARD_SERVER_URL')
+    parser.add_argument('--port', default='',
+                        help='{port} in DASHBOARD_SERVER_URL')
+    parser.add_argument('--force', action='store_true',
+                        help='redeploy notebooks that have not changed')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON lines')
+    args = parser.parse_args(argv)
+
+    notebook_paths = find_notebooks(args.paths)
+    if not notebook_paths:
+        parser.error('no notebooks found')
+
+    def report(result):
+        if args.json:
+            print(json.dumps(result.to_dict()))
+        elif result.unchanged:
+            print('same   {:8.3f}s {:>12s} {} -> {}'.format(
+                result.seconds, '', result.notebook, result.link))
+        elif result.ok:
+            print('ok     {:8.3f}s {:>12d} {} -> {}'.format(
+                result.seconds, result.bytes, result.notebook, result.link))
+        else:
+            print('FAILED {:8.3f}s {:>12s} {}: {}'.format(
+                result.seconds, '', result.notebook, result.error))
+        sys.stdout.flush()
+
+    start = time.time()
+    results = run(notebook_paths, args.output, args.jobs, report,
+                  protocol=args.protocol, hostname=args.hostname,
+                  port=args.port, force=args.force)
+    summary = summarize(results, time.time() - start)
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print('{succeeded}/{notebooks} notebooks in {seconds:.3f}s '
+              '({notebooks_per_second:.2f} notebooks/s, '
+              '{bytes_per_second:.0f} bytes/s)'.format(**summary))
+    return 0 if not summary['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,266 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import errno
+import os
+import tempfile
+import threading
+import time
+from tornado.log import app_log
+
+# Seconds after which an abandoned temporary file is garbage
+_TMP_TTL = 3600
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as ex:
+        if ex.errno != errno.EEXIST:
+            raise
+
+
+def get_cache(root, max_size):
+    '''
+    Returns the DiskCache of the given directory and size bound shared by
+    the bundler threads, or None if max_size disables it.
+    '''
+    if max_size <= 0:
+        return None
+    with _caches_lock:
+        cache = _caches.get((root, max_size))
+        if cache is None:
+            cache = _caches[(root, max_size)] = DiskCache(root, max_size)
+        return cache
+
+
+def _open_unlinked(path):
+    '''
+    Opens a file for reading and removes it, so that it disappears once
+    closed.
+    '''
+    if os.name == 'nt':
+        # Open files cannot be removed on Windows, so delete it on close
+        return os.fdopen(os.open(path, os.O_RDONLY | os.O_BINARY |
+                                 os.O_TEMPORARY), 'rb')
+    f = open(path, 'rb')
+    os.remove(path)
+    return f
+
+
+class DiskCache(object):
+    '''
+    Directory of files keyed by content-derived strings, evicted least
+    recently used first once their total size exceeds a bound.
+
+    Entries are written to a temporary file and renamed into place, so
+    readers only ever see complete entries. Entries larger than the bound
+    are never kept. Entries are handed out as open files, which stay
+    readable when the entry is evicted meanwhile. Recency is tracked with file
+    modification times, which makes the ordering survive restarts and be
+    shared with other processes using the same directory.
+    '''
+    def __init__(self, root, max_size):
+        '''
+        :param root: Directory holding the cache entries, created as needed
+        :param max_size: Total size in bytes above which entries are evicted
+        '''
+        self.root = root
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def path(self, key):
+        '''Returns the path at which the entry for key is stored.'''
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        '''
+        Returns the path of the entry for key, marking it as recently used,
+        or None if there is no such entry.
+        '''
+        path = self.path(key)
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def open(self, key):
+        '''
+        Returns the entry for key opened for reading in binary mode, marking
+        it as recently used, or None if there is no such entry.
+        '''
+        path = self.path(key)
+        try:
+            f = open(path, 'rb')
+        except IOError as ex:
+            if ex.errno != errno.ENOENT:
+                raise
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            # Evicted meanwhile, but still readable
+            pass
+        return f
+
+    def create(self, key):
+        '''
+        Returns a CacheWriter for a new entry for key, which only appears in
+        the cache once committed.
+        '''
+        return CacheWriter(self, key)
+
+    def put(self, key, write):
+        '''
+        Creates the entry for key by calling write with a binary file object.
+        Returns the path of the new entry, or None if it is larger than the
+        cache and was not kept.
+        '''
+        writer = self.create(key)
+        try:
+            write(writer.file)
+        except:
+            writer.discard()
+            raise
+        return writer.commit()
+
+    def open_or_create(self, key, write):
+        '''
+        Returns the entry for key opened for reading in binary mode, creating
+        it with write first if needed. Concurrent callers in this process
+        asking for the same key wait for a single writer instead of each
+        building the entry. An entry too large to be kept is still returned,
+        and removed once closed.
+        '''
+        with self._lock:
+            # [lock, number of callers using it]
+            key_lock = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                f = self.open(key)
+                if f is None:
+                    writer = self.create(key)
+                    try:
+                        write(writer.file)
+                    except:
+                        writer.discard()
+                        raise
+                    f = writer.commit_and_open()
+                return f
+        finally:
+            with self._lock:
+                key_lock[1] -= 1
+                if not key_lock[1]:
+                    del self._key_locks[key]
+
+    def evict(self, keep=None):
+        '''
+        Removes the least recently used entries until the cache fits within
+        its size bound, and abandoned temporary files. Never removes the
+        entry for keep.
+        '''
+        entries = []
+        total = 0
+        expired = time.time() - _TMP_TTL
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if name.startswith('.tmp-'):
+                if st.st_mtime < expired:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                continue
+            entries.append((st.st_mtime, name, st.st_size))
+            total += st.st_size
+
+        entries.sort()
+        for _, name, size in entries:
+            if total <= self.max_size:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
+                # Already evicted by another process
+                pass
+            else:
+                app_log.debug('Evicted %s from bundler cache', name)
+            total -= size
+
+
+class CacheWriter(object):
+    '''
+    A DiskCache entry being written to file, a binary file object. Call
+    commit once it is complete, or discard to abandon it.
+    '''
+    def __init__(self, cache, key):
+        _makedirs(cache.root)
+        self.cache = cache
+        self.key = key
+        fd, self.tmp_path = tempfile.mkstemp(dir=cache.root, prefix='.tmp-')
+        self.file = os.fdopen(fd, 'wb')
+
+    def discard(self):
+        '''Removes the incomplete entry.'''
+        self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+    def _fits(self):
+        size = self.file.tell()
+        self.file.close()
+        if size > self.cache.max_size:
+            app_log.debug('Not caching %s: %d bytes exceed the cache size',
+                          self.key, size)
+            return False
+        return True
+
+    def _place(self):
+        path = self.cache.path(self.key)
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(self.tmp_path, path)
+        self.cache.evict(keep=self.key)
+        return path
+
+    def commit(self):
+        '''
+        Adds the complete entry to the cache. Returns its path, or None if it
+        is larger than the cache and was removed instead.
+        '''
+        if not self._fits():
+            os.remove(self.tmp_path)
+            return None
+        return self._place()
+
+    def commit_and_open(self):
+        '''
+        Adds the complete entry to the cache unless it is larger than the
+        cache, and returns it opened for reading in binary mode either way.
+        '''
+        if not self._fits():
+            return _open_unlinked(self.tmp_path)
+        if os.name == 'nt':
+            # Open files cannot be renamed on Windows
+            return open(self._place(), 'rb')
+        f = open(self.tmp_path, 'rb')
+        try:
+            self._place()
+        except:
+            f.close()
+            raise
+        return f
@@ -0,0 +1,143 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+'''
+Determines which bower packages under urth_components a dashboard needs.
+
+The notebook cells import elements with <link rel="import"> or
+urth-core-import references to urth_components/<package>/<file>. Starting
+from those and from the components referenced by the declarative widgets
+JavaScript, every HTML import, script and stylesheet reference is followed
+through the components tree. Whole packages are kept rather than single
+files because elements load images, fonts and data relative to themselves
+at runtime.
+'''
+
+import io
+import os
+import posixpath
+import re
+import threading
+from os.path import join as pjoin
+
+# Attribute values referencing another file from HTML or CSS
+_HTML_REF_RE = re.compile(r'''(?:href|src)\s*=\s*["']([^"'#?]+)''', re.I)
+_CSS_REF_RE = re.compile(r'''(?:@import\s+|url\()\s*["']?([^"')#?\s]+)''',
+                         re.I)
+# References to components from anywhere: cells, scripts
+_COMPONENT_REF_RE = re.compile(r'''urth_components/([^"'\s)#?<>]+)''')
+
+_FOLLOWED_EXTENSIONS = ('.html', '.htm', '.css')
+
+_refs = {}
+_widgets_refs = {}
+_refs_lock = threading.Lock()
+
+
+def prune_enabled():
+    return os.getenv('DASHBOARD_BUNDLER_PRUNE_COMPONENTS', '').lower() in ['yes', 'true']
+
+
+def find_component_references(text):
+    '''
+    Returns the set of paths, relative to urth_components, referenced by the
+    given notebook cell source or script.
+    '''
+    return set(posixpath.normpath(ref)
+               for ref in _COMPONENT_REF_RE.findall(text))
+
+
+def _file_references(path):
+    '''
+    Returns the references of an HTML or CSS file as paths relative to its
+    directory, or absolute URLs. Remembered per file size and modification
+    time.
+    '''
+    st = os.stat(path)
+    with _refs_lock:
+        cached = _refs.get(path)
+    if cached is not None and cached[0] == (st.st_size, st.st_mtime):
+        return cached[1]
+    with io.open(path, encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    pattern = _CSS_REF_RE if path.endswith('.css') else _HTML_REF_RE
+    refs = pattern.findall(text)
+    if not path.endswith('.css'):
+        # Inline <style> blocks
+        refs.extend(_CSS_REF_RE.findall(text))
+    with _refs_lock:
+        _refs[path] = ((st.st_size, st.st_mtime), refs)
+    return refs
+
+
+def _is_external(ref):
+    return ref.startswith(('/', 'data:', 'javascript:')) or '://' in ref
+
+
+def required_packages(components_dir, roots, optional_roots=()):
+    '''
+    Returns the names of the packages under components_dir reachable from
+    the given root paths, or None if a root cannot be found in the tree, in
+    which case the whole tree should be bundled.
+
+    :param components_dir: The urth_components or bower_components directory
+    :param roots: Paths relative to components_dir of the files the dashboard
+        imports directly
+    :param optional_roots: Like roots, but skipped if not found
+    '''
+    packages = set()
+    seen = set()
+    pending = []
+    for root, required in ([(r, True) for r in roots] +
+                           [(r, False) for r in optional_roots]):
+        path = os.path.normpath(pjoin(components_dir, root))
+        if os.path.isfile(path):
+            pending.append(path)
+        elif os.path.isdir(path) and root.split('/')[0] not in ('', '.', '..'):
+            # A whole package
+            packages.add(root.split('/')[0])
+        elif required:
+            return None
+
+    while pending:
+        path = pending.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        rel = os.path.relpath(path, components_dir)
+        if rel.startswith(os.pardir):
+            # Outside of the components tree
+            continue
+        package = rel.split(os.sep)[0]
+        if os.path.isdir(pjoin(components_dir, package)):
+            packages.add(package)
+        if not path.endswith(_FOLLOWED_EXTENSIONS):
+            continue
+        for ref in _file_references(path):
+            if _is_external(ref):
+                continue
+            ref_path = os.path.normpath(pjoin(os.path.dirname(path), ref))
+            if os.path.isfile(ref_path):
+                pending.append(ref_path)
+    return packages
+
+
+def widgets_references(index):
+    '''
+    Returns the set of paths, relative to urth_components, referenced by the
+    declarative widgets JavaScript and HTML.
+
+    :param index: paths.AssetIndex of the declarative widgets js directory
+    '''
+    with _refs_lock:
+        refs = _widgets_refs.get(index.digest)
+    if refs is not None:
+        return refs
+    refs = set()
+    for _, path in index.files:
+        if path.endswith(('.js', '.html')):
+            with io.open(path, encoding='utf-8', errors='replace') as f:
+                refs.update(find_component_references(f.read()))
+    with _refs_lock:
+        _widgets_refs.clear()
+        _widgets_refs[index.digest] = refs
+    return refs
@@ -0,0 +1,141 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+'''
+Delta deploys send a dashboard server only the bundle files it does not
+already have. The protocol, spoken in addition to the plain upload POST, is:
+
+1. POST /_api/blobs/missing with a JSON body {"hashes": [sha256, ...]} listing
+   the content hashes of every file in the bundle. The server responds with
+   {"missing": [sha256, ...]} naming the hashes it has no blob for.
+2. PUT /_api/blobs/<sha256> with the raw file contents for each missing hash.
+3. POST /_api/notebooks/<name>/manifest with a JSON body
+   {"files": {"<path in bundle>": sha256, ...}}. The server assembles the
+   dashboard from its blobs and responds as it would to a plain upload.
+
+Servers that answer step 1 with 404, 405 or 501 do not support the protocol
+and receive the full bundle instead.
+'''
+
+import hashlib
+import os
+import zipfile
+from tornado import escape
+from tornado.log import app_log
+from . import sessions
+
+BLOBS_MISSING_ENDPOINT = '/_api/blobs/missing'
+BLOB_ENDPOINT = '/_api/blobs/'
+MANIFEST_ENDPOINT = '/_api/notebooks/{}/manifest'
+
+# Status codes meaning the dashboard server does not speak the protocol
+UNSUPPORTED_STATUS = (404, 405, 501)
+
+_HASH_CHUNK_SIZE = 64 * 1024
+
+
+def delta_upload_enabled():
+    return os.getenv('DASHBOARD_SERVER_DELTA_UPLOAD', '').lower() in ['yes', 'true']
+
+
+def _hash_stream(f):
+    h = hashlib.sha256()
+    while True:
+        chunk = f.read(_HASH_CHUNK_SIZE)
+        if not chunk:
+            break
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def build_manifest(bundle_path):
+    '''
+    Returns a dict mapping the path of every file in a bundle to the SHA-256
+    of its contents. The bundle is either a zip file or a lone notebook, which
+    is listed as index.ipynb.
+    '''
+    if not zipfile.is_zipfile(bundle_path):
+        with open(bundle_path, 'rb') as f:
+            return {'index.ipynb': _hash_stream(f)}
+    manifest = {}
+    with zipfile.ZipFile(bundle_path) as zf:
+        for info in zf.infolist():
+            if info.filename.endswith('/'):
+                continue
+            with zf.open(info) as f:
+                manifest[info.filename] = _hash_stream(f)
+    return manifest
+
+
+def _open_blob(bundle_path, zf, arcname):
+    '''Returns (file object, size) for a file in the bundle.'''
+    if zf is None:
+        return open(bundle_path, 'rb'), os.path.getsize(bundle_path)
+    info = zf.getinfo(arcname)
+    return zf.open(info), info.file_size
+
+
+def upload(dashboard_server, dashboard_name, bundle_path, headers, verify,
+           timeout=60, stats=None):
+    '''
+    Deploys a bundle using the delta protocol. Blocks until done, so call it
+    from the bundler thread pool. Returns the response to the manifest POST,
+    the response to the first failed request, or None if the dashboard server
+    does not support delta deploys.
+
+    :param dashboard_server: Root URL of the dashboard server
+    :param dashboard_name: The dashboard name under which it should be made
+        available
+    :param bundle_path: The path of the zip or notebook file to deploy
+    :param headers: Extra HTTP headers to send with every request
+    :param verify: Whether to verify the server SSL certificate
+    :param stats: Optional dict in which to count the blob bytes sent as
+        bytes_sent
+    '''
+    from notebook.utils import url_path_join
+    stats = stats if stats is not None else {}
+    stats['bytes_sent'] = 0
+    manifest = build_manifest(bundle_path)
+    hashes = sorted(set(manifest.values()))
+    session = sessions.get_session(dashboard_server, verify)
+
+    result = session.post(url_path_join(dashboard_server,
+                                         BLOBS_MISSING_ENDPOINT),
+                          json={'hashes': hashes}, headers=headers,
+                          timeout=timeout, verify=verify)
+    if result.status_code in UNSUPPORTED_STATUS:
+        app_log.debug('Dashboard server does not support delta uploads')
+        return None
+    if result.status_code >= 400:
+        return result
+    missing = set(result.json().get('missing', []))
+    app_log.debug('Dashboard server is missing %d of %d bundle files',
+                  len(missing), len(hashes))
+
+    zf = zipfile.ZipFile(bundle_path) if zipfile.is_zipfile(bundle_path) else None
+    try:
+        for arcname in sorted(manifest):
+            sha = manifest[arcname]
+            if sha not in missing:
+                continue
+            # Identical files share a blob, so only send each one once
+            missing.discard(sha)
+            blob, size = _open_blob(bundle_path, zf, arcname)
+            with blob:
+                blob_headers = dict(headers)
+                blob_headers['Content-Type'] = 'application/octet-stream'
+                blob_headers['Content-Length'] = str(size)
+                result = session.put(url_path_join(dashboard_server,
+                                                   BLOB_ENDPOINT, sha),
+                                     data=blob, headers=blob_headers,
+                                     timeout=timeout, verify=verify)
+            if result.status_code >= 400:
+                return result
+            stats['bytes_sent'] += size
+    finally:
+        if zf is not None:
+            zf.close()
+
+    manifest_url = url_path_join(dashboard_server, MANIFEST_ENDPOINT.format(
+        escape.url_escape(dashboard_name, False)))
+    return session.post(manifest_url, json={'files': manifest},
+                        headers=headers, timeout=timeout, verify=verify)
@@ -0,0 +1,70 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = None
+_compression_executor = None
+_executor_lock = threading.Lock()
+
+
+def max_workers():
+    '''
+    Returns the maximum number of threads used for blocking bundler work,
+    from DASHBOARD_BUNDLER_MAX_WORKERS (default 4).
+    '''
+    return int(os.getenv('DASHBOARD_BUNDLER_MAX_WORKERS') or 4)
+
+
+def compression_threads():
+    '''
+    Returns the number of threads used to compress archive entries
+    concurrently, from DASHBOARD_BUNDLER_COMPRESSION_THREADS (default: the
+    number of CPUs, at most 4).
+    '''
+    threads = os.getenv('DASHBOARD_BUNDLER_COMPRESSION_THREADS')
+    if threads:
+        return int(threads)
+    try:
+        return min(multiprocessing.cpu_count(), 4)
+    except NotImplementedError:
+        return 1
+
+
+def get_executor():
+    '''
+    Returns the bounded thread pool shared by all bundler requests in this
+    process, creating it on first use.
+    '''
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers())
+        return _executor
+
+
+def get_compression_executor():
+    '''
+    Returns the thread pool on which archive entries are compressed, or None
+    if compression should happen serially. It is separate from the bundler
+    pool because bundler tasks wait on compression tasks.
+    '''
+    global _compression_executor
+    threads = compression_threads()
+    if threads <= 1:
+        return None
+    with _executor_lock:
+        if _compression_executor is None:
+            _compression_executor = ThreadPoolExecutor(max_workers=threads)
+        return _compression_executor
+
+
+def run_in_executor(fn, *args, **kwargs):
+    '''
+    Runs fn(*args, **kwargs) on the bundler thread pool. Returns a future
+    that Tornado coroutines can yield without blocking the IOLoop.
+    '''
+    return get_executor().submit(fn, *args, **kwargs)
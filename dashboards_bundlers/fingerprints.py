@@ -0,0 +1,132 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+'''
+Fingerprints of the inputs of a bundle, used to skip redeploying dashboards
+that have not changed since their last successful deploy.
+'''
+
+import errno
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from os.path import join as pjoin
+from tornado import escape
+from . import paths
+
+# Bump whenever the bundle layout changes so that old deploys are redone
+_FINGERPRINT_VERSION = '1'
+
+_HASH_CHUNK_SIZE = 64 * 1024
+
+
+def skip_unchanged_enabled():
+    return os.getenv('DASHBOARD_SERVER_SKIP_UNCHANGED', '').lower() in ['yes', 'true']
+
+
+def state_dir():
+    '''
+    Returns the directory holding the fingerprint of the last deploy of each
+    dashboard, from DASHBOARD_BUNDLER_STATE_DIR or under the Jupyter data
+    directory.
+    '''
+    from jupyter_core.paths import jupyter_data_dir
+    return (os.getenv('DASHBOARD_BUNDLER_STATE_DIR') or
+            pjoin(jupyter_data_dir(), 'dashboards_bundlers', 'deploys'))
+
+
+def _hash_file(h, path):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+
+
+def compute(analysis, referenced_files, widgets_dirs, target=''):
+    '''
+    Returns a hex digest identifying everything that goes into the bundle of
+    a notebook: the notebook content, the names, sizes and modification times
+    of the files it references, the widget assets and the deploy target.
+
+    :param analysis: NotebookAnalysis of the notebook
+    :param referenced_files: Paths of the files referenced by the notebook,
+        relative to its directory
+    :param widgets_dirs: (source directory, output directory) pairs of the
+        widget assets bundled with the notebook
+    :param target: URL to which the bundle is deployed
+    '''
+    h = hashlib.sha256(u'{}\0{}\n'.format(_FINGERPRINT_VERSION,
+                                            target).encode('utf-8'))
+    _hash_file(h, analysis.path)
+    notebook_dir = os.path.dirname(analysis.path)
+    for filename in sorted(referenced_files):
+        try:
+            st = os.stat(pjoin(notebook_dir, filename))
+        except OSError:
+            continue
+        h.update(u'\0{}\0{}\0{!r}'.format(filename, st.st_size,
+                                          st.st_mtime).encode('utf-8'))
+    for src_dir, dest_dir in widgets_dirs:
+        h.update(u'\0{}\0{}'.format(
+            dest_dir, paths.get_index(src_dir, dest_dir).digest).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _state_path(dashboard_name):
+    return pjoin(state_dir(), escape.url_escape(dashboard_name, False) + '.json')
+
+
+def lookup(dashboard_name, fingerprint):
+    '''
+    Returns the link to the dashboard if it was last deployed with the given
+    fingerprint, None otherwise.
+    '''
+    try:
+        with io.open(_state_path(dashboard_name), encoding='utf-8') as f:
+            state = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if state.get('fingerprint') == fingerprint:
+        return state.get('link')
+
+
+def record(dashboard_name, fingerprint, link):
+    '''
+    Remembers a successful deploy of a dashboard.
+
+    :param dashboard_name: The dashboard name under which it was deployed
+    :param fingerprint: The fingerprint of the bundle deployed
+    :param link: URL of the deployed dashboard
+    '''
+    root = state_dir()
+    try:
+        os.makedirs(root)
+    except OSError as ex:
+        if ex.errno != errno.EEXIST:
+            raise
+    fd, tmp_path = tempfile.mkstemp(dir=root, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'fingerprint': fingerprint, 'link': link,
+                       'time': time.time()}, f)
+        path = _state_path(dashboard_name)
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def forget(dashboard_name):
+    '''Forgets the last deploy of a dashboard.'''
+    try:
+        os.remove(_state_path(dashboard_name))
+    except OSError as ex:
+        if ex.errno != errno.ENOENT:
+            raise
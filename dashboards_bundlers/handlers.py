@@ -0,0 +1,30 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+'''
+Notebook server handlers registered by load_jupyter_server_extension. They
+live apart from the bundlers so that importing a bundler does not load the
+notebook server handler machinery.
+'''
+
+from notebook.base.handlers import IPythonHandler
+from tornado import web
+from . import jobs, metrics
+
+
+class MetricsHandler(IPythonHandler):
+    '''Serves the bundler metrics to authenticated notebook users.'''
+    @web.authenticated
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.finish(metrics.render())
+
+
+class JobHandler(IPythonHandler):
+    '''Serves the progress of deploy jobs to authenticated notebook users.'''
+    @web.authenticated
+    def get(self, job_id):
+        job = jobs.get_job(job_id)
+        if job is None:
+            raise web.HTTPError(404, 'Unknown deploy job %s', job_id)
+        self.set_header('Cache-Control', 'no-cache')
+        self.finish(job.to_dict())
@@ -0,0 +1,238 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+'''
+Background deploy jobs. With DASHBOARD_BUNDLER_BACKGROUND_JOBS set, the
+Deploy as menu item queues the build and upload of the dashboard on a
+bounded pool of worker threads and answers at once with a page that polls
+the progress of the job, then redirects to the dashboard once it is
+deployed. Requests to deploy a notebook that is already queued or being
+deployed to the same servers join the existing job.
+
+Job progress is served as JSON at /dashboards_bundlers/jobs/<id> by
+handlers.JobHandler:
+
+    {"id": ..., "notebook": ..., "state": "queued" | "running" | "done" |
+     "failed", "stage": ..., "bytes": ..., "link": ..., "error": ...}
+'''
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from tornado import escape, web
+from tornado.log import app_log
+from .metrics import RequestMetrics
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Seconds for which finished jobs can still be polled
+FINISHED_TTL = 3600
+
+_jobs = {}
+# Unfinished jobs by coalescing key
+_active = {}
+_lock = threading.Lock()
+_executor = None
+
+
+def background_enabled():
+    return os.getenv('DASHBOARD_BUNDLER_BACKGROUND_JOBS', '').lower() in ['yes', 'true']
+
+
+def job_workers():
+    '''
+    Returns the number of deploy jobs run at once, from
+    DASHBOARD_BUNDLER_JOB_WORKERS (default 2).
+    '''
+    return int(os.getenv('DASHBOARD_BUNDLER_JOB_WORKERS') or 2)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=job_workers())
+        return _executor
+
+
+class Job(object):
+    '''A queued deploy of a notebook and its progress.'''
+    def __init__(self, abs_nb_path, notebook_path, key, force=False):
+        self.id = uuid.uuid4().hex
+        self.abs_nb_path = abs_nb_path
+        self.notebook = notebook_path
+        self.key = key
+        self.force = force
+        self.state = QUEUED
+        self.stage = None
+        self.bytes = 0
+        self.link = None
+        self.error = None
+        self.status_code = None
+        self.created = time.time()
+        self.finished = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        '''Blocks until the job finishes. Returns True if it did.'''
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        return dict(id=self.id, notebook=self.notebook, state=self.state,
+                    stage=self.stage, bytes=self.bytes, link=self.link,
+                    error=self.error, created=self.created,
+                    finished=self.finished)
+
+
+class JobMetrics(RequestMetrics):
+    '''RequestMetrics that also report the progress of a Job.'''
+    def __init__(self, job):
+        super(JobMetrics, self).__init__('server_upload', job.notebook)
+        self.job = job
+
+    @contextmanager
+    def stage(self, name):
+        self.job.stage = name
+        with super(JobMetrics, self).stage(name) as stage:
+            yield stage
+        self.job.bytes += (stage.bytes_read or 0) + (stage.bytes_written or 0)
+
+
+def _prune():
+    '''Forgets jobs that finished more than FINISHED_TTL seconds ago.'''
+    expired = time.time() - FINISHED_TTL
+    for job_id in [job_id for job_id, job in _jobs.items()
+                   if job.finished is not None and job.finished < expired]:
+        del _jobs[job_id]
+
+
+def get_job(job_id):
+    '''Returns the job with the given id, or None if unknown or expired.'''
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def submit(abs_nb_path, notebook_path, tools, protocol, hostname, port,
+           force=False):
+    '''
+    Queues the deploy of a notebook, or returns the queued or running job
+    deploying the same notebook to the same dashboard servers. A forced
+    deploy only joins a job that is forced too. Returns the Job.
+
+    :param abs_nb_path: The path to the notebook
+    :param notebook_path: The path of the notebook in the contents manager
+    :param tools: The notebook.bundler.tools module
+    :param protocol: Protocol interpolated into the dashboard server URLs
+    :param hostname: Hostname interpolated into the dashboard server URLs
+    :param port: Port interpolated into the dashboard server URLs
+    :param force: Deploy even if unchanged since the last deploy
+    '''
+    from .server_upload import deploy_target, get_dashboard_servers
+    dashboard_servers = get_dashboard_servers(protocol, hostname, port)
+    if not dashboard_servers:
+        raise web.HTTPError(500, log_message='No dashboard server configured')
+    key = (os.path.abspath(abs_nb_path), deploy_target(dashboard_servers))
+    with _lock:
+        _prune()
+        job = _active.get(key)
+        if job is not None and (job.force or not force):
+            app_log.info('Joining deploy job %s of %s', job.id, notebook_path)
+            return job
+        job = Job(abs_nb_path, notebook_path, key, force)
+        _jobs[job.id] = job
+        _active[key] = job
+    _get_executor().submit(_run, job, tools, dashboard_servers, protocol,
+                           hostname, port, force)
+    return job
+
+
+def _run(job, tools, dashboard_servers, protocol, hostname, port, force):
+    from .server_upload import deploy
+    job.state = RUNNING
+    metrics = JobMetrics(job)
+    try:
+        result = deploy(job.abs_nb_path, tools, dashboard_servers, protocol,
+                        hostname, port, force, metrics)
+        job.link = result.link
+        job.state = DONE
+        metrics.done('unchanged' if result.unchanged else 'success')
+    except Exception as ex:
+        if isinstance(ex, web.HTTPError):
+            job.status_code = ex.status_code
+            job.error = (ex.log_message % ex.args if ex.log_message
+                         else str(ex))
+        else:
+            job.status_code = 500
+            job.error = str(ex) or ex.__class__.__name__
+        app_log.error('Deploy job %s of %s failed: %s', job.id, job.notebook,
+                      job.error, exc_info=True)
+        job.state = FAILED
+        metrics.done('error')
+    finally:
+        job.finished = time.time()
+        with _lock:
+            if _active.get(job.key) is job:
+                del _active[job.key]
+        job._done.set()
+
+
+def status_url(base_url, job):
+    '''Returns the URL at which the progress of a job is served.'''
+    from notebook.utils import url_path_join
+    return url_path_join(base_url, '/dashboards_bundlers/jobs', job.id)
+
+
+_PROGRESS_PAGE = u'''<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Deploying {name}</title></head>
+<body>
+<p id="status">Deploying {name}&hellip;</p>
+<script>
+(function() {{
+    var url = {url};
+    var name = {js_name};
+    var status = document.getElementById('status');
+    function poll() {{
+        var xhr = new XMLHttpRequest();
+        xhr.open('GET', url);
+        xhr.onload = function() {{
+            if (xhr.status !== 200) {{
+                status.textContent = 'Deploy status unavailable (HTTP ' + xhr.status + ')';
+                return;
+            }}
+            var job = JSON.parse(xhr.responseText);
+            if (job.state === 'done') {{
+                window.location.replace(job.link);
+            }} else if (job.state === 'failed') {{
+                status.textContent = 'Deploy failed: ' + job.error;
+            }} else {{
+                status.textContent = 'Deploying ' + name + ': ' + job.state +
+                    (job.stage ? ', ' + job.stage : '') + ', ' + job.bytes + ' bytes';
+                setTimeout(poll, 1000);
+            }}
+        }};
+        xhr.onerror = function() {{ setTimeout(poll, 1000); }};
+        xhr.send();
+    }}
+    poll();
+}})();
+</script>
+</body>
+</html>
+'''
+
+
+def progress_page(name, url):
+    '''
+    Returns an HTML page that shows the progress of the job polled at url,
+    then redirects to the dashboard once it is deployed.
+    '''
+    return _PROGRESS_PAGE.format(
+        name=escape.xhtml_escape(name),
+        js_name=escape.json_encode(name).replace('</', '<\\/'),
+        url=escape.json_encode(url).replace('</', '<\\/'))
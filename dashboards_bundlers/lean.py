@@ -0,0 +1,177 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+'''
+Lean bundles carry a rewritten copy of the notebook without the stored cell
+outputs that the dashboard server recomputes when it runs the notebook
+anyway.
+
+In clear mode, every code cell output and execution count is removed. In
+externalize mode, display outputs larger than a threshold are moved out of
+the notebook into files named after the hash of their content under
+outputs/ in the bundle, so that the same plot shown twice is stored once.
+Each output records where its data went in its metadata, as
+{"dashboards_bundlers": {"externalized": {mime type: path in bundle}}}.
+Saved widget state is dropped in both modes.
+'''
+
+import base64
+import copy
+import errno
+import hashlib
+import json
+import os
+from os.path import join as pjoin
+
+CLEAR = 'clear'
+EXTERNALIZE = 'externalize'
+
+OUTPUTS_DIR = 'outputs'
+
+# Mime types stored base64 encoded in notebooks
+_BINARY_TYPES = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/gif': '.gif'
+}
+_TEXT_TYPES = {
+    'image/svg+xml': '.svg',
+    'text/html': '.html',
+    'text/markdown': '.md',
+    'text/latex': '.tex',
+    'application/javascript': '.js'
+}
+
+
+def lean_mode():
+    '''
+    Returns CLEAR or EXTERNALIZE from DASHBOARD_BUNDLER_LEAN, or None if
+    notebooks are bundled verbatim (default).
+    '''
+    mode = os.getenv('DASHBOARD_BUNDLER_LEAN', '').lower()
+    if mode in ['yes', 'true', CLEAR]:
+        return CLEAR
+    if mode == EXTERNALIZE:
+        return EXTERNALIZE
+
+
+def min_output_size():
+    '''
+    Returns the size in bytes above which externalize mode moves an output
+    out of the notebook, from DASHBOARD_BUNDLER_LEAN_MIN_OUTPUT_SIZE
+    (default 4096).
+    '''
+    return int(os.getenv('DASHBOARD_BUNDLER_LEAN_MIN_OUTPUT_SIZE') or 4096)
+
+
+def _text(value):
+    return ''.join(value) if isinstance(value, list) else value
+
+
+def _output_file(mime, value):
+    '''Returns (file extension, bytes) of output data of the given type.'''
+    if mime in _BINARY_TYPES:
+        return _BINARY_TYPES[mime], base64.b64decode(_text(value))
+    if isinstance(value, (dict, list)) and mime.endswith('json'):
+        return '.json', json.dumps(value, sort_keys=True).encode('utf-8')
+    return _TEXT_TYPES.get(mime, '.txt'), _text(value).encode('utf-8')
+
+
+def _externalize(notebook, min_size):
+    '''
+    Moves display output data larger than min_size out of the notebook.
+    Returns a dict mapping paths in the bundle to their contents.
+    '''
+    assets = {}
+    for cell in notebook.cells:
+        for output in cell.get('outputs', []):
+            data = output.get('data')
+            if not data:
+                continue
+            for mime in sorted(data):
+                # Keep the plain text representation as a fallback
+                if mime == 'text/plain':
+                    continue
+                value = data[mime]
+                if isinstance(value, (dict, list)) and mime.endswith('json'):
+                    size = len(json.dumps(value))
+                else:
+                    size = len(_text(value))
+                if size <= min_size:
+                    continue
+                ext, content = _output_file(mime, value)
+                arcname = '{}/{}{}'.format(
+                    OUTPUTS_DIR, hashlib.sha256(content).hexdigest(), ext)
+                assets[arcname] = content
+                del data[mime]
+                output.setdefault('metadata', {}).setdefault(
+                    'dashboards_bundlers', {}).setdefault(
+                    'externalized', {})[mime] = arcname
+    return assets
+
+
+def make_lean(notebook, mode, min_size=None):
+    '''
+    Returns a lean copy of a notebook and a dict mapping paths in the bundle
+    to the contents of its externalized outputs. The notebook itself is not
+    modified.
+
+    :param notebook: The parsed notebook, in the version 4 format
+    :param mode: CLEAR or EXTERNALIZE
+    :param min_size: Size in bytes above which outputs are externalized
+    '''
+    notebook = copy.deepcopy(notebook)
+    notebook.metadata.pop('widgets', None)
+    if mode == CLEAR:
+        for cell in notebook.cells:
+            if cell.cell_type == 'code':
+                cell.outputs = []
+                cell.execution_count = None
+        return notebook, {}
+    if min_size is None:
+        min_size = min_output_size()
+    return notebook, _externalize(notebook, min_size)
+
+
+def _write_new(path, content):
+    '''
+    Writes content to a file that must not exist yet, so that files staged
+    as links of user files are never written through. Returns False if the
+    file already exists.
+    '''
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except OSError as ex:
+        if ex.errno == errno.EEXIST:
+            return False
+        raise
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    return True
+
+
+def write_lean_bundle(analysis, notebook_path, output_path, mode):
+    '''
+    Writes a lean copy of a notebook to notebook_path, and its externalized
+    outputs under output_path. Both are new files. Returns the size of the
+    lean notebook, and the number and total size of the output files written.
+
+    :param analysis: NotebookAnalysis of the notebook
+    :param notebook_path: Where to write the lean notebook
+    :param output_path: The output path of the dashboard being assembled
+    :param mode: CLEAR or EXTERNALIZE
+    '''
+    from nbformat.v4 import nbjson
+    notebook, assets = make_lean(analysis.notebook, mode)
+    content = nbjson.writes(notebook).encode('utf-8')
+    if not _write_new(notebook_path, content):
+        raise IOError(errno.EEXIST, 'File exists', notebook_path)
+    count = size = 0
+    if assets:
+        outputs_dir = pjoin(output_path, OUTPUTS_DIR)
+        if not os.path.isdir(outputs_dir):
+            os.makedirs(outputs_dir)
+        for arcname in sorted(assets):
+            if _write_new(pjoin(output_path, arcname), assets[arcname]):
+                count += 1
+                size += len(assets[arcname])
+    return len(content), count, size
@@ -0,0 +1,59 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+'''
+Size limits checked against the inputs of a bundle before any of them is
+copied, compressed or uploaded.
+'''
+
+import os
+from tornado import web
+
+
+def max_file_size():
+    '''
+    Returns the maximum size in bytes of any one file in a bundle, from
+    DASHBOARD_BUNDLER_MAX_FILE_SIZE (default 0: unlimited).
+    '''
+    return int(os.getenv('DASHBOARD_BUNDLER_MAX_FILE_SIZE') or 0)
+
+
+def max_bundle_size():
+    '''
+    Returns the maximum total size in bytes of the files in a bundle, before
+    compression, from DASHBOARD_BUNDLER_MAX_BUNDLE_SIZE (default 0: unlimited).
+    '''
+    return int(os.getenv('DASHBOARD_BUNDLER_MAX_BUNDLE_SIZE') or 0)
+
+
+def format_size(size):
+    '''Returns a size in bytes in a human readable form.'''
+    if size < 1024:
+        return '{} bytes'.format(size)
+    for unit in ['KiB', 'MiB', 'GiB']:
+        size /= 1024.0
+        if size < 1024:
+            break
+    return '{:.1f} {}'.format(size, unit)
+
+
+def check(name, sizes):
+    '''
+    Raises HTTP 413 if a file or the total of the given sizes exceeds the
+    configured limits. Returns the total size otherwise.
+
+    :param name: Name of the notebook being bundled, for error messages
+    :param sizes: (path within the bundle, size in bytes) pairs
+    '''
+    file_limit, bundle_limit = max_file_size(), max_bundle_size()
+    total = 0
+    for arcname, size in sizes:
+        if file_limit and size > file_limit:
+            raise web.HTTPError(413, '%s in bundle of %s is %s, over the %s '
+                                'limit per file', arcname, name,
+                                format_size(size), format_size(file_limit))
+        total += size
+    if bundle_limit and total > bundle_limit:
+        raise web.HTTPError(413, 'Bundle of %s is %s, over the %s limit',
+                            name, format_size(total),
+                            format_size(bundle_limit))
+    return total
@@ -0,0 +1,259 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+'''
+Per-stage instrumentation of bundler requests. Every stage of a request is
+timed and logged through app_log, and aggregated into counters and
+histograms served in the Prometheus text format by
+handlers.MetricsHandler.
+'''
+
+import threading
+import time
+from contextlib import contextmanager
+from tornado.log import app_log
+
+# Histogram buckets, in seconds, for stage durations
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                    10.0, 30.0, 60.0)
+# Histogram buckets, in bytes, for archive sizes
+SIZE_BUCKETS = (1024, 16 * 1024, 128 * 1024, 1024 * 1024, 8 * 1024 * 1024,
+                64 * 1024 * 1024, 512 * 1024 * 1024)
+
+PREFIX = 'dashboards_bundlers_'
+
+_lock = threading.Lock()
+# name -> (type, help)
+_families = {}
+# (name, sorted label items) -> value
+_counters = {}
+# (name, sorted label items) -> [bucket counts..., sum, count]
+_histograms = {}
+_buckets = {}
+
+
+def _declare(name, kind, help_text, buckets=None):
+    _families[name] = (kind, help_text)
+    if buckets is not None:
+        _buckets[name] = buckets
+
+
+_declare('requests_total', 'counter', 'Bundler requests by outcome')
+_declare('stage_seconds', 'histogram', 'Duration of each bundling stage',
+         DURATION_BUCKETS)
+_declare('files_total', 'counter', 'Files processed by each bundling stage')
+_declare('read_bytes_total', 'counter', 'Bytes read by each bundling stage')
+_declare('written_bytes_total', 'counter',
+         'Bytes written by each bundling stage')
+_declare('archive_bytes', 'histogram', 'Size of the bundles produced',
+         SIZE_BUCKETS)
+_declare('upload_bytes_total', 'counter',
+         'Bytes sent to dashboard servers')
+_declare('upload_responses_total', 'counter',
+         'Dashboard server responses by HTTP status')
+_declare('bundle_cache_total', 'counter',
+         'Bundle cache lookups by result')
+_declare('lean_saved_bytes_total', 'counter',
+         'Notebook bytes left out of lean bundles')
+_declare('pool_requests_total', 'counter',
+         'Requests sent to dashboard servers')
+_declare('pool_connections_total', 'counter',
+         'Connections opened to dashboard servers, one per request unless '
+         'kept-alive connections are reused')
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    '''
+    Adds value to a counter.
+
+    :param name: Counter name, without the dashboards_bundlers_ prefix
+    :param labels: Label values distinguishing the series
+    '''
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    '''
+    Records an observation in a histogram.
+
+    :param name: Histogram name, without the dashboards_bundlers_ prefix
+    :param labels: Label values distinguishing the series
+    '''
+    buckets = _buckets[name]
+    key = _key(name, labels)
+    with _lock:
+        series = _histograms.get(key)
+        if series is None:
+            series = _histograms[key] = [0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+
+def reset():
+    '''Clears all recorded values.'''
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+class Stage(object):
+    '''
+    Counts collected while a stage runs. Set the attributes of interest from
+    within the stage; unset counts are not reported.
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.files = None
+        self.bytes_read = None
+        self.bytes_written = None
+        self.duration = None
+
+
+class RequestMetrics(object):
+    '''
+    Instrumentation of a single bundler request. Time each stage of the
+    request with the stage context manager, then call done once the request
+    is over to log a summary.
+    '''
+    def __init__(self, bundler, notebook):
+        '''
+        :param bundler: Name of the bundler serving the request
+        :param notebook: Path of the notebook being bundled
+        '''
+        self.bundler = bundler
+        self.notebook = notebook
+        self.stages = []
+        self.start = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        '''
+        Times the enclosed block as the named stage, yielding a Stage whose
+        counts are recorded when the block exits.
+        '''
+        stage = Stage(name)
+        start = time.time()
+        try:
+            yield stage
+        finally:
+            stage.duration = time.time() - start
+            self.stages.append(stage)
+            self._record(stage)
+
+    def _record(self, stage):
+        labels = dict(bundler=self.bundler, stage=stage.name)
+        observe('stage_seconds', stage.duration, **labels)
+        details = ['{:.3f}s'.format(stage.duration)]
+        if stage.files is not None:
+            inc('files_total', stage.files, **labels)
+            details.append('{} files'.format(stage.files))
+        if stage.bytes_read is not None:
+            inc('read_bytes_total', stage.bytes_read, **labels)
+            details.append('{} bytes read'.format(stage.bytes_read))
+        if stage.bytes_written is not None:
+            inc('written_bytes_total', stage.bytes_written, **labels)
+            details.append('{} bytes written'.format(stage.bytes_written))
+        app_log.debug('%s %s stage %s: %s', self.bundler, self.notebook,
+                      stage.name, ', '.join(details))
+
+    def archive(self, size):
+        '''Records the size of the bundle produced.'''
+        observe('archive_bytes', size, bundler=self.bundler)
+
+    def cache_lookup(self, hit):
+        '''Counts a lookup of the bundle cache.'''
+        inc('bundle_cache_total', bundler=self.bundler,
+            result='hit' if hit else 'miss')
+
+    def lean(self, original_size, lean_size):
+        '''
+        Records the size of a notebook before and after it was made lean,
+        counting externalized outputs in the lean size.
+        '''
+        saved = max(0, original_size - lean_size)
+        inc('lean_saved_bytes_total', saved, bundler=self.bundler)
+        app_log.info('%s %s: lean bundle of %d bytes instead of %d, saved '
+                     '%d bytes (%.0f%%)', self.bundler, self.notebook,
+                     lean_size, original_size, saved,
+                     100.0 * saved / original_size if original_size else 0)
+
+    def upload(self, size, status, duration):
+        '''
+        Records a transfer to a dashboard server.
+
+        :param size: Bytes sent
+        :param status: HTTP status of the server response
+        :param duration: Seconds taken by the transfer
+        '''
+        inc('upload_bytes_total', size, bundler=self.bundler)
+        inc('upload_responses_total', bundler=self.bundler, status=str(status))
+        rate = float(size) / duration if duration > 0 else 0
+        app_log.info('%s %s: sent %d bytes in %.3fs (%.0f bytes/s), HTTP %s',
+                     self.bundler, self.notebook, size, duration, rate,
+                     status)
+
+    def done(self, outcome='success'):
+        '''
+        Logs a summary of the request and counts it under the given outcome.
+        '''
+        inc('requests_total', bundler=self.bundler, outcome=outcome)
+        app_log.info('%s %s: %s in %.3fs (%s)', self.bundler, self.notebook,
+                     outcome, time.time() - self.start,
+                     ', '.join('{} {:.3f}s'.format(s.name, s.duration)
+                               for s in self.stages))
+
+
+def _format_labels(items):
+    if not items:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\')
+                                           .replace('"', '\\"'))
+                          for k, v in items) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def render():
+    '''Returns all metrics in the Prometheus text exposition format.'''
+    with _lock:
+        counters = dict(_counters)
+        histograms = dict((k, list(v)) for k, v in _histograms.items())
+
+    lines = []
+    for name in sorted(_families):
+        kind, help_text = _families[name]
+        full_name = PREFIX + name
+        lines.append('# HELP {} {}'.format(full_name, help_text))
+        lines.append('# TYPE {} {}'.format(full_name, kind))
+        if kind == 'counter':
+            for key in sorted(k for k in counters if k[0] == name):
+                lines.append('{}{} {}'.format(full_name, _format_labels(key[1]),
+                                              _format_value(counters[key])))
+            continue
+        buckets = _buckets[name]
+        for key in sorted(k for k in histograms if k[0] == name):
+            series = histograms[key]
+            for bound, count in zip(buckets, series):
+                labels = key[1] + (('le', _format_value(float(bound))),)
+                lines.append('{}_bucket{} {}'.format(
+                    full_name, _format_labels(labels), count))
+            labels = key[1] + (('le', '+Inf'),)
+            lines.append('{}_bucket{} {}'.format(
+                full_name, _format_labels(labels), series[-1]))
+            lines.append('{}_sum{} {}'.format(full_name, _format_labels(key[1]),
+                                              _format_value(series[-2])))
+            lines.append('{}_count{} {}'.format(
+                full_name, _format_labels(key[1]), series[-1]))
+    return '\n'.join(lines) + '\n'
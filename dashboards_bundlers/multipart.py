@@ -0,0 +1,120 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import os
+import uuid
+
+# Size of the chunks yielded when the body is sent with chunked encoding
+CHUNK_SIZE = 64 * 1024
+
+
+def chunked_upload():
+    '''
+    Returns True if multipart bodies should be sent with chunked transfer
+    encoding rather than a Content-Length, per DASHBOARD_SERVER_CHUNKED_UPLOAD.
+    '''
+    return os.getenv('DASHBOARD_SERVER_CHUNKED_UPLOAD', '').lower() in ['yes', 'true']
+
+
+class MultipartFile(object):
+    '''
+    Read-only, seekable file object presenting a multipart/form-data body
+    with a single file field. The file contents are read from disk as the
+    body is consumed, so sending it takes a fixed amount of memory no matter
+    how large the file is. Seeking lets the HTTP client rewind the body when
+    it retries a request.
+    '''
+    def __init__(self, path, field_name='file', filename=None,
+                 chunk_size=CHUNK_SIZE):
+        '''
+        :param path: The path of the file to send
+        :param field_name: The name of the form field holding the file
+        :param filename: The file name to report, the basename of path by
+            default
+        :param chunk_size: The size of the chunks yielded when iterating
+        '''
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary={}'.format(
+            self.boundary)
+        self.chunk_size = chunk_size
+        filename = filename or os.path.basename(path)
+        self._prefix = (
+            '--{}\r\n'
+            'Content-Disposition: form-data; name="{}"; filename="{}"\r\n'
+            '\r\n'.format(self.boundary, field_name, filename)
+        ).encode('utf-8')
+        self._suffix = '\r\n--{}--\r\n'.format(self.boundary).encode('utf-8')
+        self._file = open(path, 'rb')
+        self._file_size = os.fstat(self._file.fileno()).st_size
+        self._length = len(self._prefix) + self._file_size + len(self._suffix)
+        self._pos = 0
+
+    def __len__(self):
+        return self._length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self._file.close()
+
+    def chunked(self):
+        '''
+        Returns an iterable over the body with no known length, which HTTP
+        clients send with chunked transfer encoding. Every iteration starts
+        from the beginning of the body so that retried requests are complete.
+        '''
+        return _ChunkedBody(self)
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self._length
+        self._pos = max(0, min(offset, self._length))
+        return self._pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length - self._pos
+        parts = []
+        prefix_end = len(self._prefix)
+        file_end = prefix_end + self._file_size
+        while size > 0 and self._pos < self._length:
+            if self._pos < prefix_end:
+                data = self._prefix[self._pos:self._pos + size]
+            elif self._pos < file_end:
+                self._file.seek(self._pos - prefix_end)
+                data = self._file.read(min(size, file_end - self._pos))
+                if not data:
+                    raise IOError('{} shrank while being sent'.format(
+                        self._file.name))
+            else:
+                start = self._pos - file_end
+                data = self._suffix[start:start + size]
+            parts.append(data)
+            self._pos += len(data)
+            size -= len(data)
+        return b''.join(parts)
+
+
+class _ChunkedBody(object):
+    def __init__(self, body):
+        self.body = body
+
+    def __iter__(self):
+        self.body.seek(0)
+        return iter(self.body)
@@ -0,0 +1,189 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+'''
+Memoized filesystem lookups for the bundlers. Resolved paths and indexes of
+directory trees are kept between requests and revalidated with stat calls
+rather than recomputed, so that an unchanged Jupyter installation costs no
+probe of every Jupyter path and no listing or hashing of every widget asset.
+
+Adding, removing or renaming an entry changes the modification time of its
+parent directory, which is enough for resolved paths. Installers may also
+rewrite existing files in place, like the shutil.copy2 of nbextension
+installs, so indexes also compare the size and modification time of every
+file.
+'''
+
+import hashlib
+import os
+import threading
+from os.path import join as pjoin
+
+
+_HASH_CHUNK_SIZE = 64 * 1024
+
+
+def file_digest(path):
+    '''Returns the SHA-256 hex digest of the contents of a file.'''
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class PathCache(object):
+    '''
+    Remembers the results of filesystem lookups along with the directories
+    they depend on.
+    '''
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, resolve):
+        '''
+        Returns the cached value for key while the directories it depends on
+        are unchanged, calling resolve to compute it otherwise.
+
+        :param key: Hashable identifier of the lookup
+        :param resolve: Callable returning a (value, list of directories the
+            value depends on) pair
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            value, mtimes = entry
+            if all(_mtime(d) == m for d, m in mtimes):
+                return value
+        value, dirs = resolve()
+        with self._lock:
+            self._entries[key] = (value, [(d, _mtime(d)) for d in dirs])
+        return value
+
+    def clear(self):
+        '''Forgets all cached lookups.'''
+        with self._lock:
+            self._entries.clear()
+
+
+class AssetIndex(object):
+    '''
+    Index of every file under a directory tree, following symlinks like
+    shutil.copytree, with the size and modification time of each file.
+    '''
+    def __init__(self, src_dir, dest_dir):
+        '''
+        :param src_dir: Root of the tree to index
+        :param dest_dir: Path under which the files appear in a bundle
+        '''
+        self.src_dir = src_dir
+        self.dest_dir = dest_dir
+        # (path under dest_dir, absolute path, size, mtime) sorted by path
+        self.entries = []
+        self._dir_mtimes = []
+        h = hashlib.sha1()
+        for root, dirs, filenames in os.walk(src_dir, followlinks=True):
+            dirs.sort()
+            self._dir_mtimes.append((root, _mtime(root)))
+            rel_root = os.path.relpath(root, src_dir)
+            for filename in sorted(filenames):
+                path = pjoin(root, filename)
+                st = os.stat(path)
+                arcname = os.path.normpath(pjoin(dest_dir, rel_root, filename))
+                self.entries.append((arcname, path, st.st_size, st.st_mtime))
+                h.update(u'{}\0{}\0{}\0{!r}\n'.format(
+                    arcname, path, st.st_size, st.st_mtime).encode('utf-8'))
+        self.digest = h.hexdigest()
+        self._file_digests = None
+        self._content_lock = threading.Lock()
+
+    @property
+    def files(self):
+        '''List of (path under dest_dir, absolute path) pairs.'''
+        return [(arcname, path) for arcname, path, _, _ in self.entries]
+
+    @property
+    def size(self):
+        '''Total size of the indexed files.'''
+        return sum(entry[2] for entry in self.entries)
+
+    @property
+    def file_digests(self):
+        '''
+        List of (path under dest_dir, size, SHA-256 hex digest of the
+        contents) of the indexed files. Files are read once per index, on
+        first use.
+        '''
+        with self._content_lock:
+            if self._file_digests is None:
+                self._file_digests = [(arcname, size, file_digest(path))
+                                      for arcname, path, size, _
+                                      in self.entries]
+            return self._file_digests
+
+    @property
+    def content_digest(self):
+        '''
+        Hex digest of the names and contents of the indexed files, which is
+        the same wherever and whenever identical files were installed.
+        '''
+        h = hashlib.sha256()
+        for arcname, _, digest in self.file_digests:
+            h.update(u'{}\0{}\n'.format(arcname, digest).encode('utf-8'))
+        return h.hexdigest()
+
+    def is_current(self):
+        '''
+        True if no directory in the tree and no file in the index has changed
+        size or modification time since it was indexed.
+        '''
+        if not all(_mtime(d) == m for d, m in self._dir_mtimes):
+            return False
+        for _, path, size, mtime in self.entries:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            if st.st_size != size or st.st_mtime != mtime:
+                return False
+        return True
+
+
+# Lookups shared by the bundlers
+resolved = PathCache()
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(src_dir, dest_dir):
+    '''
+    Returns the AssetIndex of a directory tree, reusing the index built for
+    a previous request if the tree is unchanged.
+    '''
+    key = (src_dir, dest_dir)
+    with _indexes_lock:
+        index = _indexes.get(key)
+    if index is not None and index.is_current():
+        return index
+    index = AssetIndex(src_dir, dest_dir)
+    with _indexes_lock:
+        _indexes[key] = index
+    return index
+
+
+def clear():
+    '''Forgets all indexes and resolved paths.'''
+    with _indexes_lock:
+        _indexes.clear()
+    resolved.clear()
@@ -0,0 +1,194 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+'''
+Resumable deploys send a bundle to a dashboard server in chunks, so that an
+interrupted upload picks up after the last chunk the server acknowledged
+instead of starting over. The protocol, spoken in addition to the plain
+upload POST, is:
+
+1. POST /_api/uploads with a JSON body {"name": dashboard name, "size":
+   bundle size, "sha256": bundle hash}. The server responds with
+   {"id": upload id, "offset": bytes already received}.
+2. PUT /_api/uploads/<id> with the next bytes of the bundle and a
+   Content-Range: bytes <first>-<last>/<size> header. The server responds
+   with {"offset": bytes received}, or 409 and the same body if the chunk
+   does not start at its offset.
+3. GET /_api/uploads/<id> responds with {"offset": bytes received}. It is
+   used to find where to resume after a chunk failed.
+4. POST /_api/uploads/<id>/deploy once every byte is received. The server
+   deploys the bundle and responds as it would to a plain upload.
+
+Servers that answer step 1 with 404, 405 or 501 do not support the protocol
+and receive the full bundle instead. Upload ids are remembered in process,
+so deploying the same bundle again after a failure resumes it too.
+'''
+
+import hashlib
+import os
+import threading
+import time
+from tornado.log import app_log
+from . import sessions
+
+UPLOADS_ENDPOINT = '/_api/uploads'
+
+# Status codes meaning the dashboard server does not speak the protocol
+UNSUPPORTED_STATUS = (404, 405, 501)
+
+_HASH_CHUNK_SIZE = 64 * 1024
+
+# Upload ids of unfinished uploads by (server, dashboard name, bundle hash)
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def resumable_upload_enabled():
+    return os.getenv('DASHBOARD_SERVER_RESUMABLE_UPLOAD', '').lower() in ['yes', 'true']
+
+
+def chunk_size():
+    '''
+    Returns the number of bytes sent per request of a resumable upload, from
+    DASHBOARD_SERVER_CHUNK_SIZE (default 8 MiB).
+    '''
+    return int(os.getenv('DASHBOARD_SERVER_CHUNK_SIZE') or 8 * 1024 * 1024)
+
+
+def _hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _query_offset(session, upload_url, headers, timeout, verify):
+    '''
+    Returns (offset, None) with the number of bytes the server has received,
+    (None, response) if it no longer knows the upload, or (None, None) if it
+    could not be reached.
+    '''
+    from requests.exceptions import RequestException
+    try:
+        result = session.get(upload_url, headers=headers, timeout=timeout,
+                             verify=verify)
+    except RequestException as ex:
+        app_log.debug('Could not query resumable upload %s: %s', upload_url, ex)
+        return None, None
+    if result.status_code >= 400:
+        return None, result
+    return int(result.json()['offset']), None
+
+
+def upload(dashboard_server, dashboard_name, bundle_path, headers, verify,
+           timeout=60, stats=None):
+    '''
+    Deploys a bundle using the resumable protocol. Blocks until done, so call
+    it from the bundler thread pool. Returns the response to the deploy POST,
+    the response to the first request that failed for good, or None if the
+    dashboard server does not support resumable uploads. Chunks that fail
+    are retried from the offset the server acknowledged, up to
+    DASHBOARD_SERVER_MAX_RETRIES times in a row without progress.
+
+    :param dashboard_server: Root URL of the dashboard server
+    :param dashboard_name: The dashboard name under which it should be made
+        available
+    :param bundle_path: The path of the zip or notebook file to deploy
+    :param headers: Extra HTTP headers to send with every request
+    :param verify: Whether to verify the server SSL certificate
+    :param stats: Optional dict in which to count the bundle bytes the server
+        acknowledged as bytes_sent
+    '''
+    from notebook.utils import url_path_join
+    from requests.exceptions import RequestException
+    stats = stats if stats is not None else {}
+    stats['bytes_sent'] = 0
+    size = os.path.getsize(bundle_path)
+    sha = _hash_file(bundle_path)
+    session = sessions.get_session(dashboard_server, verify)
+    uploads_url = url_path_join(dashboard_server, UPLOADS_ENDPOINT)
+    key = (dashboard_server, dashboard_name, sha)
+
+    offset = None
+    with _pending_lock:
+        upload_id = _pending.get(key)
+    if upload_id is not None:
+        offset, _ = _query_offset(session, url_path_join(uploads_url, upload_id),
+                                  headers, timeout, verify)
+    if offset is None:
+        result = session.post(uploads_url, json={'name': dashboard_name,
+                                                 'size': size, 'sha256': sha},
+                              headers=headers, timeout=timeout, verify=verify)
+        if result.status_code in UNSUPPORTED_STATUS:
+            app_log.debug('Dashboard server does not support resumable uploads')
+            return None
+        if result.status_code >= 400:
+            return result
+        body = result.json()
+        upload_id = body['id']
+        offset = int(body.get('offset', 0))
+        with _pending_lock:
+            _pending[key] = upload_id
+    else:
+        app_log.info('Resuming upload of %s at byte %d of %d', dashboard_name,
+                     offset, size)
+    upload_url = url_path_join(uploads_url, upload_id)
+
+    failures = 0
+    with open(bundle_path, 'rb') as f:
+        while offset < size:
+            f.seek(offset)
+            chunk = f.read(chunk_size())
+            chunk_headers = dict(headers)
+            chunk_headers['Content-Type'] = 'application/octet-stream'
+            chunk_headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+                offset, offset + len(chunk) - 1, size)
+            error = result = None
+            try:
+                result = session.put(upload_url, data=chunk,
+                                     headers=chunk_headers, timeout=timeout,
+                                     verify=verify)
+            except RequestException as ex:
+                error = ex
+
+            if result is not None and (result.status_code < 400 or
+                                       result.status_code == 409):
+                acknowledged = int(result.json()['offset'])
+            elif (result is not None and
+                    result.status_code not in sessions.RETRY_STATUS):
+                return result
+            else:
+                acknowledged, gone = _query_offset(session, upload_url,
+                                                   headers, timeout, verify)
+                if gone is not None:
+                    with _pending_lock:
+                        _pending.pop(key, None)
+                    return gone
+
+            if acknowledged is not None and acknowledged > offset:
+                stats['bytes_sent'] += acknowledged - offset
+                offset = acknowledged
+                failures = 0
+                continue
+            if acknowledged is not None and acknowledged < offset:
+                # The server lost data it had acknowledged: send it again
+                offset = acknowledged
+            failures += 1
+            if failures > sessions.max_retries():
+                if error is not None:
+                    raise error
+                return result
+            app_log.debug('Retrying upload of %s at byte %d: %s',
+                          dashboard_name, offset,
+                          error or 'HTTP {}'.format(result.status_code))
+            time.sleep(sessions.retry_backoff() * (2 ** (failures - 1)))
+
+    result = session.post(url_path_join(upload_url, 'deploy'),
+                          headers=headers, timeout=timeout, verify=verify)
+    if result.status_code < 400 or result.status_code == 404:
+        with _pending_lock:
+            _pending.pop(key, None)
+    return result
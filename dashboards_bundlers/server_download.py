@@ -2,16 +2,81 @@
 # Distributed under the terms of the Modified BSD License.
 
 import os
-import shutil
-import tempfile
-from .server_upload import make_upload_bundle
+import zlib
+from os.path import join as pjoin
+from tornado import gen
+from . import cache
+from .executor import run_in_executor
+from .metrics import RequestMetrics
+from .server_upload import bundle_fingerprint, list_bundle_contents
+from .widget_assets import cache_dir, cache_size
+from .zipstream import (ARCHIVE_VERSION, CHUNK_SIZE, compression_level,
+                        iter_zip, read_chunks)
 
 
+def download_cache_size():
+    '''
+    Returns the maximum total size in bytes of the cache of downloaded zip
+    files, from DASHBOARD_BUNDLER_DOWNLOAD_CACHE_SIZE (default: the size of
+    the fragment cache). Zero disables the cache.
+    '''
+    return int(os.getenv('DASHBOARD_BUNDLER_DOWNLOAD_CACHE_SIZE') or
+               cache_size())
+
+
+def get_download_cache():
+    '''
+    Returns the cache of downloaded zip files, kept apart from the fragment
+    cache so that large downloads never evict fragments in use, or None if
+    caching is disabled.
+    '''
+    return cache.get_cache(pjoin(cache_dir(), 'downloads'),
+                           download_cache_size())
+
+
+def download_fingerprint(abs_nb_path, tools):
+    '''
+    Returns the fingerprint of the download of a notebook. Bundles are
+    deterministic, so it is computed from the bundle inputs and settings
+    without building the bundle, and identifies both the ETag of the
+    download and its cached archive.
+    '''
+    target = 'download\0{}\0{}\0{}'.format(ARCHIVE_VERSION, compression_level(),
+                                         zlib.ZLIB_VERSION)
+    return bundle_fingerprint(abs_nb_path, tools, target)
+
+
+def etag_matches(if_none_match, etag):
+    '''
+    True if the value of an If-None-Match request header matches the given
+    entity tag, using the weak comparison required for that header.
+    '''
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    strip_weak = lambda tag: tag[2:] if tag.startswith('W/') else tag
+    return strip_weak(etag) in [strip_weak(tag) for tag in tags]
+
+
+@gen.coroutine
 def bundle(handler, model):
     '''
     Downloads a notebook, either by itself, or within a zip file with
     associated data and widget files, for manual deployment to a Jupyter
     Dashboard Server.
+
+    The zip file is generated and sent to the browser a chunk at a time
+    rather than being staged on disk and read into memory. Reading and
+    compressing happen on the bundler thread pool so that the IOLoop is never
+    blocked on disk or zlib.
+
+    Responses carry an ETag, and conditional requests for an unchanged
+    bundle are answered with 304 Not Modified without building it. Zip
+    files are written to the download cache, if enabled, while they are
+    streamed, and sent again from it with a Content-Length while their
+    inputs are unchanged.
     '''
     # Noteook implementation passes ContentManager models. This bundler
     # only works with local files anyway.
@@ -20,34 +85,120 @@ def bundle(handler, model):
         model['path']
     )
 
+    metrics = RequestMetrics('server_download', model['path'])
+    with metrics.stage('fingerprint'):
+        fingerprint = yield run_in_executor(download_fingerprint, abs_nb_path,
+                                            handler.tools)
+    etag = '"{}"'.format(fingerprint)
+    handler.set_header('Etag', etag)
+    if etag_matches(handler.request.headers.get('If-None-Match'), etag):
+        handler.set_status(304)
+        handler.finish()
+        metrics.done('not_modified')
+        return
+
+    try:
+        yield _send_bundle(handler, abs_nb_path, fingerprint, metrics)
+    except Exception:
+        metrics.done('error')
+        raise
+    else:
+        metrics.done()
+
+
+def _read_file(f, chunk_size=CHUNK_SIZE):
+    '''Yields the contents of an open file in chunks, then closes it.'''
+    with f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _tee(chunks, writer):
+    '''
+    Yields the given chunks while writing them to a cache.CacheWriter. The
+    entry is committed once every chunk was written, and discarded if the
+    chunks are not all consumed.
+    '''
+    completed = False
+    try:
+        for chunk in chunks:
+            writer.file.write(chunk)
+            yield chunk
+        completed = True
+    finally:
+        if completed:
+            writer.commit()
+        else:
+            writer.discard()
+
+
+def _close(chunks, fragments):
+    '''Closes a chunk generator and the fragments it reads from.'''
+    try:
+        chunks.close()
+    finally:
+        for fragment in fragments:
+            fragment.close()
+
+
+@gen.coroutine
+def _send_bundle(handler, abs_nb_path, fingerprint, metrics):
     # Get name of notebook from filename
     notebook_basename = os.path.basename(abs_nb_path)
     notebook_name = os.path.splitext(notebook_basename)[0]
 
-    # Python 2/3 compatible try/finally to cleanup a temp working directory
-    tmp_dir = tempfile.mkdtemp()
-    try:
-        output_dir = os.path.join(tmp_dir, notebook_name)
-        # Reuse the same logic we would use to send a zip file or notebook
-        # file to a dashboard server, but send it back to the web browser
-        # not to another server
-        bundle_path = make_upload_bundle(abs_nb_path, output_dir, handler.tools)
-
-        if bundle_path == abs_nb_path:
-            # Send the notebook alone: it has no associated resources
-            handler.set_header('Content-Disposition',
-                               'attachment; filename="%s"' % notebook_basename)
-            handler.set_header('Content-Type', 'application/json')
-        else:
-            # Send a zip of the notebook and its associated resources
-            handler.set_header('Content-Disposition',
-                               'attachment; filename="%s"' % (notebook_name + '.zip'))
-            handler.set_header('Content-Type', 'application/zip')
+    # Reuse the same logic we would use to send a zip file or notebook
+    # file to a dashboard server, but send it back to the web browser
+    # not to another server
+    with metrics.stage('list_contents') as stage:
+        files, fragments = yield run_in_executor(list_bundle_contents,
+                                                 abs_nb_path, handler.tools)
+        stage.files = len(files)
 
-        with open(bundle_path, 'rb') as bundle_file:
-            handler.write(bundle_file.read())
-        handler.finish()
+    if len(files) == 1 and not fragments:
+        # Send the notebook alone: it has no associated resources
+        handler.set_header('Content-Disposition',
+                           'attachment; filename="%s"' % notebook_basename)
+        handler.set_header('Content-Type', 'application/json')
+        chunks = read_chunks(abs_nb_path)
+    else:
+        # Send a zip of the notebook and its associated resources
+        handler.set_header('Content-Disposition',
+                           'attachment; filename="%s"' % (notebook_name + '.zip'))
+        handler.set_header('Content-Type', 'application/zip')
+        downloads = get_download_cache()
+        f = None
+        if downloads is not None:
+            f = yield run_in_executor(downloads.open, fingerprint + '.zip')
+            metrics.cache_lookup(f is not None)
+        if f is not None:
+            # Send the zip built for an earlier request with the same inputs
+            handler.set_header('Content-Length', os.fstat(f.fileno()).st_size)
+            chunks = _read_file(f)
+        elif downloads is not None:
+            # Stream the zip while keeping a copy for the next requests
+            writer = yield run_in_executor(downloads.create,
+                                           fingerprint + '.zip')
+            chunks = _tee(iter_zip(files, fragments), writer)
+        else:
+            chunks = iter_zip(files, fragments)
 
+    # Flush after every chunk so that at most one chunk per request is
+    # buffered in memory
+    try:
+        with metrics.stage('stream') as stage:
+            stage.bytes_written = 0
+            while True:
+                chunk = yield run_in_executor(next, chunks, None)
+                if chunk is None:
+                    break
+                handler.write(chunk)
+                stage.bytes_written += len(chunk)
+                yield handler.flush()
     finally:
-        # We read and send synchronously, so we can clean up safely after finish
-        shutil.rmtree(tmp_dir, True)
+        yield run_in_executor(_close, chunks, fragments)
+    metrics.archive(stage.bytes_written)
+    handler.finish()
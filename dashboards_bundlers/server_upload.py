@@ -1,16 +1,23 @@
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
 
+import hashlib
 import os
-import nbformat
-import requests
 import shutil
-import tempfile
-from jupyter_core.paths import jupyter_path
-from notebook.utils import url_path_join
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from os.path import join as pjoin
-from tornado import escape, web
+from tornado import escape, gen, web
 from tornado.log import access_log, app_log
+from . import (artifacts, components, delta, fingerprints, jobs, lean,
+               limits, paths, resumable, sessions, widget_assets)
+from .analysis import analyze
+from .executor import run_in_executor
+from .metrics import RequestMetrics
+from .multipart import MultipartFile, chunked_upload
+from .staging import get_area, stage_file, stage_filelist, stage_tree
+from .zipstream import compression_level, iter_zip, write_zip
 
 UPLOAD_ENDPOINT = '/_api/notebooks/'
 VIEW_ENDPOINT = '/dashboards/'
@@ -25,10 +32,18 @@ if skip_ssl_verification():
     app_log.warn('Dashboard server SSL verification disabled')
 
 
+@gen.coroutine
 def bundle(handler, model):
     '''
     Uploads a notebook to a Jupyter Dashboard Server, either by itself, or
     within a zip file with associated data and widget files
+
+    File, zip and network work runs on the bundler thread pool so that the
+    IOLoop keeps serving other requests while the bundle is assembled.
+
+    With background jobs enabled, the deploy is queued instead and the
+    response is a page polling its progress until it redirects to the
+    dashboard.
     '''
     # Noteook implementation passes ContentManager models. This
     # bundler only works with local files anyway.
@@ -41,69 +56,152 @@ def bundle(handler, model):
     notebook_basename = os.path.basename(abs_nb_path)
     notebook_name = os.path.splitext(notebook_basename)[0]
 
-    # Python 2/3 compatible try/finally to cleanup a temp working directory
-    tmp_dir = tempfile.mkdtemp()
+    force = handler.get_query_argument('force', '').lower() in ['1', 'yes', 'true']
+    if jobs.background_enabled():
+        job = jobs.submit(abs_nb_path, model['path'], handler.tools,
+                          *get_request_host(handler), force=force)
+        url = jobs.status_url(handler.settings['base_url'], job)
+        handler.set_status(202)
+        handler.set_header('Location', url)
+        handler.finish(jobs.progress_page(notebook_name, url))
+        return
+
+    metrics = RequestMetrics('server_upload', model['path'])
+    protocol, hostname, port = get_request_host(handler)
+    dashboard_servers = get_dashboard_servers(protocol, hostname, port)
+    area = get_area()
+    tmp_dir = None
     try:
-        output_dir = os.path.join(tmp_dir, notebook_name)
-        bundled = make_upload_bundle(abs_nb_path, output_dir, handler.tools)
-        send_file(bundled, notebook_name, handler)
+        fingerprint, link = yield run_in_executor(
+            check_unchanged, abs_nb_path, handler.tools, dashboard_servers,
+            force, metrics)
+        if link:
+            metrics.done('unchanged')
+            handler.redirect(link)
+            return
+
+        # Wait for room in the staging area on the IOLoop, so that waiting
+        # deploys do not hold threads of the bundler pool
+        with metrics.stage('queue'):
+            size = yield run_in_executor(staging_estimate, abs_nb_path,
+                                         handler.tools, area)
+            tmp_dir = yield area.acquire(size)
+        result = yield run_in_executor(deploy_staged, abs_nb_path,
+                                       handler.tools, dashboard_servers,
+                                       protocol, hostname, port, tmp_dir,
+                                       fingerprint, metrics)
+    except Exception:
+        metrics.done('error')
+        raise
     finally:
-        shutil.rmtree(tmp_dir, True)
+        if tmp_dir is not None:
+            yield run_in_executor(area.release, tmp_dir)
+    metrics.done()
+    handler.redirect(result.link)
 
 
 def get_extension_path(*parts):
     '''
     Searches all known jupyter extension paths for the referenced directory.
     Returns the first hit or None if not found.
+
+    The result is remembered until an extension directory that was searched
+    changes.
     '''
+    from jupyter_core.paths import jupyter_path
     ext_path = pjoin(*parts)
-    for root_path in jupyter_path():
-        full_path = pjoin(root_path, 'nbextensions', ext_path)
-        if os.path.exists(full_path):
-            return full_path
+    roots = jupyter_path()
+
+    def resolve():
+        searched = []
+        for root_path in roots:
+            full_path = pjoin(root_path, 'nbextensions', ext_path)
+            searched.append(os.path.dirname(full_path))
+            if os.path.exists(full_path):
+                return full_path, searched
+        return None, searched
+    return paths.resolved.get(('extension', ext_path, tuple(roots)), resolve)
 
 
-def bundle_file_references(output_path, notebook_fn, tools):
+def get_widgets_components_dir(widgets_dir):
     '''
-    Looks for files references in the notebook in the manner supported by
-    notebook.bundler.tools. Adds those files to the output path if found.
+    Returns the directory of the bower components installed with declarative
+    widgets, which could be under 'urth_components' or 'bower_components'
+    depending on the version of widgets being used.
+    '''
+    def resolve():
+        components_dir = pjoin(widgets_dir, 'urth_components')
+        if not os.path.isdir(components_dir):
+            components_dir = pjoin(widgets_dir, 'bower_components')
+        return components_dir, [widgets_dir]
+    return paths.resolved.get(('components', widgets_dir), resolve)
 
-    :param output_path: The output path of the dashboard being assembled
-    :param notebook_fn: The absolute path to the notebook file being packaged
+
+def bundle_fingerprint(abs_nb_path, tools, target='', analysis=None):
     '''
-    if tools is not None:
-        referenced_files = tools.get_file_references(notebook_fn, 4)
-        tools.copy_filelist(os.path.dirname(notebook_fn), output_path,
-                            referenced_files)
+    Returns the fingerprint of everything that goes into the bundle of a
+    notebook, and of where it is sent, without assembling it.
+
+    :param abs_nb_path: The path to the notebook
+    :param tools: The notebook.bundler.tools module or None
+    :param target: Where the bundle is sent, like the dashboard server URL
+    :param analysis: NotebookAnalysis of the notebook, read if not given
+    '''
+    analysis = analysis or analyze(abs_nb_path)
+    referenced_files = (analysis.get_file_references(tools)
+                        if tools is not None else [])
+    widgets_dirs = get_declarative_widgets_dirs(abs_nb_path, None, analysis)
+    return fingerprints.compute(analysis, referenced_files, widgets_dirs,
+                                target)
 
 
-def bundle_declarative_widgets(output_path, notebook_file, widget_folder='static'):
+def deploy_target(dashboard_servers):
     '''
-    Adds frontend bower components dependencies into the bundle for the dashboard
-    application. Creates the following directories under output_path:
+    Returns a string identifying where and how a bundle is deployed, for
+    bundle_fingerprint: the dashboard server URLs, the lean bundle mode and
+    the size above which outputs are externalized.
+    '''
+    mode = lean.lean_mode()
+    if mode == lean.EXTERNALIZE:
+        mode = '{}:{}'.format(mode, lean.min_output_size())
+    return ' '.join(dashboard_servers) + '\0lean={}'.format(mode)
 
-    static/urth_widgets: Stores the js for urth_widgets which will be loaded in
-                         the frontend of the dashboard
-    static/urth_components: The directory for all of the bower components of the
-                            dashboard.
 
-    NOTE: This function is too specific to urth widgets. In the
-        future we should investigate ways to make this more generic.
+def bundle_file_references(output_path, notebook_fn, tools, analysis=None):
+    '''
+    Looks for files references in the notebook in the manner supported by
+    notebook.bundler.tools. Stages those files in the output path if found.
+    Returns the number of files staged and their total size.
 
     :param output_path: The output path of the dashboard being assembled
+    :param notebook_fn: The absolute path to the notebook file being packaged
+    :param analysis: NotebookAnalysis of the notebook, read if not given
+    '''
+    if tools is None:
+        return 0, 0
+    analysis = analysis or analyze(notebook_fn)
+    referenced_files = analysis.get_file_references(tools)
+    return stage_filelist(os.path.dirname(notebook_fn), output_path,
+                          referenced_files)
+
+
+def get_declarative_widgets_dirs(notebook_file, widget_folder='static',
+                                 analysis=None):
+    '''
+    Determines which declarative widgets directories must be bundled with the
+    notebook. Returns a list of (source directory, output directory) pairs with
+    the output directories relative to the root of the bundle, or an empty list
+    if the notebook does not use declarative widgets.
+
     :param notebook_file: The absolute path to the notebook file being packaged
     :param widget_folder: Subfolder name in which the widgets should be contained.
+    :param analysis: NotebookAnalysis of the notebook, read if not given
     '''
     # Check if any of the cells contain widgets, if not we do not to copy the
     # bower_components
-    notebook = nbformat.read(notebook_file, 4)
-    # Using find instead of a regex to help future-proof changes that might be
-    # to how user's will use urth-core-import
-    # (i.e. <link is=urth-core-import> vs. <urth-core-import>)
-    any_cells_with_widgets = any(cell.get('source').find('urth-core-') != -1
-                                 for cell in notebook.cells)
-    if not any_cells_with_widgets:
-        return
+    analysis = analysis or analyze(notebook_file)
+    if not analysis.uses_declarative_widgets:
+        return []
 
     # Directory of declarative widgets extension
     widgets_dir = get_extension_path('declarativewidgets') or get_extension_path('urth_widgets')
@@ -111,112 +209,685 @@ def bundle_declarative_widgets(output_path, notebook_file, widget_folder='static
         raise web.HTTPError(500, 'Missing jupyter_declarativewidgets extension')
 
     # Root of declarative widgets within a dashboard app
-    output_widgets_dir = pjoin(output_path, widget_folder, 'urth_widgets/') if widget_folder is not None else pjoin(output_path, 'urth_widgets/')
+    output_widgets_dir = pjoin(widget_folder, 'urth_widgets') if widget_folder is not None else 'urth_widgets'
     # JavaScript entry point for widgets in dashboard app
     output_js_dir = pjoin(output_widgets_dir, 'js')
     # Web referenceable path from which all urth widget components will be served
-    output_components_dir = pjoin(output_path, widget_folder, 'urth_components/') if widget_folder is not None else pjoin(output_path, 'urth_components/')
+    output_components_dir = pjoin(widget_folder, 'urth_components') if widget_folder is not None else 'urth_components'
 
-    # Copy declarative widgets js and installed bower components into the app
-    # under output directory
+    # Declarative widgets js
     widgets_js_dir = pjoin(widgets_dir, 'js')
-    shutil.copytree(widgets_js_dir, output_js_dir)
 
-    # Widgets bower components could be under 'urth_components' or
-    # 'bower_components' depending on the version of widgets being used.
-    widgets_components_dir = pjoin(widgets_dir, 'urth_components')
-    if not os.path.isdir(widgets_components_dir):
-        widgets_components_dir = pjoin(widgets_dir, 'bower_components')
+    # Widgets bower components
+    widgets_components_dir = get_widgets_components_dir(widgets_dir)
+
+    dirs = [(widgets_js_dir, output_js_dir)]
+    if components.prune_enabled():
+        # Only bundle the bower packages reachable from the notebook imports
+        packages = components.required_packages(
+            widgets_components_dir, analysis.component_references,
+            components.widgets_references(paths.get_index(widgets_js_dir,
+                                                          output_js_dir)))
+        if packages is not None:
+            return dirs + [(pjoin(widgets_components_dir, package),
+                            pjoin(output_components_dir, package))
+                           for package in sorted(packages)]
+        app_log.debug('Bundling all widget components: an import of %s '
+                      'was not found', notebook_file)
+    return dirs + [(widgets_components_dir, output_components_dir)]
+
+
+def bundle_declarative_widgets(output_path, notebook_file, widget_folder='static',
+                               analysis=None):
+    '''
+    Adds frontend bower components dependencies into the bundle for the dashboard
+    application. Creates the following directories under output_path:
+
+    static/urth_widgets: Stores the js for urth_widgets which will be loaded in
+                         the frontend of the dashboard
+    static/urth_components: The directory for all of the bower components of the
+                            dashboard.
+
+    Returns the number of files staged and their total size.
+
+    NOTE: This function is too specific to urth widgets. In the
+        future we should investigate ways to make this more generic.
+
+    :param output_path: The output path of the dashboard being assembled
+    :param notebook_file: The absolute path to the notebook file being packaged
+    :param widget_folder: Subfolder name in which the widgets should be contained.
+    :param analysis: NotebookAnalysis of the notebook, read if not given
+    '''
+    # Stage declarative widgets js and installed bower components into the app
+    # under output directory
+    count = size = 0
+    for src_dir, dest_dir in get_declarative_widgets_dirs(notebook_file,
+                                                          widget_folder,
+                                                          analysis):
+        staged = stage_tree(src_dir, pjoin(output_path, dest_dir))
+        count += staged[0]
+        size += staged[1]
+    return count, size
+
+
+def bundle_sizes(abs_nb_path, tools, analysis=None):
+    '''
+    Returns (path within the bundle, size) pairs for every file in the bundle
+    of a notebook, from stat alone and without copying anything.
+
+    :param abs_nb_path: The path to the notebook
+    :param tools: The notebook.bundler.tools module or None
+    :param analysis: NotebookAnalysis of the notebook, read if not given
+    '''
+    analysis = analysis or analyze(abs_nb_path)
+    sizes = [('index.ipynb', analysis.stat.st_size)]
+    if tools is not None:
+        notebook_dir = os.path.dirname(abs_nb_path)
+        for filename in analysis.get_file_references(tools):
+            try:
+                st = os.stat(pjoin(notebook_dir, filename))
+            except OSError:
+                continue
+            sizes.append((filename, st.st_size))
+    for src_dir, dest_dir in get_declarative_widgets_dirs(abs_nb_path, None,
+                                                          analysis):
+        sizes.extend((arcname, size) for arcname, _, size, _
+                     in paths.get_index(src_dir, dest_dir).entries)
+    return sizes
+
+
+def preflight(abs_nb_path, tools, analysis=None):
+    '''
+    Checks the bundle of a notebook against DASHBOARD_BUNDLER_MAX_FILE_SIZE
+    and DASHBOARD_BUNDLER_MAX_BUNDLE_SIZE before any work is done on it.
+    Raises HTTP 413 if it is too large, returns its uncompressed size
+    otherwise.
+
+    :param abs_nb_path: The path to the notebook
+    :param tools: The notebook.bundler.tools module or None
+    :param analysis: NotebookAnalysis of the notebook, read if not given
+    '''
+    return limits.check(os.path.basename(abs_nb_path),
+                        bundle_sizes(abs_nb_path, tools, analysis))
+
+
+def staging_estimate(abs_nb_path, tools, area):
+    '''
+    Returns the bytes of staging space to reserve for bundling a notebook:
+    enough to copy every file of the bundle and to store them uncompressed
+    in its archive. Returns 0 without looking at the files if the staging
+    area has no quota.
+
+    :param abs_nb_path: The path to the notebook
+    :param tools: The notebook.bundler.tools module or None
+    :param area: StagingArea in which the bundle will be staged
+    '''
+    if not area.quota:
+        return 0
+    return 2 * sum(size for _, size in bundle_sizes(abs_nb_path, tools))
+
+
+def list_bundle_contents(abs_nb_path, tools, widget_folder=None,
+                         analysis=None):
+    '''
+    Lists the files that make up the bundle of a notebook without copying
+    them anywhere. Returns a list of (path within the bundle, absolute path)
+    pairs with the notebook itself first as index.ipynb, and a list of
+    precompressed widget asset fragments to splice into the bundle, opened
+    for reading. The caller must close the fragments.
+
+    :param abs_nb_path: The path to the notebook
+    :param tools: The notebook.bundler.tools module or None
+    :param widget_folder: Subfolder name in which the widgets should be contained.
+    :param analysis: NotebookAnalysis of the notebook, read if not given
+    '''
+    analysis = analysis or analyze(abs_nb_path)
+    preflight(abs_nb_path, tools, analysis)
+    # Include the notebook as index.ipynb to make the final URL cleaner
+    # and for consistency
+    files = [('index.ipynb', abs_nb_path)]
 
-    # Install the widget components into the output components directory
-    shutil.copytree(widgets_components_dir, output_components_dir)
+    # Include frontend files referenced via the jupyter_cms bundle mechanism
+    if tools is not None:
+        notebook_dir = os.path.dirname(abs_nb_path)
+        for filename in analysis.get_file_references(tools):
+            path = pjoin(notebook_dir, filename)
+            # Skip any files that do not exist like tools.copy_filelist
+            if os.path.isfile(path):
+                files.append((filename, path))
+
+    fragments = []
+    widgets_dirs = get_declarative_widgets_dirs(abs_nb_path, widget_folder,
+                                                analysis)
+    if widgets_dirs:
+        fragment = widget_assets.get_fragment(widgets_dirs)
+        if fragment is not None:
+            fragments.append(fragment)
+        else:
+            for src_dir, dest_dir in widgets_dirs:
+                files.extend(paths.get_index(src_dir, dest_dir).files)
+    return files, fragments
 
 
-def make_upload_bundle(abs_nb_path, staging_dir, tools):
+def make_upload_bundle(abs_nb_path, staging_dir, tools, analysis=None,
+                       metrics=None):
     '''
     Assembles the notebook and resources it needs, returning the path to a
     zip file bundling the notebook and its requirements if there are any,
     the notebook's path otherwise.
     :param abs_nb_path: The path to the notebook
     :param staging_dir: Temporary work directory, created and removed by the
-        caller
+        caller. Files in it are hardlinks or reflinks of the originals when
+        possible, so they must never be modified in place.
+    :param analysis: NotebookAnalysis of the notebook, read if not given. The
+        notebook is parsed once and the analysis shared by every stage.
+    :param metrics: RequestMetrics timing the stages of the request
+
+    If DASHBOARD_BUNDLER_LEAN is set, the bundled notebook is a rewritten
+    copy without its stored outputs, so a bundle is made even if the
+    notebook needs nothing else.
     '''
+    metrics = metrics or RequestMetrics('server_upload', abs_nb_path)
+    with metrics.stage('analyze') as stage:
+        analysis = analysis or analyze(abs_nb_path)
+        stage.bytes_read = analysis.stat.st_size
+
+    # Fail fast on bundles over the size limits, before copying anything
+    with metrics.stage('preflight'):
+        preflight(abs_nb_path, tools, analysis)
+
     # Clean up bundle dir if it exists
     shutil.rmtree(staging_dir, True)
     os.makedirs(staging_dir)
 
     # Include the notebook as index.ipynb to make the final URL cleaner
     # and for consistency
-    shutil.copy2(abs_nb_path, os.path.join(staging_dir, 'index.ipynb'))
-    # Include frontend files referenced via the jupyter_cms bundle mechanism
-    bundle_file_references(staging_dir, abs_nb_path, tools)
-    bundle_declarative_widgets(staging_dir, abs_nb_path, widget_folder=None)
+    index_path = os.path.join(staging_dir, 'index.ipynb')
+    mode = lean.lean_mode()
+    if mode:
+        # Write a new file rather than editing the staged notebook, which
+        # may be a link to the original
+        with metrics.stage('lean') as stage:
+            lean_size, stage.files, outputs_size = lean.write_lean_bundle(
+                analysis, index_path, staging_dir, mode)
+            stage.bytes_read = analysis.stat.st_size
+            stage.bytes_written = lean_size + outputs_size
+            metrics.lean(analysis.stat.st_size, stage.bytes_written)
+
+    with metrics.stage('file_references') as stage:
+        if not mode:
+            stage_file(abs_nb_path, index_path)
+        # Include frontend files referenced via the jupyter_cms bundle
+        # mechanism
+        stage.files, stage.bytes_read = bundle_file_references(
+            staging_dir, abs_nb_path, tools, analysis)
+        if not mode:
+            stage.files += 1
+            stage.bytes_read += analysis.stat.st_size
+
+    # Splice in the precompressed widget assets if they are cached rather
+    # than copying and compressing thousands of component files again
+    fragments = []
+    with metrics.stage('declarative_widgets') as stage:
+        widgets_dirs = get_declarative_widgets_dirs(abs_nb_path, None,
+                                                    analysis)
+        if widgets_dirs:
+            fragment = widget_assets.get_fragment(widgets_dirs)
+            if fragment is not None:
+                fragments.append(fragment)
+            else:
+                stage.files, stage.bytes_read = bundle_declarative_widgets(
+                    staging_dir, abs_nb_path, None, analysis)
 
     # if nothing else was required, indicate to upload the notebook itself
-    if len(os.listdir(staging_dir)) == 1:
+    if len(os.listdir(staging_dir)) == 1 and not fragments:
+        if mode:
+            # Keep the file name of the original notebook
+            lean_path = staging_dir + '.ipynb'
+            os.rename(index_path, lean_path)
+            metrics.archive(os.path.getsize(lean_path))
+            return lean_path
+        metrics.archive(analysis.stat.st_size)
         return abs_nb_path
 
-    zip_file = shutil.make_archive(staging_dir, format='zip',
-                                   root_dir=staging_dir, base_dir='.')
-    return zip_file
+    store = artifacts.get_store() if artifacts.share_bundles() else None
+    try:
+        with metrics.stage('archive') as stage:
+            files = widget_assets.walk_files(staging_dir, '')
+            if store is None:
+                zip_path = write_zip(staging_dir + '.zip', files, fragments)
+            else:
+                # Reuse the archive if another notebook server of the same
+                # user already built it from identical files
+                zip_path = staging_dir + '.zip'
+                indexes = [paths.get_index(src_dir, dest_dir)
+                           for src_dir, dest_dir in widgets_dirs] \
+                    if fragments else []
+                with open(zip_path, 'wb') as f:
+                    found = store.copy_or_create(
+                        artifacts.private_key(archive_key(files, indexes)),
+                        lambda out: _write_chunks(out, iter_zip(files,
+                                                                fragments)),
+                        f, private=True)
+                metrics.cache_lookup(found)
+            stage.files = len(files)
+            stage.bytes_written = os.path.getsize(zip_path)
+    finally:
+        for fragment in fragments:
+            fragment.close()
+    metrics.archive(stage.bytes_written)
+    return zip_path
+
+
+def _write_chunks(f, chunks):
+    for chunk in chunks:
+        f.write(chunk)
 
 
-def send_file(file_path, dashboard_name, handler):
+def archive_key(files, indexes=()):
     '''
-    Posts a file to the Jupyter Dashboards Server to be served as a dashboard
+    Returns a hex digest identifying the zip archive of the given files and
+    of the widget asset fragments of the given AssetIndexes by their names
+    and contents, for the shared artifact store. Archives are deterministic,
+    so equal keys mean identical archives.
+
+    :param files: (path within the bundle, absolute path) pairs
+    :param indexes: AssetIndexes of the fragments spliced into the archive
+    '''
+    h = hashlib.sha256(u'archive\0{}\0{}\n'.format(
+        compression_level(), zlib.ZLIB_VERSION).encode('utf-8'))
+    for arcname, path in sorted(files):
+        h.update(u'{}\0{}\n'.format(arcname,
+                                    paths.file_digest(path)).encode('utf-8'))
+    for index in indexes:
+        h.update(u'fragment\0{}\n'.format(index.content_digest).encode('utf-8'))
+    return h.hexdigest()
+
+
+def auth_headers():
+    '''
+    Returns the HTTP headers authenticating requests to the dashboard server.
+    '''
+    headers = {}
+    token = os.getenv('DASHBOARD_SERVER_AUTH_TOKEN')
+    if token:
+        headers['Authorization'] = 'token {}'.format(token)
+    return headers
+
+
+def post_file(upload_url, file_path):
+    '''
+    Posts a file to the given dashboard server upload URL. Blocks until the
+    server responds, so call it from the bundler thread pool.
+
+    The multipart body is streamed from disk rather than built in memory.
+    :param upload_url: The dashboard server URL to which to post the file
     :param file_path: The path of the file to send
+    '''
+    verify = not skip_ssl_verification()
+    session = sessions.get_session(upload_url, verify)
+    with MultipartFile(file_path) as body:
+        headers = auth_headers()
+        headers['Content-Type'] = body.content_type
+        data = body.chunked() if chunked_upload() else body
+        return session.post(upload_url, data=data, headers=headers,
+                            timeout=sessions.timeout(), verify=verify)
+
+
+def get_dashboard_server(protocol, hostname, port):
+    '''
+    Returns the root URL of the dashboard server from DASHBOARD_SERVER_URL,
+    interpolating the protocol, hostname and port of the notebook server
+    request, or None if no dashboard server is configured.
+    '''
+    # Treat empty as undefined
+    dashboard_server = os.getenv('DASHBOARD_SERVER_URL')
+    if dashboard_server:
+        return dashboard_server.format(protocol=protocol, hostname=hostname,
+                                       port=port)
+
+
+def get_dashboard_servers(protocol, hostname, port):
+    '''
+    Returns the root URLs of every dashboard server to deploy to, from the
+    comma or whitespace separated DASHBOARD_SERVER_URLS or else from
+    DASHBOARD_SERVER_URL, interpolating the protocol, hostname and port of the
+    notebook server request. Returns an empty list if no dashboard server is
+    configured.
+    '''
+    urls = os.getenv('DASHBOARD_SERVER_URLS', '').replace(',', ' ').split()
+    if urls:
+        return [url.format(protocol=protocol, hostname=hostname, port=port)
+                for url in urls]
+    dashboard_server = get_dashboard_server(protocol, hostname, port)
+    return [dashboard_server] if dashboard_server else []
+
+
+def deploy_quorum(count):
+    '''
+    Returns how many of count dashboard servers must accept a deploy for it
+    to succeed, from DASHBOARD_SERVER_QUORUM (default: all of them).
+    '''
+    quorum = int(os.getenv('DASHBOARD_SERVER_QUORUM') or count)
+    return max(1, min(quorum, count))
+
+
+class TargetResult(object):
+    '''Outcome of uploading a bundle to one dashboard server.'''
+    def __init__(self, dashboard_server, response=None, error=None):
+        self.dashboard_server = dashboard_server
+        self.response = response
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.response is not None and self.response.status_code < 400
+
+    def __str__(self):
+        if self.error is not None:
+            outcome = str(self.error) or self.error.__class__.__name__
+        else:
+            outcome = 'HTTP {}'.format(self.response.status_code)
+        return '{}: {}'.format(self.dashboard_server, outcome)
+
+
+def upload_bundles(file_path, dashboard_name, dashboard_servers, metrics=None):
+    '''
+    Uploads the same bundle to every given dashboard server concurrently.
+    Blocks until all of them respond or fail, so call it from the bundler
+    thread pool. Returns a TargetResult per server, in the same order.
+
+    :param file_path: The path of the zip or notebook file to send
     :param dashboard_name: The dashboard name under which it should be made
         available
+    :param dashboard_servers: Root URLs of the dashboard servers
+    :param metrics: RequestMetrics timing the stages of the request
+    '''
+    def upload(dashboard_server):
+        try:
+            return TargetResult(dashboard_server, upload_bundle(
+                file_path, dashboard_name, dashboard_server, metrics))
+        except Exception as ex:
+            app_log.debug('Upload of %s to %s failed', dashboard_name,
+                          dashboard_server, exc_info=True)
+            return TargetResult(dashboard_server, error=ex)
+
+    if len(dashboard_servers) == 1:
+        return [upload(dashboard_servers[0])]
+    # Each upload streams the bundle from disk on its own thread, so that a
+    # slow server does not hold up the others
+    pool = ThreadPoolExecutor(max_workers=len(dashboard_servers))
+    try:
+        return list(pool.map(upload, dashboard_servers))
+    finally:
+        pool.shutdown()
+
+
+def get_deploy_link(results, dashboard_name, file_path, protocol, hostname,
+                    port):
+    '''
+    Returns the link to a dashboard deployed to enough dashboard servers to
+    meet the quorum, from the first server that accepted it. Raises an
+    HTTPError otherwise: the status of the dashboard server if there is only
+    one, 502 if there are several.
+
+    :param results: TargetResults of the uploads of the bundle
+    :param dashboard_name: The dashboard name under which it was deployed
+    :param file_path: The path of the bundle, for error messages
+    '''
+    succeeded = [result for result in results if result.ok]
+    failed = [result for result in results if not result.ok]
+    for result in failed:
+        app_log.warning('Deploying %s to %s', dashboard_name, result)
+    quorum = deploy_quorum(len(results))
+    if len(succeeded) < quorum:
+        size = limits.format_size(os.path.getsize(file_path))
+        if len(results) == 1:
+            result = results[0]
+            if result.error is not None:
+                raise result.error
+            raise web.HTTPError(result.response.status_code,
+                                'Dashboard server rejected %s (%s): %s',
+                                dashboard_name, size, result.response.reason)
+        raise web.HTTPError(502, 'Deployed %s (%s) to %d of %d dashboard '
+                            'servers, %d required: %s', dashboard_name, size,
+                            len(succeeded), len(results), quorum,
+                            '; '.join(str(result) for result in failed))
+    first = succeeded[0]
+    return get_redirect_link(first.response, first.dashboard_server,
+                             dashboard_name, protocol, hostname, port)
+
+
+class DeployResult(object):
+    '''Outcome of deploying a notebook to the dashboard servers.'''
+    def __init__(self, link, unchanged=False, bytes=0, targets=()):
+        self.link = link
+        self.unchanged = unchanged
+        self.bytes = bytes
+        self.targets = list(targets)
+
+
+def check_unchanged(abs_nb_path, tools, dashboard_servers, force=False,
+                    metrics=None):
+    '''
+    Starts the deploy of a notebook: raises HTTP 500 if there is no
+    dashboard server to deploy to, then fingerprints the notebook if
+    DASHBOARD_SERVER_SKIP_UNCHANGED is set. Returns the fingerprint, or None,
+    and the link to the dashboard if it is unchanged since its last deploy
+    and not forced, or None.
+
+    :param abs_nb_path: The path to the notebook
+    :param tools: The notebook.bundler.tools module
+    :param dashboard_servers: Root URLs of the dashboard servers
+    :param force: Deploy even if unchanged since the last deploy
+    :param metrics: RequestMetrics timing the stages of the deploy
+    '''
+    metrics = metrics or RequestMetrics('server_upload', abs_nb_path)
+    if not dashboard_servers:
+        access_log.debug('Can not deploy, DASHBOARD_SERVER_URL not set')
+        raise web.HTTPError(500, log_message='No dashboard server configured')
+    if not fingerprints.skip_unchanged_enabled():
+        return None, None
+
+    notebook_name = os.path.splitext(os.path.basename(abs_nb_path))[0]
+    with metrics.stage('fingerprint'):
+        fingerprint = bundle_fingerprint(abs_nb_path, tools,
+                                         deploy_target(dashboard_servers))
+    link = None if force else fingerprints.lookup(notebook_name, fingerprint)
+    if link:
+        app_log.info('Dashboard %s is unchanged since its last deploy',
+                     notebook_name)
+    return fingerprint, link
+
+
+def deploy_staged(abs_nb_path, tools, dashboard_servers, protocol, hostname,
+                  port, staging_dir, fingerprint=None, metrics=None):
+    '''
+    Bundles a notebook in a directory of the staging area and uploads it to
+    the dashboard servers, then records its fingerprint if every server
+    accepted it. Blocks until done. Returns a DeployResult and raises an
+    HTTPError if the deploy failed.
+
+    :param staging_dir: Directory acquired from the staging area
+    :param fingerprint: Fingerprint returned by check_unchanged
+    '''
+    metrics = metrics or RequestMetrics('server_upload', abs_nb_path)
+    notebook_name = os.path.splitext(os.path.basename(abs_nb_path))[0]
+    try:
+        bundled = make_upload_bundle(abs_nb_path,
+                                     os.path.join(staging_dir, notebook_name),
+                                     tools, metrics=metrics)
+        targets = upload_bundles(bundled, notebook_name, dashboard_servers,
+                                 metrics)
+        result = DeployResult(
+            get_deploy_link(targets, notebook_name, bundled, protocol,
+                            hostname, port),
+            bytes=os.path.getsize(bundled), targets=targets)
+    except Exception:
+        if fingerprint is not None:
+            fingerprints.forget(notebook_name)
+        raise
+    if fingerprint is not None:
+        # Servers that missed the deploy must get it next time, even if the
+        # quorum was met
+        if all(target.ok for target in targets):
+            fingerprints.record(notebook_name, fingerprint, result.link)
+        else:
+            fingerprints.forget(notebook_name)
+    return result
+
+
+def deploy(abs_nb_path, tools, dashboard_servers, protocol, hostname, port,
+           force=False, metrics=None):
+    '''
+    Bundles a notebook and uploads it to the dashboard servers, unless it is
+    unchanged since its last deploy and not forced. Blocks until done,
+    waiting for room in the staging area too, so call it from a worker
+    thread of its own rather than the bundler thread pool. Returns a
+    DeployResult and raises an HTTPError if the deploy failed.
+
+    Background jobs and batch deploys share it. The Deploy as menu item runs
+    the same steps, but waits for the staging area on the IOLoop.
+
+    :param abs_nb_path: The path to the notebook
+    :param tools: The notebook.bundler.tools module
+    :param dashboard_servers: Root URLs of the dashboard servers
+    :param protocol: Protocol interpolated into the redirect link
+    :param hostname: Hostname interpolated into the redirect link
+    :param port: Port interpolated into the redirect link
+    :param force: Deploy even if unchanged since the last deploy
+    :param metrics: RequestMetrics timing the stages of the deploy
+    '''
+    metrics = metrics or RequestMetrics('server_upload', abs_nb_path)
+    fingerprint, link = check_unchanged(abs_nb_path, tools, dashboard_servers,
+                                        force, metrics)
+    if link:
+        return DeployResult(link, unchanged=True)
+
+    area = get_area()
+    tmp_dir = None
+    try:
+        with metrics.stage('queue'):
+            tmp_dir = area.acquire(staging_estimate(abs_nb_path, tools,
+                                                    area)).result()
+        return deploy_staged(abs_nb_path, tools, dashboard_servers, protocol,
+                             hostname, port, tmp_dir, fingerprint, metrics)
+    finally:
+        if tmp_dir is not None:
+            area.release(tmp_dir)
+
+
+def upload_bundle(file_path, dashboard_name, dashboard_server, metrics=None):
+    '''
+    Uploads a bundle to the dashboard server, only sending the files it does
+    not already have if delta uploads are enabled and supported, or in
+    resumable chunks if resumable uploads are. Blocks until the server
+    responds, so call it from the bundler thread pool. Returns the final
+    server response.
+
+    :param file_path: The path of the zip or notebook file to send
+    :param dashboard_name: The dashboard name under which it should be made
+        available
+    :param dashboard_server: Root URL of the dashboard server
+    :param metrics: RequestMetrics timing the stages of the request
+    '''
+    from notebook.utils import url_path_join
+    metrics = metrics or RequestMetrics('server_upload', file_path)
+    upload_url = url_path_join(dashboard_server, UPLOAD_ENDPOINT,
+                               escape.url_escape(dashboard_name, False))
+    result = None
+    with metrics.stage('upload') as stage:
+        start = time.time()
+        if delta.delta_upload_enabled():
+            # Only send the files the server does not already have
+            stats = {}
+            result = delta.upload(dashboard_server, dashboard_name, file_path,
+                                  auth_headers(), not skip_ssl_verification(),
+                                  timeout=sessions.timeout(), stats=stats)
+            stage.bytes_written = stats.get('bytes_sent', 0)
+        if result is None and resumable.resumable_upload_enabled():
+            # Send the bundle in chunks that survive a dropped connection
+            stats = {}
+            result = resumable.upload(dashboard_server, dashboard_name,
+                                      file_path, auth_headers(),
+                                      not skip_ssl_verification(),
+                                      timeout=sessions.timeout(), stats=stats)
+            stage.bytes_written = stats.get('bytes_sent', 0)
+        if result is None:
+            result = post_file(upload_url, file_path)
+            stage.bytes_written = os.path.getsize(file_path)
+        metrics.upload(stage.bytes_written, result.status_code,
+                       time.time() - start)
+    return result
+
+
+def get_redirect_link(result, dashboard_server, dashboard_name, protocol,
+                      hostname, port):
+    '''
+    Returns the URL of a deployed dashboard from the upload response, or
+    computed from the environment if the response does not include it.
+    '''
+    from notebook.utils import url_path_join
+    # Redirect to link specified in response body
+    res_body = result.json()
+    if 'link' in res_body:
+        return res_body['link']
+
+    # Compute redirect link using environment variables
+    # First try redirect URL as it might be different from
+    # internal upload URL
+    redirect_server = os.getenv('DASHBOARD_REDIRECT_URL')
+    if redirect_server:
+        redirect_root = redirect_server.format(hostname=hostname,
+                                               port=port,
+                                               protocol=protocol)
+    else:
+        redirect_root = dashboard_server
+
+    return url_path_join(redirect_root, VIEW_ENDPOINT,
+                         escape.url_escape(dashboard_name, False))
+
+
+def get_request_host(handler):
+    '''
+    Returns the protocol, hostname and port of the notebook server request,
+    for use in constructing the dashboard server urls.
     '''
-    # Make information about the request Host header available for use in
-    # constructing the urls
     segs = handler.request.host.split(':')
     hostname = segs[0]
     if len(segs) > 1:
         port = segs[1]
     else:
         port = ''
-    protocol = handler.request.protocol
+    return handler.request.protocol, hostname, port
 
-    # Treat empty as undefined
-    dashboard_server = os.getenv('DASHBOARD_SERVER_URL')
-    if dashboard_server:
-        dashboard_server = dashboard_server.format(protocol=protocol,
-                                                   hostname=hostname,
-                                                   port=port)
-        upload_url = url_path_join(dashboard_server, UPLOAD_ENDPOINT,
-                                   escape.url_escape(dashboard_name, False))
-        with open(file_path, 'rb') as file_content:
-            headers = {}
-            token = os.getenv('DASHBOARD_SERVER_AUTH_TOKEN')
-            if token:
-                headers['Authorization'] = 'token {}'.format(token)
-            result = requests.post(upload_url, files={'file': file_content},
-                                   headers=headers, timeout=60, verify=not
-                                   skip_ssl_verification())
-            if result.status_code >= 400:
-                raise web.HTTPError(result.status_code)
-
-        # Redirect to link specified in response body
-        res_body = result.json()
-        if 'link' in res_body:
-            redirect_link = res_body['link']
-        else:
-            # Compute redirect link using environment variables
-            # First try redirect URL as it might be different from
-            # internal upload URL
-            redirect_server = os.getenv('DASHBOARD_REDIRECT_URL')
-            if redirect_server:
-                redirect_root = redirect_server.format(hostname=hostname,
-                                                       port=port,
-                                                       protocol=protocol)
-            else:
-                redirect_root = dashboard_server
 
-            redirect_link = url_path_join(redirect_root, VIEW_ENDPOINT,
-                                          escape.url_escape(dashboard_name,
-                                                            False))
-        handler.redirect(redirect_link)
+@gen.coroutine
+def send_file(file_path, dashboard_name, handler, metrics=None):
+    '''
+    Posts a file to the Jupyter Dashboards Server to be served as a dashboard
+    and redirects to it. Returns the link to the dashboard.
+
+    With several dashboard servers configured, the file is posted to all of
+    them at once, and the redirect happens once enough of them accepted it.
+    :param file_path: The path of the file to send
+    :param dashboard_name: The dashboard name under which it should be made
+        available
+    :param metrics: RequestMetrics timing the stages of the request
+    '''
+    # Make information about the request Host header available for use in
+    # constructing the urls
+    protocol, hostname, port = get_request_host(handler)
+
+    dashboard_servers = get_dashboard_servers(protocol, hostname, port)
+    if dashboard_servers:
+        results = yield run_in_executor(upload_bundles, file_path,
+                                        dashboard_name, dashboard_servers,
+                                        metrics)
+        link = get_deploy_link(results, dashboard_name, file_path, protocol,
+                               hostname, port)
+        handler.redirect(link)
+        raise gen.Return(link)
     else:
         access_log.debug('Can not deploy, DASHBOARD_SERVER_URL not set')
         raise web.HTTPError(500, log_message='No dashboard server configured')
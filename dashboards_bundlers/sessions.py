@@ -0,0 +1,171 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import atexit
+import os
+import threading
+from . import metrics
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+# Transient gateway errors worth retrying. Deploying a dashboard under a
+# given name replaces any previous deploy, so POSTs and PUTs to the dashboard
+# server are idempotent and safe to retry too.
+RETRY_STATUS = (502, 503, 504)
+RETRY_METHODS = frozenset(['HEAD', 'GET', 'PUT', 'POST', 'DELETE'])
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_adapter_class = None
+
+_stats = {'requests': 0, 'connections': 0}
+_stats_lock = threading.Lock()
+
+
+def pool_size():
+    '''
+    Returns the number of keep-alive connections to keep per dashboard
+    server, from DASHBOARD_SERVER_POOL_SIZE (default 4).
+    '''
+    return int(os.getenv('DASHBOARD_SERVER_POOL_SIZE') or 4)
+
+
+def max_retries():
+    '''
+    Returns how many times to retry failed requests to the dashboard server,
+    from DASHBOARD_SERVER_MAX_RETRIES (default 3).
+    '''
+    return int(os.getenv('DASHBOARD_SERVER_MAX_RETRIES') or 3)
+
+
+def retry_backoff():
+    '''
+    Returns the base delay in seconds of the exponential backoff between
+    retries, from DASHBOARD_SERVER_RETRY_BACKOFF (default 0.5).
+    '''
+    return float(os.getenv('DASHBOARD_SERVER_RETRY_BACKOFF') or 0.5)
+
+
+def timeout():
+    '''
+    Returns the timeout in seconds for connecting to the dashboard server
+    and for each read of its responses, from DASHBOARD_SERVER_TIMEOUT
+    (default 60).
+    '''
+    return float(os.getenv('DASHBOARD_SERVER_TIMEOUT') or 60)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+    metrics.inc('pool_{}_total'.format(name))
+
+
+def _get_adapter_class():
+    '''
+    Returns the requests transport adapter counting connections and
+    requests. requests is only imported on the first upload, so that loading
+    the bundlers adds nothing to the notebook server startup time.
+    '''
+    global _adapter_class
+    if _adapter_class is not None:
+        return _adapter_class
+    from requests.adapters import HTTPAdapter
+    from requests.packages.urllib3.connectionpool import (HTTPConnectionPool,
+                                                          HTTPSConnectionPool)
+
+    class _CountingMixin(object):
+        '''Counts new connections and requests sent over pooled connections.'''
+        def _new_conn(self):
+            _count('connections')
+            return super(_CountingMixin, self)._new_conn()
+
+        def _make_request(self, *args, **kwargs):
+            _count('requests')
+            return super(_CountingMixin, self)._make_request(*args, **kwargs)
+
+    class _CountingHTTPConnectionPool(_CountingMixin, HTTPConnectionPool):
+        pass
+
+    class _CountingHTTPSConnectionPool(_CountingMixin, HTTPSConnectionPool):
+        pass
+
+    class _CountingAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super(_CountingAdapter, self).init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                'http': _CountingHTTPConnectionPool,
+                'https': _CountingHTTPSConnectionPool
+            }
+
+    _adapter_class = _CountingAdapter
+    return _adapter_class
+
+
+def _make_retry():
+    from requests.packages.urllib3.util.retry import Retry
+    retries = max_retries()
+    kwargs = dict(total=retries, connect=retries, read=retries,
+                  status=retries, backoff_factor=retry_backoff(),
+                  status_forcelist=RETRY_STATUS, raise_on_status=False)
+    try:
+        return Retry(allowed_methods=RETRY_METHODS, **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=RETRY_METHODS, **kwargs)
+
+
+def get_session(url, verify=True):
+    '''
+    Returns a requests session that keeps connections to the server of the
+    given URL alive and retries transient failures with exponential backoff.
+    Sessions are shared by all bundler threads in the process, one per
+    server and SSL verification setting.
+
+    :param url: Any URL on the dashboard server
+    :param verify: Whether to verify the server SSL certificate
+    '''
+    parts = urlsplit(url)
+    root = '{}://{}/'.format(parts.scheme, parts.netloc)
+    key = (root, bool(verify))
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            import requests
+            size = pool_size()
+            adapter_class = _get_adapter_class()
+            adapter = adapter_class(pool_connections=1, pool_maxsize=size,
+                                    max_retries=_make_retry())
+            session = requests.Session()
+            session.verify = verify
+            session.mount(root, adapter)
+            _sessions[key] = session
+        return session
+
+
+@atexit.register
+def close_sessions():
+    '''Closes all pooled connections. Runs at exit.'''
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def get_pool_stats():
+    '''
+    Returns the number of requests sent to dashboard servers, the number of
+    connections opened to send them and the fraction of requests that reused
+    an already open connection.
+    '''
+    with _stats_lock:
+        stats = dict(_stats)
+    if stats['requests']:
+        stats['reuse_rate'] = max(
+            0.0, 1.0 - float(stats['connections']) / stats['requests'])
+    else:
+        stats['reuse_rate'] = 0.0
+    return stats
@@ -0,0 +1,420 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import atexit
+import errno
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from os.path import join as pjoin
+from tornado.log import app_log
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Linux ioctl asking the filesystem to share the extents of another file
+# (btrfs, XFS, overlayfs on either, ...)
+FICLONE = 0x40049409
+
+# (source device, destination device) pairs on which a method failed, so
+# that every file staged across filesystems does not pay for failed calls
+_no_link = set()
+_no_reflink = set()
+# Errors of os.link meaning the filesystems cannot link src to dst at all,
+# rather than that this one file cannot be linked
+_LINK_UNSUPPORTED = set(getattr(errno, name) for name in
+                        ('EXDEV', 'ENOTSUP', 'EOPNOTSUPP', 'EMLINK', 'ENOSYS')
+                        if hasattr(errno, name))
+# Errors of the FICLONE ioctl meaning the filesystems cannot share extents
+_REFLINK_UNSUPPORTED = set(getattr(errno, name) for name in
+                           ('EOPNOTSUPP', 'ENOTSUP', 'EXDEV', 'EINVAL',
+                            'ENOTTY')
+                           if hasattr(errno, name))
+_lock = threading.Lock()
+
+_PREFIX = 'bundler-'
+_LOCK_SUFFIX = '.lock'
+# Seconds for which a new, not yet locked owner directory is left alone
+_ORPHAN_GRACE = 60
+# Seconds after which owner directories are presumed orphaned where they
+# cannot be locked
+_ORPHAN_TTL = 24 * 3600
+
+_areas = {}
+_areas_lock = threading.Lock()
+_grant_executor = None
+
+
+def _get_grant_executor():
+    '''
+    Returns the thread on which staging directories are created. It is
+    apart from the bundler pool so that grants do not queue behind bundling
+    work, and job and batch threads waiting for them are served at once.
+    '''
+    global _grant_executor
+    with _areas_lock:
+        if _grant_executor is None:
+            _grant_executor = ThreadPoolExecutor(max_workers=1)
+        return _grant_executor
+
+
+def use_links():
+    '''
+    Returns True unless DASHBOARD_BUNDLER_STAGING_LINKS disables staging by
+    hardlink or reflink.
+    '''
+    return os.getenv('DASHBOARD_BUNDLER_STAGING_LINKS', '').lower() not in ['no', 'false']
+
+
+def _reflink(src, dst):
+    with open(src, 'rb') as src_file:
+        # Only ever create dst, so that nothing is written through a link
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    shutil.copystat(src, dst)
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError as ex:
+        if ex.errno != errno.ENOENT:
+            raise
+
+
+def stage_file(src, dst):
+    '''
+    Makes the contents of src available at dst as cheaply as possible: as a
+    hardlink, else as a reflink, else as a copy. Returns the method used.
+
+    Staged files may share storage with their source, so they must be treated
+    as read-only. Replace them with new files rather than writing to them.
+    An existing dst is replaced that way too, never written to.
+    '''
+    _unlink(dst)
+    if use_links():
+        devices = (os.stat(src).st_dev,
+                   os.stat(os.path.dirname(dst) or '.').st_dev)
+        if devices not in _no_link and hasattr(os, 'link'):
+            try:
+                os.link(src, dst)
+                return 'link'
+            except OSError as ex:
+                if ex.errno in _LINK_UNSUPPORTED:
+                    with _lock:
+                        _no_link.add(devices)
+        if devices not in _no_reflink and fcntl is not None:
+            try:
+                _reflink(src, dst)
+                return 'reflink'
+            except (IOError, OSError) as ex:
+                _unlink(dst)
+                if ex.errno in _REFLINK_UNSUPPORTED:
+                    with _lock:
+                        _no_reflink.add(devices)
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as ex:
+        if ex.errno != errno.EEXIST:
+            raise
+
+
+def stage_filelist(src, dst, src_relative_filenames):
+    '''
+    Stages the given list of files, relative to src, into dst like
+    notebook.bundler.tools.copy_filelist: creates parent directories as
+    needed and skips any files that do not exist. Returns the number of files
+    staged and their total size.
+    '''
+    count = size = 0
+    for filename in src_relative_filenames:
+        # Only consider the file if it exists in src
+        if os.path.isfile(pjoin(src, filename)):
+            parent_relative = os.path.dirname(filename)
+            if parent_relative:
+                _makedirs(pjoin(dst, parent_relative))
+            stage_file(pjoin(src, filename), pjoin(dst, filename))
+            count += 1
+            size += os.path.getsize(pjoin(dst, filename))
+    return count, size
+
+
+def stage_tree(src, dst):
+    '''
+    Stages every file under src into dst like shutil.copytree, following
+    symlinks. Returns the number of files staged and their total size.
+    '''
+    count = size = 0
+    _makedirs(dst)
+    for root, dirs, filenames in os.walk(src, followlinks=True):
+        rel_root = os.path.relpath(root, src)
+        for d in dirs:
+            _makedirs(pjoin(dst, rel_root, d))
+        for filename in filenames:
+            dst_file = pjoin(dst, rel_root, filename)
+            stage_file(pjoin(root, filename), dst_file)
+            count += 1
+            size += os.path.getsize(dst_file)
+    return count, size
+
+
+def staging_root():
+    '''
+    Returns the directory under which bundles are staged, from
+    DASHBOARD_BUNDLER_STAGING_DIR (default: dashboards_bundlers in the system
+    temporary directory).
+    '''
+    return (os.getenv('DASHBOARD_BUNDLER_STAGING_DIR') or
+            pjoin(tempfile.gettempdir(), 'dashboards_bundlers'))
+
+
+def staging_quota():
+    '''
+    Returns the bytes of staging space that bundles being assembled at once
+    may reserve in total, from DASHBOARD_BUNDLER_STAGING_QUOTA (default 0,
+    unlimited).
+    '''
+    return int(os.getenv('DASHBOARD_BUNDLER_STAGING_QUOTA') or 0)
+
+
+def max_staging():
+    '''
+    Returns the number of bundles staged at once, from
+    DASHBOARD_BUNDLER_MAX_STAGING (default 4, 0 for unlimited).
+    '''
+    return int(os.getenv('DASHBOARD_BUNDLER_MAX_STAGING') or 4)
+
+
+def get_area():
+    '''Returns the staging area for the current settings.'''
+    root, quota, slots = staging_root(), staging_quota(), max_staging()
+    key = (root, quota, slots)
+    with _areas_lock:
+        area = _areas.get(key)
+        if area is None:
+            area = _areas[key] = StagingArea(root, quota, slots)
+        return area
+
+
+class StagingArea(object):
+    '''
+    Temporary directories in which bundles are assembled, handed out to at
+    most slots requests at once and within a quota of reserved bytes.
+    Requests beyond either limit wait their turn in arrival order.
+
+    Each process stages under a directory of its own, next to a lock file
+    it holds while it runs. Directories whose lock is no longer held were
+    left behind by a process that died mid-bundle, and are removed the next
+    time an area is started on the same root.
+    '''
+    def __init__(self, root, quota=0, slots=0):
+        '''
+        :param root: Directory under which to stage
+        :param quota: Total bytes that may be reserved at once, 0 for
+            unlimited
+        :param slots: Number of directories handed out at once, 0 for
+            unlimited
+        '''
+        self.root = root
+        self.quota = quota
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._count = 0
+        self._used = 0
+        self._sizes = {}
+        self._waiting = deque()
+        self._owner_dir = None
+        self._owner_file = None
+
+    def start(self):
+        '''
+        Removes the directories orphaned by dead processes and creates the
+        directory of this process, once. Returns the latter.
+        '''
+        with self._start_lock:
+            if self._owner_dir is not None:
+                return self._owner_dir
+            try:
+                os.makedirs(self.root)
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise
+            else:
+                # Let every user of the host stage there, like in /tmp
+                os.chmod(self.root, 0o1777)
+            removed = self.sweep()
+            if removed:
+                app_log.info('Removed %d orphaned staging directories from %s',
+                             removed, self.root)
+            # Lock before creating the directory so it is never unowned. A
+            # sweep in another process may hold the lock briefly while it
+            # finds the lock file too recent to be orphaned.
+            fd, lock_path = tempfile.mkstemp(dir=self.root, prefix=_PREFIX,
+                                             suffix=_LOCK_SUFFIX)
+            f = os.fdopen(fd, 'w')
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            f.write(str(os.getpid()))
+            f.flush()
+            owner_dir = lock_path[:-len(_LOCK_SUFFIX)]
+            os.mkdir(owner_dir)
+            self._owner_file = f
+            self._owner_dir = owner_dir
+            atexit.register(self.close)
+            return owner_dir
+
+    def close(self):
+        '''Removes the directory of this process and releases its lock.'''
+        with self._start_lock:
+            if self._owner_dir is None:
+                return
+            shutil.rmtree(self._owner_dir, True)
+            try:
+                os.remove(self._owner_dir + _LOCK_SUFFIX)
+            except OSError:
+                pass
+            self._owner_file.close()
+            self._owner_dir = self._owner_file = None
+
+    def sweep(self):
+        '''
+        Removes the staging directories of processes that are no longer
+        running. Returns the number of directories removed.
+        '''
+        try:
+            names = os.listdir(self.root)
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                raise
+            return 0
+        # Where locks are unavailable, only very old directories are removed
+        expired = time.time() - (_ORPHAN_GRACE if fcntl is not None
+                                 else _ORPHAN_TTL)
+        removed = 0
+        for name in names:
+            if not name.startswith(_PREFIX):
+                continue
+            path = pjoin(self.root, name)
+            if name.endswith(_LOCK_SUFFIX):
+                if _remove_orphan(path[:-len(_LOCK_SUFFIX)], path, expired):
+                    removed += 1
+            elif not os.path.exists(path + _LOCK_SUFFIX):
+                try:
+                    if os.stat(path).st_mtime >= expired:
+                        continue
+                except OSError:
+                    continue
+                shutil.rmtree(path, True)
+                removed += 1
+        return removed
+
+    def _fits(self, size):
+        if self.slots and self._count >= self.slots:
+            return False
+        # A bundle larger than the quota is staged alone
+        return not (self.quota and self._count and
+                    self._used + size > self.quota)
+
+    def acquire(self, size=0):
+        '''
+        Returns a Future resolving to a new empty directory once size bytes
+        of staging space and a slot are available. Tornado coroutines can
+        yield it and threads wait on its result. Only bookkeeping happens in
+        the caller, and the directory is created on a thread of its own.
+        Pass the directory to release once done with it.
+
+        :param size: Estimated bytes the directory will hold
+        '''
+        future = Future()
+        with self._lock:
+            granted = not self._waiting and self._fits(size)
+            if granted:
+                self._count += 1
+                self._used += size
+            else:
+                self._waiting.append((size, future))
+                waiting = len(self._waiting)
+        if granted:
+            _get_grant_executor().submit(self._grant, size, future)
+        else:
+            app_log.info('Staging area %s is full, %d bundles waiting',
+                         self.root, waiting)
+        return future
+
+    def _grant(self, size, future):
+        try:
+            owner_dir = self.start()
+            if fcntl is None:
+                # Show other processes this one is alive
+                os.utime(owner_dir + _LOCK_SUFFIX, None)
+            path = tempfile.mkdtemp(dir=owner_dir)
+        except Exception as ex:
+            self._free(size)
+            future.set_exception(ex)
+            return
+        with self._lock:
+            self._sizes[path] = size
+        future.set_result(path)
+
+    def _free(self, size):
+        granted = []
+        with self._lock:
+            self._count -= 1
+            self._used -= size
+            while self._waiting and self._fits(self._waiting[0][0]):
+                size, future = self._waiting.popleft()
+                self._count += 1
+                self._used += size
+                granted.append((size, future))
+        for size, future in granted:
+            _get_grant_executor().submit(self._grant, size, future)
+
+    def release(self, path):
+        '''
+        Removes a directory handed out by acquire and lets the next waiting
+        request have its space.
+        '''
+        shutil.rmtree(path, True)
+        with self._lock:
+            size = self._sizes.pop(path)
+        self._free(size)
+
+
+def _remove_orphan(owner_dir, lock_path, expired):
+    '''
+    Removes the staging directory of another process and its lock file if
+    the process no longer holds the lock. Returns True if it did.
+    '''
+    try:
+        f = open(lock_path, 'a')
+    except IOError:
+        # Removed already, or owned by another user
+        return False
+    with f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                # Still running
+                return False
+        if os.fstat(f.fileno()).st_mtime >= expired:
+            return False
+        shutil.rmtree(owner_dir, True)
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+    return True
@@ -0,0 +1,125 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import hashlib
+import os
+import zlib
+from os.path import join as pjoin
+from . import cache
+from .artifacts import get_store
+from .executor import get_compression_executor
+from .paths import get_index
+from .zipstream import compression_level, verify_fragment, write_fragment
+
+# Bump whenever the fragment format or its contents change meaning
+_FRAGMENT_VERSION = '3'
+
+
+def cache_dir():
+    '''
+    Returns the directory holding the bundler caches, from
+    DASHBOARD_BUNDLER_CACHE_DIR or under the Jupyter data directory.
+    '''
+    from jupyter_core.paths import jupyter_data_dir
+    return (os.getenv('DASHBOARD_BUNDLER_CACHE_DIR') or
+            pjoin(jupyter_data_dir(), 'dashboards_bundlers', 'cache'))
+
+
+def cache_size():
+    '''
+    Returns the maximum total size in bytes of the fragment cache, from
+    DASHBOARD_BUNDLER_CACHE_SIZE (default 256 MiB). Zero disables the cache.
+    '''
+    return int(os.getenv('DASHBOARD_BUNDLER_CACHE_SIZE') or 256 * 1024 * 1024)
+
+
+def get_cache():
+    '''
+    Returns the fragment cache for the current settings or None if caching
+    is disabled.
+    '''
+    return cache.get_cache(pjoin(cache_dir(), 'fragments'), cache_size())
+
+
+def walk_files(src_dir, dest_dir):
+    '''
+    Lists all files under src_dir, following symlinks like shutil.copytree.
+    Returns a sorted list of (path under dest_dir, absolute path) pairs.
+    '''
+    files = []
+    for root, dirs, filenames in os.walk(src_dir, followlinks=True):
+        dirs.sort()
+        rel_root = os.path.relpath(root, src_dir)
+        for filename in sorted(filenames):
+            files.append((os.path.normpath(pjoin(dest_dir, rel_root, filename)),
+                          pjoin(root, filename)))
+    return files
+
+
+def fingerprint(indexes, compresslevel):
+    '''
+    Returns a hex digest identifying the files of the given AssetIndexes by
+    their names, sizes and modification times, and the compression level.
+    Installing or upgrading the widgets extension changes the fingerprint
+    without any file being read.
+    '''
+    h = hashlib.sha1(u'{}\0{}\n'.format(_FRAGMENT_VERSION,
+                                          compresslevel).encode('utf-8'))
+    for index in indexes:
+        h.update(u'{}\n'.format(index.digest).encode('utf-8'))
+    return h.hexdigest()
+
+
+def content_key(indexes, compresslevel):
+    '''
+    Returns a hex digest identifying the fragment of the given AssetIndexes
+    by the names and contents of their files, the compression level and the
+    zlib version, for the shared artifact store.
+    '''
+    h = hashlib.sha256(u'fragment\0{}\0{}\0{}\n'.format(
+        _FRAGMENT_VERSION, compresslevel, zlib.ZLIB_VERSION).encode('utf-8'))
+    for index in indexes:
+        h.update(u'{}\n'.format(index.content_digest).encode('utf-8'))
+    return h.hexdigest()
+
+
+def get_fragment(asset_dirs):
+    '''
+    Returns a precompressed fragment holding every file under the given
+    asset directories opened for reading, building and caching it on first
+    use. The caller must close it. Returns None if caching is disabled.
+
+    If a shared artifact store is configured, fragments built by other
+    notebook servers from identical files are copied from it rather than
+    compressed again, and fragments built here are added to it. Fragments
+    from the store are only used once checked against the local files.
+
+    :param asset_dirs: List of (source directory, output directory) pairs as
+        returned by server_upload.get_declarative_widgets_dirs
+    '''
+    fragments = get_cache()
+    if fragments is None:
+        return None
+    indexes = [get_index(src_dir, dest_dir) for src_dir, dest_dir in asset_dirs]
+    files = []
+    for index in indexes:
+        files.extend(index.files)
+    compresslevel = compression_level()
+    key = fingerprint(indexes, compresslevel) + '.frag'
+
+    def write(f):
+        write_fragment(files, f, compresslevel,
+                       executor=get_compression_executor())
+
+    store = get_store()
+    if store is None:
+        return fragments.open_or_create(key, write)
+
+    def verify(f):
+        digests = {}
+        for index in indexes:
+            for arcname, size, digest in index.file_digests:
+                digests[arcname] = (size, digest)
+        return verify_fragment(f, digests)
+    return fragments.open_or_create(key, lambda f: store.copy_or_create(
+        content_key(indexes, compresslevel), write, f, verify=verify))
@@ -0,0 +1,569 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import hashlib
+import itertools
+import json
+import os
+import struct
+import zlib
+from collections import deque
+from .executor import compression_threads, get_compression_executor
+
+# Size of the byte chunks read from disk and handed to the caller
+CHUNK_SIZE = 64 * 1024
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_DATA_DESCRIPTOR = struct.Struct('<IIII')
+_DATA_DESCRIPTOR64 = struct.Struct('<IIQQ')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_RECORD = struct.Struct('<IHHHHIIH')
+_END_RECORD64 = struct.Struct('<IQHHIIQQQQ')
+_END_LOCATOR64 = struct.Struct('<IIQI')
+_EXTRA_HEADER = struct.Struct('<HH')
+
+_LOCAL_HEADER_SIG = 0x04034b50
+_DATA_DESCRIPTOR_SIG = 0x08074b50
+_CENTRAL_HEADER_SIG = 0x02014b50
+_END_RECORD_SIG = 0x06054b50
+_END_RECORD64_SIG = 0x06064b50
+_END_LOCATOR64_SIG = 0x07064b50
+_EXTRA_ZIP64 = 0x0001
+
+# Like zipfile, switch to zip64 records for files, archives and entry
+# counts past these limits. Entries of files past the size limit carry
+# zip64 sizes from the start since their compressed size is not known in
+# advance.
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_FILECOUNT_LIMIT = 0xffff
+_MAX32 = 0xffffffff
+_MAX16 = 0xffff
+
+# Sizes and CRC follow the entry data in a data descriptor
+_FLAG_DATA_DESCRIPTOR = 0x08
+# File names are encoded as UTF-8
+_FLAG_UTF8 = 0x800
+
+_VERSION_NEEDED = 20
+_VERSION_NEEDED64 = 45
+# Made by a UNIX host so that external attributes carry file permissions
+_VERSION_MADE_BY = (3 << 8) | 20
+_VERSION_MADE_BY64 = (3 << 8) | 45
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+# Every entry gets the same timestamp, 1980-01-01 00:00, the earliest zip
+# can represent, and the same permissions, rw-r--r--, so that archives of
+# identical files are identical byte for byte wherever and whenever they
+# are built
+DOS_TIME = 0
+DOS_DATE = (1 << 5) | 1
+EXTERNAL_ATTR = 0o100644 << 16
+# Version of the layout of archives, bumped whenever the same files would
+# produce different bytes, so that ETags and cached zips are not reused
+ARCHIVE_VERSION = '2'
+
+# Already compressed formats stored as-is rather than deflated again
+STORED_EXTENSIONS = frozenset([
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico',
+    '.woff', '.woff2', '.eot',
+    '.gz', '.tgz', '.bz2', '.xz', '.zip', '.jar', '.whl',
+    '.mp3', '.mp4', '.ogg', '.webm'
+])
+
+# Files up to this size are compressed on the compression thread pool and
+# held in memory until their turn to be written. Larger files are
+# compressed a chunk at a time as they are written.
+PARALLEL_MAX_SIZE = 1024 * 1024
+
+# Fragments start with this marker and end with their JSON index followed by
+# the index length
+_FRAGMENT_MAGIC = b'DBZFRAG1'
+_FRAGMENT_TRAILER = struct.Struct('<Q')
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    '''
+    Yields the contents of a file as a sequence of byte strings of at most
+    chunk_size bytes.
+    '''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _arcname(arcname):
+    '''Returns the name of an entry as stored in archives.'''
+    return arcname.replace(os.sep, '/')
+
+
+def compression_level():
+    '''
+    Returns the zlib compression level of bundle archives, from
+    DASHBOARD_BUNDLER_COMPRESSION_LEVEL (default 6). Level 0 stores every
+    file uncompressed.
+    '''
+    return int(os.getenv('DASHBOARD_BUNDLER_COMPRESSION_LEVEL') or 6)
+
+
+def compression_method(path, compresslevel):
+    '''Returns the zip method with which to store the file at path.'''
+    if compresslevel == 0:
+        return ZIP_STORED
+    if os.path.splitext(path)[1].lower() in STORED_EXTENSIONS:
+        return ZIP_STORED
+    return ZIP_DEFLATED
+
+
+def _compress(path, method, compresslevel, chunk_size, stats):
+    '''
+    Yields the entry data of the file at path for the given zip method.
+    Fills stats with the crc, compress_size and file_size of the entry once
+    exhausted.
+    '''
+    compressor = None
+    if method == ZIP_DEFLATED:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+    crc = 0
+    file_size = 0
+    compress_size = 0
+    for chunk in read_chunks(path, chunk_size):
+        crc = zlib.crc32(chunk, crc)
+        file_size += len(chunk)
+        data = compressor.compress(chunk) if compressor else chunk
+        if data:
+            compress_size += len(data)
+            yield data
+    if compressor:
+        data = compressor.flush()
+        if data:
+            compress_size += len(data)
+            yield data
+    stats.update(crc=crc & 0xffffffff, compress_size=compress_size,
+                 file_size=file_size)
+
+
+def _compress_all(path, method, compresslevel, chunk_size):
+    '''Compresses a whole file at once. Runs on the compression pool.'''
+    stats = {}
+    chunks = list(_compress(path, method, compresslevel, chunk_size, stats))
+    return chunks, stats
+
+
+def _iter_compressed(files, compresslevel, chunk_size, executor):
+    '''
+    Yields (arcname, path, stat, method, chunks, stats) for each of the given
+    (arcname, path) pairs in order. chunks iterates over the entry data and
+    stats is filled in once it is exhausted.
+
+    With an executor, small files ahead of the one being yielded are
+    compressed concurrently. zlib releases the GIL while compressing, so
+    this spreads the work over several cores. The same chunking is used
+    either way, so the output does not depend on the number of threads.
+    '''
+    window = deque()
+    max_pending = 2 * compression_threads()
+
+    def entry(arcname, path):
+        st = os.stat(path)
+        method = compression_method(path, compresslevel)
+        future = None
+        if executor is not None and st.st_size <= PARALLEL_MAX_SIZE:
+            future = executor.submit(_compress_all, path, method,
+                                     compresslevel, chunk_size)
+        return arcname, path, st, method, future
+
+    def resolve(arcname, path, st, method, future):
+        if future is not None:
+            chunks, stats = future.result()
+        else:
+            stats = {}
+            chunks = _compress(path, method, compresslevel, chunk_size, stats)
+        return arcname, path, st, method, chunks, stats
+
+    for arcname, path in files:
+        window.append(entry(arcname, path))
+        if len(window) > max_pending:
+            yield resolve(*window.popleft())
+    while window:
+        yield resolve(*window.popleft())
+
+
+class ZipStream(object):
+    '''
+    Writes a zip archive incrementally as a sequence of byte strings without
+    ever seeking in its output. Entry sizes and checksums follow the entry
+    data in data descriptors, so files are read and compressed one chunk at a
+    time and memory use does not depend on the size of the archive.
+
+    Entries are written in the order they are added, with normalized
+    timestamps and permissions.
+    '''
+    def __init__(self, compresslevel=None, chunk_size=CHUNK_SIZE,
+                 executor=None):
+        '''
+        :param compresslevel: zlib compression level, from
+            compression_level() by default
+        :param chunk_size: Size of the chunks in which files are read
+        :param executor: Optional thread pool on which to compress files
+            concurrently
+        '''
+        self.compresslevel = (compression_level() if compresslevel is None
+                              else compresslevel)
+        self.chunk_size = chunk_size
+        self.executor = executor
+        self._offset = 0
+        self._records = []
+
+    def _emit(self, data):
+        self._offset += len(data)
+        return data
+
+    def _local_header(self, name, flags, method, dos_time, dos_date, crc,
+                      compress_size, file_size, zip64=False):
+        extra = b''
+        version = _VERSION_NEEDED
+        if zip64:
+            extra = _zip64_extra([file_size, compress_size])
+            compress_size = file_size = _MAX32
+            version = _VERSION_NEEDED64
+        return self._emit(_LOCAL_HEADER.pack(
+            _LOCAL_HEADER_SIG, version, flags, method, dos_time, dos_date,
+            crc, compress_size, file_size, len(name), len(extra)) +
+            name + extra)
+
+    def add_file(self, arcname, path):
+        '''
+        Yields the local header, compressed data and data descriptor for the
+        file at path stored in the archive under arcname.
+        '''
+        return self.add_files([(arcname, path)])
+
+    def add_files(self, files):
+        '''
+        Yields the entries for the given (arcname, path) pairs, compressing
+        them on the executor if there is one.
+        '''
+        for arcname, path, st, method, chunks, stats in _iter_compressed(
+                files, self.compresslevel, self.chunk_size, self.executor):
+            name = _arcname(arcname).encode('utf-8')
+            flags = _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8
+            header_offset = self._offset
+            # Sizes are only known once the data is written, so large files
+            # get room for 64-bit sizes up front
+            zip64 = st.st_size >= ZIP64_LIMIT
+
+            yield self._local_header(name, flags, method, DOS_TIME, DOS_DATE,
+                                     0, 0, 0, zip64)
+            for data in chunks:
+                yield self._emit(data)
+            descriptor = _DATA_DESCRIPTOR64 if zip64 else _DATA_DESCRIPTOR
+            yield self._emit(descriptor.pack(
+                _DATA_DESCRIPTOR_SIG, stats['crc'], stats['compress_size'],
+                stats['file_size']))
+
+            self._records.append((name, flags, method, DOS_TIME, DOS_DATE,
+                                  stats['crc'], stats['compress_size'],
+                                  stats['file_size'], EXTERNAL_ATTR,
+                                  header_offset, zip64))
+
+    def add_precompressed(self, arcname, method, crc, compress_size,
+                          file_size, external_attr, dos_time, dos_date,
+                          chunks):
+        '''
+        Yields an entry whose data was compressed ahead of time. The data is
+        copied through as-is from the chunks iterable.
+
+        The entry is laid out exactly like those of add_files, sizes in a
+        trailing data descriptor included, so that an archive is the same
+        whether its files were compressed now or ahead of time.
+        '''
+        name = _arcname(arcname).encode('utf-8')
+        flags = _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8
+        header_offset = self._offset
+        zip64 = file_size >= ZIP64_LIMIT
+
+        yield self._local_header(name, flags, method, dos_time, dos_date,
+                                 0, 0, 0, zip64)
+        for data in chunks:
+            yield self._emit(data)
+        descriptor = _DATA_DESCRIPTOR64 if zip64 else _DATA_DESCRIPTOR
+        yield self._emit(descriptor.pack(_DATA_DESCRIPTOR_SIG, crc,
+                                         compress_size, file_size))
+
+        self._records.append((name, flags, method, dos_time, dos_date, crc,
+                              compress_size, file_size, external_attr,
+                              header_offset, zip64))
+
+    def add_fragment(self, path):
+        '''
+        Yields all of the entries of a fragment created by write_fragment
+        without decompressing or recompressing them.
+        '''
+        with open(path, 'rb') as f:
+            for data in self.add_fragment_entries(f, read_fragment_index(f)):
+                yield data
+
+    def add_fragment_entries(self, f, entries):
+        '''
+        Yields the given entries of the open fragment file f, as listed by
+        read_fragment_index.
+        '''
+        for entry in entries:
+            f.seek(entry['offset'])
+            chunks = _read_range(f, entry['compress_size'], self.chunk_size)
+            for data in self.add_precompressed(
+                    entry['arcname'], entry['method'], entry['crc'],
+                    entry['compress_size'], entry['file_size'],
+                    entry['external_attr'], entry['dos_time'],
+                    entry['dos_date'], chunks):
+                yield data
+
+    def close(self):
+        '''
+        Yields the central directory that terminates the archive, with zip64
+        records for any sizes, offsets or entry counts past the zip limits.
+        '''
+        cd_offset = self._offset
+        for (name, flags, method, dos_time, dos_date, crc, compress_size,
+             file_size, external_attr, header_offset, zip64) in self._records:
+            # The zip64 extra field holds whichever of these overflow, in
+            # this order
+            values = []
+            if file_size >= ZIP64_LIMIT:
+                values.append(file_size)
+                file_size = _MAX32
+            if compress_size >= ZIP64_LIMIT:
+                values.append(compress_size)
+                compress_size = _MAX32
+            if header_offset >= ZIP64_LIMIT:
+                values.append(header_offset)
+                header_offset = _MAX32
+            extra = _zip64_extra(values) if values else b''
+            if zip64 or values:
+                made_by, version = _VERSION_MADE_BY64, _VERSION_NEEDED64
+            else:
+                made_by, version = _VERSION_MADE_BY, _VERSION_NEEDED
+            yield self._emit(_CENTRAL_HEADER.pack(
+                _CENTRAL_HEADER_SIG, made_by, version, flags, method,
+                dos_time, dos_date, crc, compress_size, file_size, len(name),
+                len(extra), 0, 0, 0, external_attr, header_offset) +
+                name + extra)
+        cd_size = self._offset - cd_offset
+        count = len(self._records)
+        if (count >= ZIP_FILECOUNT_LIMIT or cd_offset >= ZIP64_LIMIT or
+                cd_size >= ZIP64_LIMIT):
+            end64_offset = self._offset
+            yield self._emit(_END_RECORD64.pack(
+                _END_RECORD64_SIG, _END_RECORD64.size - 12,
+                _VERSION_MADE_BY64, _VERSION_NEEDED64, 0, 0, count, count,
+                cd_size, cd_offset))
+            yield self._emit(_END_LOCATOR64.pack(_END_LOCATOR64_SIG, 0,
+                                                 end64_offset, 1))
+        yield self._emit(_END_RECORD.pack(
+            _END_RECORD_SIG, 0, 0, min(count, _MAX16), min(count, _MAX16),
+            min(cd_size, _MAX32), min(cd_offset, _MAX32), 0))
+
+
+def _zip64_extra(values):
+    '''Returns a zip64 extended information extra field.'''
+    return (_EXTRA_HEADER.pack(_EXTRA_ZIP64, 8 * len(values)) +
+            struct.pack('<{}Q'.format(len(values)), *values))
+
+
+def _read_range(f, size, chunk_size):
+    '''Yields the next size bytes of f in chunks of at most chunk_size.'''
+    while size > 0:
+        chunk = f.read(min(size, chunk_size))
+        if not chunk:
+            raise IOError('Truncated bundle fragment {}'.format(f.name))
+        size -= len(chunk)
+        yield chunk
+
+
+def write_fragment(files, fileobj, compresslevel=None, chunk_size=CHUNK_SIZE,
+                   executor=None):
+    '''
+    Compresses files into a fragment: a run of compressed zip entry data
+    followed by an index describing each entry, sorted by name.
+    ZipStream.add_fragment splices fragments into archives without touching
+    the original files.
+
+    :param files: Iterable of (arcname, path) pairs to include
+    :param fileobj: Binary file object to which to write the fragment
+    :param compresslevel: zlib compression level, from compression_level()
+        by default
+    :param executor: Optional thread pool on which to compress files
+        concurrently
+    '''
+    if compresslevel is None:
+        compresslevel = compression_level()
+    fileobj.write(_FRAGMENT_MAGIC)
+    offset = len(_FRAGMENT_MAGIC)
+    index = []
+    files = sorted(files, key=lambda f: _arcname(f[0]))
+    for arcname, path, st, method, chunks, stats in _iter_compressed(
+            files, compresslevel, chunk_size, executor):
+        for data in chunks:
+            fileobj.write(data)
+        index.append({
+            'arcname': _arcname(arcname),
+            'offset': offset,
+            'method': method,
+            'crc': stats['crc'],
+            'compress_size': stats['compress_size'],
+            'file_size': stats['file_size'],
+            'external_attr': EXTERNAL_ATTR,
+            'dos_time': DOS_TIME,
+            'dos_date': DOS_DATE
+        })
+        offset += stats['compress_size']
+    index_data = json.dumps(index).encode('utf-8')
+    fileobj.write(index_data)
+    fileobj.write(_FRAGMENT_TRAILER.pack(len(index_data)))
+
+
+def read_fragment_index(fileobj):
+    '''Returns the list of entries described by a fragment's index.'''
+    fileobj.seek(0)
+    if fileobj.read(len(_FRAGMENT_MAGIC)) != _FRAGMENT_MAGIC:
+        raise IOError('Not a bundle fragment')
+    fileobj.seek(-_FRAGMENT_TRAILER.size, os.SEEK_END)
+    index_size, = _FRAGMENT_TRAILER.unpack(fileobj.read(_FRAGMENT_TRAILER.size))
+    fileobj.seek(-_FRAGMENT_TRAILER.size - index_size, os.SEEK_END)
+    return json.loads(fileobj.read(index_size).decode('utf-8'))
+
+
+def verify_fragment(fileobj, digests, chunk_size=CHUNK_SIZE):
+    '''
+    True if the fragment in fileobj holds exactly the given files, laid out
+    as write_fragment writes them, for fragments from an untrusted source.
+    Every entry is decompressed and hashed.
+
+    :param fileobj: Seekable binary file object holding the fragment
+    :param digests: Dict mapping each path within the bundle to the size and
+        SHA-256 hex digest of the contents it should have
+    '''
+    digests = dict((_arcname(arcname), value)
+                   for arcname, value in digests.items())
+    try:
+        entries = read_fragment_index(fileobj)
+        arcnames = [entry['arcname'] for entry in entries]
+        if arcnames != sorted(digests):
+            return False
+        offset = len(_FRAGMENT_MAGIC)
+        for entry in entries:
+            method = entry['method']
+            if (entry['offset'] != offset or
+                    method not in (ZIP_STORED, ZIP_DEFLATED) or
+                    entry['external_attr'] != EXTERNAL_ATTR or
+                    entry['dos_time'] != DOS_TIME or
+                    entry['dos_date'] != DOS_DATE):
+                return False
+            decompressor = (zlib.decompressobj(-15)
+                            if method == ZIP_DEFLATED else None)
+            h = hashlib.sha256()
+            crc = 0
+            file_size = 0
+            fileobj.seek(offset)
+            for data in _read_range(fileobj, entry['compress_size'],
+                                    chunk_size):
+                if decompressor:
+                    data = decompressor.decompress(data)
+                crc = zlib.crc32(data, crc)
+                file_size += len(data)
+                h.update(data)
+            if decompressor:
+                data = decompressor.flush()
+                crc = zlib.crc32(data, crc)
+                file_size += len(data)
+                h.update(data)
+                # Python 2 decompressors do not tell where the stream ended
+                if (not getattr(decompressor, 'eof', True) or
+                        decompressor.unused_data):
+                    return False
+            size, digest = digests[entry['arcname']]
+            if (file_size != size or file_size != entry['file_size'] or
+                    crc & 0xffffffff != entry['crc'] or
+                    h.hexdigest() != digest):
+                return False
+            offset += entry['compress_size']
+        return True
+    except (IOError, KeyError, TypeError, ValueError, zlib.error,
+            struct.error):
+        return False
+
+
+def iter_zip(files, fragments=(), chunk_size=CHUNK_SIZE, compresslevel=None,
+             executor=None):
+    '''
+    Yields a zip archive of the given files and fragments as byte strings of
+    roughly chunk_size bytes each. The entries of the archive are sorted by
+    name, so the same files always produce the same archive.
+
+    :param files: Iterable of (arcname, path) pairs to include in the archive
+    :param fragments: Paths or open binary files of fragments whose entries
+        to splice in. Files passed open are left open.
+    :param chunk_size: Target size of the yielded chunks
+    :param compresslevel: zlib compression level, from compression_level()
+        by default
+    :param executor: Thread pool on which to compress files concurrently,
+        the shared compression pool by default
+    '''
+    if executor is None:
+        executor = get_compression_executor()
+    stream = ZipStream(compresslevel, chunk_size, executor)
+    handles = []
+    try:
+        # Merge the files and fragment entries by name, then add each run of
+        # files at once so that they are compressed concurrently
+        items = [(_arcname(arcname), None, (arcname, path))
+                 for arcname, path in files]
+        for fragment in fragments:
+            if hasattr(fragment, 'read'):
+                f = fragment
+            else:
+                f = open(fragment, 'rb')
+                handles.append(f)
+            items.extend((entry['arcname'], f, entry)
+                         for entry in read_fragment_index(f))
+        items.sort(key=lambda item: item[0])
+
+        sources = []
+        for f, run in itertools.groupby(items, key=lambda item: item[1]):
+            run = [item[2] for item in run]
+            if f is None:
+                sources.append(stream.add_files(run))
+            else:
+                sources.append(stream.add_fragment_entries(f, run))
+        sources.append(stream.close())
+
+        buf = []
+        buffered = 0
+        for source in sources:
+            for data in source:
+                buf.append(data)
+                buffered += len(data)
+                if buffered >= chunk_size:
+                    yield b''.join(buf)
+                    buf = []
+                    buffered = 0
+        yield b''.join(buf)
+    finally:
+        for f in handles:
+            f.close()
+
+
+def write_zip(zip_path, files, fragments=()):
+    '''
+    Writes a zip archive of the given files and fragments to zip_path.
+    Returns zip_path.
+    '''
+    with open(zip_path, 'wb') as f:
+        for chunk in iter_zip(files, fragments):
+            f.write(chunk)
+    return zip_path
@@ -34,7 +34,8 @@ for more information.
     include_package_data=True,
     install_requires=[
         'requests>=2.7',
-        'notebook>=5.0'
+        'notebook>=5.0',
+        'futures; python_version == "2.7"'
     ],
     classifiers=[
         'Intended Audience :: Developers',
@@ -0,0 +1,51 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from os.path import join as pjoin
+
+import notebook.bundler.tools
+from dashboards_bundlers import analysis
+
+
+class TestNotebookAnalysis(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        shutil.copy2('test/resources/some.ipynb', self.tmp)
+        shutil.copy2('test/resources/some.csv', self.tmp)
+        self.nb_path = pjoin(self.tmp, 'some.ipynb')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_file_references(self):
+        '''Should find the same references as the bundler tools.'''
+        tools = notebook.bundler.tools
+        result = analysis.analyze(self.nb_path)
+        self.assertEqual(result.get_file_references(tools),
+                         tools.get_file_references(self.nb_path, 4))
+
+    def test_declarative_widgets(self):
+        '''Should detect declarative widgets usage.'''
+        self.assertTrue(analysis.analyze(
+            'test/resources/env.ipynb').uses_declarative_widgets)
+        self.assertFalse(analysis.analyze(
+            'test/resources/no_imports.ipynb').uses_declarative_widgets)
+
+    def test_cached(self):
+        '''Should reuse the analysis of an unchanged notebook.'''
+        first = analysis.analyze(self.nb_path)
+        self.assertIs(analysis.analyze(self.nb_path), first)
+
+        # Touching the notebook invalidates the analysis
+        st = os.stat(self.nb_path)
+        os.utime(self.nb_path, (st.st_atime, st.st_mtime + 10))
+        self.assertIsNot(analysis.analyze(self.nb_path), first)
+
+    def test_metadata(self):
+        '''Should expose the notebook metadata.'''
+        result = analysis.analyze(self.nb_path)
+        self.assertEqual(result.metadata, result.notebook['metadata'])
@@ -0,0 +1,227 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import copy
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import unittest
+from os.path import join as pjoin
+
+import notebook.bundler.tools
+from dashboards_bundlers import artifacts, paths, widget_assets
+from dashboards_bundlers.server_upload import make_upload_bundle
+
+
+class TestFileArtifactStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.store = artifacts.FileArtifactStore(pjoin(self.tmp, 'store'), 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def read(self, key):
+        f = self.store.open(key)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def test_put_open(self):
+        '''Should store read-only artifacts without leaving temporary files.'''
+        self.assertIsNone(self.store.open('ab12'))
+        self.store.put('ab12', lambda f: f.write(b'artifact'))
+        self.assertEqual(self.read('ab12'), b'artifact')
+        path = self.store.path('ab12')
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['ab12'])
+        self.assertFalse(os.stat(path).st_mode & stat.S_IWUSR)
+
+    def test_private(self):
+        '''Should store private artifacts readable by their owner only.'''
+        self.store.put('ab12', lambda f: f.write(b'notebook'), private=True)
+        mode = os.stat(self.store.path('ab12')).st_mode
+        self.assertEqual(stat.S_IMODE(mode), 0o400)
+        self.assertEqual(self.read('ab12'), b'notebook')
+        self.assertNotEqual(artifacts.private_key('ab12'), 'ab12')
+
+    def test_failed_write(self):
+        '''Should not store partially written artifacts.'''
+        def write(f):
+            f.write(b'part')
+            raise RuntimeError('disk full')
+        self.assertRaises(RuntimeError, self.store.put, 'ab12', write)
+        self.assertIsNone(self.store.open('ab12'))
+        self.assertEqual(os.listdir(pjoin(self.tmp, 'store', 'ab')), [])
+
+    def test_gc(self):
+        '''Should remove the least recently used artifacts past the bound.'''
+        for i, key in enumerate(['aa01', 'bb02']):
+            self.store.put(key, lambda f: f.write(b'x' * 40))
+            os.utime(self.store.path(key), (time.time() - 100 + i,) * 2)
+        # Reading marks an artifact as recently used
+        self.read('aa01')
+        self.store.put('cc03', lambda f: f.write(b'x' * 40))
+        self.assertIsNotNone(self.read('aa01'))
+        self.assertIsNone(self.read('bb02'))
+        self.assertIsNotNone(self.read('cc03'))
+
+    def test_gc_threshold(self):
+        '''Should not walk the store on every put.'''
+        store = artifacts.FileArtifactStore(pjoin(self.tmp, 'big'), 10000)
+        walks = []
+        store.gc = lambda: walks.append(True)
+        store.put('aa01', lambda f: f.write(b'x' * 600))
+        self.assertEqual(len(walks), 1)
+        # Below a tenth of the bound since the last collection
+        store.put('bb02', lambda f: f.write(b'x' * 600))
+        self.assertEqual(len(walks), 1)
+        store.put('cc03', lambda f: f.write(b'x' * 600))
+        self.assertEqual(len(walks), 2)
+
+    def test_open_survives_gc(self):
+        '''Should keep artifacts being read readable.'''
+        self.store.put('aa01', lambda f: f.write(b'a' * 60))
+        f = self.store.open('aa01')
+        self.store.put('bb02', lambda f: f.write(b'b' * 60))
+        with f:
+            self.assertEqual(f.read(), b'a' * 60)
+
+    def test_copy_or_create(self):
+        '''Should build an artifact once and copy it afterwards.'''
+        built = []
+
+        def write(f):
+            built.append(True)
+            f.write(b'artifact')
+
+        for expected_found in (False, True):
+            out = pjoin(self.tmp, 'out')
+            with open(out, 'wb') as f:
+                found = self.store.copy_or_create('ab12', write, f)
+            self.assertEqual(found, expected_found)
+            with open(out, 'rb') as f:
+                self.assertEqual(f.read(), b'artifact')
+        self.assertEqual(len(built), 1)
+
+    def test_too_large(self):
+        '''Should still produce artifacts larger than the store.'''
+        out = pjoin(self.tmp, 'out')
+        with open(out, 'wb') as f:
+            self.store.copy_or_create('ab12', lambda f: f.write(b'x' * 200), f)
+        self.assertEqual(os.path.getsize(out), 200)
+
+    def test_concurrent_writers(self):
+        '''Should leave one complete artifact when writers race.'''
+        def put():
+            self.store.put('ab12', lambda f: f.write(b'artifact' * 10))
+        threads = [threading.Thread(target=put) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.read('ab12'), b'artifact' * 10)
+        self.assertEqual(os.listdir(pjoin(self.tmp, 'store', 'ab')), ['ab12'])
+
+
+class TestSharedStore(unittest.TestCase):
+    def setUp(self):
+        self.origin_env = copy.deepcopy(os.environ)
+        self.tmp = tempfile.mkdtemp()
+        os.environ['DASHBOARD_BUNDLER_ARTIFACT_STORE'] = pjoin(self.tmp, 'store')
+        self.assets = pjoin(self.tmp, 'assets')
+        os.makedirs(pjoin(self.assets, 'js'))
+        for name in ['a.js', 'js/b.js']:
+            with open(pjoin(self.assets, name), 'w') as f:
+                f.write('var x = 1;\n' * 100)
+
+    def tearDown(self):
+        os.environ = self.origin_env
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        paths.clear()
+
+    def test_backend(self):
+        '''Should load the backend named in the environment.'''
+        self.assertIsInstance(artifacts.get_store(),
+                              artifacts.FileArtifactStore)
+        os.environ['DASHBOARD_BUNDLER_ARTIFACT_BACKEND'] = \
+            'dashboards_bundlers.artifacts.ArtifactStore'
+        self.assertIs(artifacts.store_backend(), artifacts.ArtifactStore)
+        del os.environ['DASHBOARD_BUNDLER_ARTIFACT_STORE']
+        self.assertIsNone(artifacts.get_store())
+
+    def test_shared_fragment(self):
+        '''Should compress widget assets once for every notebook server.'''
+        built = []
+        origin_write_fragment = widget_assets.write_fragment
+
+        def write_fragment(*args, **kwargs):
+            built.append(True)
+            return origin_write_fragment(*args, **kwargs)
+        widget_assets.write_fragment = write_fragment
+        try:
+            fragments = []
+            # Each user server has its own fragment cache
+            for user in ['alice', 'bob']:
+                os.environ['DASHBOARD_BUNDLER_CACHE_DIR'] = pjoin(self.tmp, user)
+                fragments.append(widget_assets.get_fragment(
+                    [(self.assets, 'static/assets')]))
+        finally:
+            widget_assets.write_fragment = origin_write_fragment
+        self.assertEqual(len(built), 1)
+        with fragments[0] as a, fragments[1] as b:
+            self.assertEqual(a.read(), b.read())
+
+    def test_planted_fragment(self):
+        '''Should not use a stored fragment of other files.'''
+        os.environ['DASHBOARD_BUNDLER_CACHE_DIR'] = pjoin(self.tmp, 'alice')
+        widget_assets.get_fragment([(self.assets, 'static/assets')]).close()
+        stored = []
+        for root, dirs, files in os.walk(pjoin(self.tmp, 'store')):
+            stored.extend(pjoin(root, name) for name in files)
+        self.assertEqual(len(stored), 1)
+        with open(stored[0], 'rb') as f:
+            expected = f.read()
+
+        # Replace the stored fragment with one of tampered files
+        planted = pjoin(self.tmp, 'planted')
+        shutil.copytree(self.assets, planted)
+        with open(pjoin(planted, 'a.js'), 'w') as f:
+            f.write('steal();\n')
+        os.chmod(stored[0], 0o644)
+        with open(stored[0], 'wb') as f:
+            widget_assets.write_fragment(
+                widget_assets.walk_files(planted, 'static/assets'), f)
+
+        os.environ['DASHBOARD_BUNDLER_CACHE_DIR'] = pjoin(self.tmp, 'bob')
+        with widget_assets.get_fragment([(self.assets,
+                                          'static/assets')]) as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_unshared_archive(self):
+        '''Should not store bundle archives unless asked to.'''
+        os.environ['DASHBOARD_BUNDLER_CACHE_DIR'] = pjoin(self.tmp, 'cache')
+        make_upload_bundle(os.path.abspath('test/resources/some.ipynb'),
+                           pjoin(self.tmp, 'alice', 'some'),
+                           notebook.bundler.tools)
+        self.assertFalse(os.path.exists(pjoin(self.tmp, 'store')))
+
+    def test_shared_archive(self):
+        '''Should reuse the archive of an identical bundle.'''
+        os.environ['DASHBOARD_BUNDLER_CACHE_DIR'] = pjoin(self.tmp, 'cache')
+        os.environ['DASHBOARD_BUNDLER_ARTIFACT_STORE_BUNDLES'] = 'yes'
+        zips = []
+        for user in ['alice', 'bob']:
+            zips.append(make_upload_bundle(
+                os.path.abspath('test/resources/some.ipynb'),
+                pjoin(self.tmp, user, 'some'), notebook.bundler.tools))
+        with open(zips[0], 'rb') as a, open(zips[1], 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+        stored = []
+        for root, dirs, files in os.walk(pjoin(self.tmp, 'store')):
+            stored.extend(pjoin(root, name) for name in files)
+        self.assertEqual(len(stored), 1)
+        self.assertEqual(stat.S_IMODE(os.stat(stored[0]).st_mode), 0o400)
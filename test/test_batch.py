@@ -0,0 +1,132 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import copy
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import zipfile
+from os.path import join as pjoin
+
+from dashboards_bundlers import batch, sessions
+
+
+class MockResult(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.reason = 'Reason'
+        self.json = lambda: {}
+
+
+class MockSession(object):
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.urls = []
+
+    def post(self, url, **kwargs):
+        self.urls.append(url)
+        return MockResult(self.status_code)
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.origin_env = copy.deepcopy(os.environ)
+        self.origin_get_session = sessions.get_session
+        self.tmp = tempfile.mkdtemp()
+        self.session = MockSession()
+        sessions.get_session = lambda url, verify=True: self.session
+
+    def tearDown(self):
+        os.environ = self.origin_env
+        sessions.get_session = self.origin_get_session
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_find_notebooks(self):
+        '''Should find notebooks in directories and globs once each.'''
+        found = batch.find_notebooks(['test/resources',
+                                      'test/resources/some.*'])
+        self.assertEqual([os.path.basename(p) for p in found],
+                         ['env.ipynb', 'no_imports.ipynb', 'some.ipynb'])
+
+    def test_bundle_to_output(self):
+        '''Should write each bundle to the output directory.'''
+        notebooks = batch.find_notebooks(['test/resources/no_imports.ipynb',
+                                          'test/resources/some.ipynb'])
+        results = batch.run(notebooks, pjoin(self.tmp, 'out'), jobs=2)
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEqual(sorted(os.listdir(pjoin(self.tmp, 'out'))),
+                         ['no_imports.ipynb', 'some.zip'])
+        with zipfile.ZipFile(pjoin(self.tmp, 'out', 'some.zip')) as zf:
+            self.assertIn('some.csv', zf.namelist())
+
+    def test_deploy(self):
+        '''Should deploy every notebook and report the dashboard links.'''
+        os.environ['DASHBOARD_SERVER_URL'] = '{protocol}://{hostname}:3000'
+        notebooks = batch.find_notebooks(['test/resources/no_imports.ipynb',
+                                          'test/resources/some.ipynb'])
+        results = batch.run(notebooks, hostname='dashboards')
+        self.assertEqual([r.link for r in results],
+                         ['http://dashboards:3000/dashboards/no_imports',
+                          'http://dashboards:3000/dashboards/some'])
+        self.assertEqual(sorted(self.session.urls),
+                         ['http://dashboards:3000/_api/notebooks/no_imports',
+                          'http://dashboards:3000/_api/notebooks/some'])
+        summary = batch.summarize(results, 1.0)
+        self.assertEqual(summary['succeeded'], 2)
+        self.assertEqual(summary['notebooks_per_second'], 2.0)
+
+    def test_deploy_failure(self):
+        '''Should report failed deploys without stopping the batch.'''
+        os.environ['DASHBOARD_SERVER_URL'] = 'http://dashboards:3000'
+        self.session.status_code = 500
+        results = batch.run(batch.find_notebooks(['test/resources/some.ipynb']))
+        self.assertFalse(results[0].ok)
+        self.assertIn('500', results[0].error)
+
+    def test_deploy_many_servers(self):
+        '''Should deploy to every server and report each outcome.'''
+        os.environ['DASHBOARD_SERVER_URLS'] = 'http://a:3000,http://b:3000'
+        results = batch.run(batch.find_notebooks(['test/resources/some.ipynb']))
+        self.assertTrue(results[0].ok)
+        self.assertEqual(results[0].link, 'http://a:3000/dashboards/some')
+        self.assertEqual(results[0].targets, ['http://a:3000: HTTP 200',
+                                              'http://b:3000: HTTP 200'])
+        self.assertEqual(sorted(self.session.urls),
+                         ['http://a:3000/_api/notebooks/some',
+                          'http://b:3000/_api/notebooks/some'])
+
+    def test_duplicate_names(self):
+        '''Should refuse to deploy two notebooks under the same name.'''
+        os.makedirs(pjoin(self.tmp, 'other'))
+        shutil.copy('test/resources/no_imports.ipynb', pjoin(self.tmp, 'other'))
+        results = batch.run([os.path.abspath('test/resources/no_imports.ipynb'),
+                             pjoin(self.tmp, 'other', 'no_imports.ipynb')],
+                            pjoin(self.tmp, 'out'))
+        self.assertTrue(results[0].ok)
+        self.assertFalse(results[1].ok)
+
+    def test_report_as_completed(self):
+        '''Should report each notebook as soon as it is processed.'''
+        reported = []
+        second_done = threading.Event()
+        origin_process_notebook = batch.process_notebook
+
+        def process_notebook(path, output_dir=None, **kwargs):
+            if path == 'slow.ipynb':
+                second_done.wait(5)
+            return batch.Result(path)
+
+        def on_result(result):
+            reported.append(result.notebook)
+            second_done.set()
+        batch.process_notebook = process_notebook
+        try:
+            results = batch.run(['slow.ipynb', 'fast.ipynb'], jobs=2,
+                                on_result=on_result)
+        finally:
+            batch.process_notebook = origin_process_notebook
+        self.assertEqual(reported, ['fast.ipynb', 'slow.ipynb'])
+        self.assertEqual([result.notebook for result in results],
+                         ['slow.ipynb', 'fast.ipynb'])
@@ -0,0 +1,34 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+BENCH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), 'benchmarks', 'bench_bundlers.py')
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_scenarios(self):
+        '''Should run every benchmark scenario on the small workload.'''
+        # Leave out settings other tests leaked into the process environment
+        env = dict((key, value) for key, value in os.environ.items()
+                   if not key.startswith('DASHBOARD_'))
+        output = subprocess.check_output([sys.executable, BENCH, '--help'],
+                                         env=env)
+        scenarios = output.decode('utf-8')
+        for name in ['import_bundlers', 'make_upload_bundle',
+                     'make_upload_bundle_warm', 'bundle_declarative_widgets',
+                     'server_download', 'send_file']:
+            self.assertIn(name, scenarios)
+            output = subprocess.check_output([sys.executable, BENCH, '--run',
+                                              name, '--size', 'small'],
+                                             env=env)
+            metrics = json.loads(output.decode('utf-8').strip()
+                                 .splitlines()[-1])
+            self.assertEqual(sorted(metrics), ['bytes_written',
+                                               'files_touched',
+                                               'peak_rss_kb', 'wall_time'])
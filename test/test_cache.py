@@ -0,0 +1,96 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from dashboards_bundlers.cache import DiskCache
+
+
+def writer(data):
+    return lambda f: f.write(data)
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_open_or_create_once(self):
+        '''Should only build an entry once.'''
+        cache = DiskCache(self.tmp, 1024)
+        calls = []
+
+        def write(f):
+            calls.append(1)
+            f.write(b'data')
+        for _ in range(2):
+            with cache.open_or_create('key', write) as f:
+                self.assertEqual(f.read(), b'data')
+        self.assertEqual(len(calls), 1)
+
+    def test_missing(self):
+        '''Should return None for unknown keys.'''
+        cache = DiskCache(self.tmp, 1024)
+        self.assertIsNone(cache.get('nope'))
+
+    def test_lru_eviction(self):
+        '''Should evict least recently used entries beyond the size bound.'''
+        cache = DiskCache(self.tmp, 250)
+        a = cache.put('a', writer(b'a' * 100))
+        b = cache.put('b', writer(b'b' * 100))
+        # Make a the most recently used entry
+        os.utime(b, (1, 1))
+        os.utime(a, (2, 2))
+        cache.put('c', writer(b'c' * 100))
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_failed_write(self):
+        '''Should not leave partial entries behind.'''
+        cache = DiskCache(self.tmp, 1024)
+
+        def write(f):
+            f.write(b'partial')
+            raise ValueError('boom')
+        self.assertRaises(ValueError, cache.put, 'key', write)
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def test_too_large(self):
+        '''Should not keep entries larger than the cache.'''
+        cache = DiskCache(self.tmp, 150)
+        a = cache.put('a', writer(b'a' * 100))
+        self.assertIsNone(cache.put('b', writer(b'b' * 200)))
+        self.assertEqual(cache.get('a'), a, 'a should not be evicted')
+        with cache.open_or_create('c', writer(b'c' * 200)) as f:
+            self.assertEqual(f.read(), b'c' * 200)
+        self.assertEqual(os.listdir(self.tmp), ['a'])
+
+    def test_writer(self):
+        '''Should only show entries once committed.'''
+        cache = DiskCache(self.tmp, 1024)
+        writer = cache.create('a')
+        writer.file.write(b'data')
+        self.assertIsNone(cache.open('a'))
+        writer.commit()
+        with cache.open('a') as f:
+            self.assertEqual(f.read(), b'data')
+        writer = cache.create('b')
+        writer.file.write(b'data')
+        writer.discard()
+        self.assertEqual(os.listdir(self.tmp), ['a'])
+
+    def test_open_or_create(self):
+        '''Should keep an opened entry readable after it is evicted.'''
+        cache = DiskCache(self.tmp, 150)
+        f = cache.open_or_create('a', writer(b'a' * 100))
+        with f:
+            cache.put('b', writer(b'b' * 100))
+            self.assertIsNone(cache.get('a'), 'a should be evicted')
+            self.assertEqual(f.read(), b'a' * 100)
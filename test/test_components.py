@@ -0,0 +1,66 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from os.path import join as pjoin
+
+from dashboards_bundlers import components
+
+
+class TestComponents(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.write('paper-slider/paper-slider.html',
+                   '<link rel="import" href="../polymer/polymer.html">\n'
+                   '<link rel="import" href="../iron-range/iron-range.html">\n'
+                   '<style>:host { background: url("images/knob.png"); }</style>')
+        self.write('paper-slider/images/knob.png', 'png')
+        self.write('polymer/polymer.html',
+                   '<script src="polymer-micro.js"></script>\n'
+                   '<link rel="import" href="https://cdn.example.com/x.html">')
+        self.write('polymer/polymer-micro.js', '')
+        self.write('iron-range/iron-range.html',
+                   '<link rel="stylesheet" href="iron-range.css">')
+        self.write('iron-range/iron-range.css',
+                   '@import "../paper-styles/color.css";')
+        self.write('paper-styles/color.css', '')
+        self.write('unused/unused.html', '')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write(self, path, content):
+        path = pjoin(self.tmp, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_find_references(self):
+        '''Should find component imports in cell sources.'''
+        source = ('<link rel="import" href="urth_components/paper-slider/'
+                  'paper-slider.html" is="urth-core-import" '
+                  'package="PolymerElements/paper-slider">')
+        self.assertEqual(components.find_component_references(source),
+                         set(['paper-slider/paper-slider.html']))
+
+    def test_transitive_packages(self):
+        '''Should follow HTML imports, scripts and stylesheets.'''
+        packages = components.required_packages(
+            self.tmp, ['paper-slider/paper-slider.html'])
+        self.assertEqual(packages, set(['paper-slider', 'polymer',
+                                        'iron-range', 'paper-styles']))
+
+    def test_optional_roots(self):
+        '''Should skip missing optional roots and keep whole packages.'''
+        packages = components.required_packages(
+            self.tmp, [], ['unused', 'missing/missing.html'])
+        self.assertEqual(packages, set(['unused']))
+
+    def test_missing_import(self):
+        '''Should give up on pruning when an import is not installed.'''
+        self.assertIsNone(components.required_packages(
+            self.tmp, ['paper-button/paper-button.html']))
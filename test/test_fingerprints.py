@@ -0,0 +1,56 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+from os.path import join as pjoin
+
+import notebook.bundler.tools
+from dashboards_bundlers import fingerprints
+from dashboards_bundlers.server_upload import bundle_fingerprint
+
+
+class TestFingerprints(unittest.TestCase):
+    def setUp(self):
+        self.origin_env = copy.deepcopy(os.environ)
+        self.tmp = tempfile.mkdtemp()
+        os.environ['DASHBOARD_BUNDLER_STATE_DIR'] = pjoin(self.tmp, 'state')
+        shutil.copy2('test/resources/some.ipynb', self.tmp)
+        shutil.copy2('test/resources/some.csv', self.tmp)
+        self.nb_path = pjoin(self.tmp, 'some.ipynb')
+
+    def tearDown(self):
+        os.environ = self.origin_env
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def fingerprint(self, target='http://dashboards'):
+        return bundle_fingerprint(self.nb_path, notebook.bundler.tools, target)
+
+    def test_stable(self):
+        '''Should not change while the inputs are unchanged.'''
+        self.assertEqual(self.fingerprint(), self.fingerprint())
+
+    def test_target(self):
+        '''Should change with the deploy target.'''
+        self.assertNotEqual(self.fingerprint(),
+                            self.fingerprint('http://other-dashboards'))
+
+    def test_referenced_file(self):
+        '''Should change when a referenced file changes.'''
+        before = self.fingerprint()
+        with open(pjoin(self.tmp, 'some.csv'), 'a') as f:
+            f.write('more,data\n')
+        self.assertNotEqual(before, self.fingerprint())
+
+    def test_record_lookup(self):
+        '''Should only return the link of a matching deploy.'''
+        self.assertIsNone(fingerprints.lookup('some', 'abc'))
+        fingerprints.record('some', 'abc', 'http://dashboards/some')
+        self.assertEqual(fingerprints.lookup('some', 'abc'),
+                         'http://dashboards/some')
+        self.assertIsNone(fingerprints.lookup('some', 'def'))
+        fingerprints.forget('some')
+        self.assertIsNone(fingerprints.lookup('some', 'abc'))
@@ -0,0 +1,156 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import copy
+import os
+import threading
+import unittest
+
+import notebook.bundler.tools
+from tornado.ioloop import IOLoop
+
+from dashboards_bundlers import jobs, server_upload, sessions
+
+
+class MockResult(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.reason = 'Reason'
+        self.json = lambda: {}
+
+
+class MockSession(object):
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.posts = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def post(self, url, **kwargs):
+        self.posts += 1
+        self.release.wait(5)
+        return MockResult(self.status_code)
+
+
+class MockRequest(object):
+    host = 'notebook-server:8888'
+    protocol = 'http'
+
+
+class MockHandler(object):
+    def __init__(self):
+        self.settings = {
+            'base_url': '/',
+            'contents_manager': type('ContentsManager', (), {'root_dir': '.'})
+        }
+        self.request = MockRequest()
+        self.tools = notebook.bundler.tools
+        self.status = 200
+        self.headers = {}
+        self.body = None
+
+    def get_query_argument(self, name, default=None):
+        return default
+
+    def set_status(self, status):
+        self.status = status
+
+    def set_header(self, name, value):
+        self.headers[name] = value
+
+    def finish(self, body=None):
+        self.body = body
+
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        self.origin_env = copy.deepcopy(os.environ)
+        self.origin_get_session = sessions.get_session
+        self.session = MockSession()
+        sessions.get_session = lambda url, verify=True: self.session
+        os.environ['DASHBOARD_SERVER_URL'] = 'http://dashboard-server'
+        self.nb_path = os.path.abspath('test/resources/some.ipynb')
+
+    def tearDown(self):
+        self.session.release.set()
+        os.environ = self.origin_env
+        sessions.get_session = self.origin_get_session
+
+    def submit(self, force=False):
+        return jobs.submit(self.nb_path, 'test/resources/some.ipynb',
+                           notebook.bundler.tools, 'http', 'localhost', '',
+                           force=force)
+
+    def test_deploy(self):
+        '''Should deploy in the background and report progress.'''
+        job = self.submit()
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.state, jobs.DONE)
+        self.assertEqual(job.link, 'http://dashboard-server/dashboards/some')
+        self.assertEqual(job.stage, 'upload')
+        self.assertTrue(job.bytes > 0)
+        self.assertIs(jobs.get_job(job.id), job)
+        self.assertEqual(job.to_dict()['state'], 'done')
+
+    def test_coalesce(self):
+        '''Should join a deploy of the same notebook that is not finished.'''
+        self.session.release.clear()
+        job = self.submit()
+        self.assertIs(self.submit(), job)
+        self.session.release.set()
+        self.assertTrue(job.wait(5))
+        self.assertEqual(self.session.posts, 1)
+
+        other = self.submit()
+        self.assertIsNot(other, job, 'finished jobs should not be joined')
+        self.assertTrue(other.wait(5))
+
+    def test_coalesce_force(self):
+        '''Should only join a forced deploy to a forced job.'''
+        self.session.release.clear()
+        job = self.submit()
+        forced = self.submit(force=True)
+        self.assertIsNot(forced, job)
+        self.assertIs(self.submit(force=True), forced)
+        self.assertIs(self.submit(), forced)
+        self.session.release.set()
+        self.assertTrue(job.wait(5))
+        self.assertTrue(forced.wait(5))
+        self.assertEqual(self.session.posts, 2)
+
+    def test_failure(self):
+        '''Should report a failed deploy.'''
+        self.session.status_code = 500
+        job = self.submit()
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.state, jobs.FAILED)
+        self.assertEqual(job.status_code, 500)
+        self.assertIn('some', job.error)
+        self.assertIsNone(job.link)
+
+    def test_bundle_background(self):
+        '''Should answer a deploy request at once with a progress page.'''
+        os.environ['DASHBOARD_BUNDLER_BACKGROUND_JOBS'] = 'yes'
+        self.session.release.clear()
+        handler = MockHandler()
+        IOLoop.current().run_sync(lambda: server_upload.bundle(
+            handler, {'path': 'test/resources/some.ipynb'}))
+
+        self.assertEqual(handler.status, 202)
+        url = handler.headers['Location']
+        self.assertTrue(url.startswith('/dashboards_bundlers/jobs/'))
+        self.assertIn(url, handler.body)
+        job = jobs.get_job(url.rsplit('/', 1)[1])
+        self.session.release.set()
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.state, jobs.DONE)
+
+    def test_progress_page_escaping(self):
+        '''Should escape the notebook name and URL in the progress page.'''
+        page = jobs.progress_page('<b>', '/jobs/</script>')
+        self.assertIn('&lt;b&gt;', page)
+        self.assertNotIn('</script>"', page)
+
+        page = jobs.progress_page("it's\\\n</script>", '/jobs/1')
+        self.assertIn('var name = "it\'s\\\\\\n<\\/script>";', page)
+        self.assertNotIn('&#39;', page.split('<script>')[1])
@@ -0,0 +1,146 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import base64
+import copy
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from os.path import join as pjoin
+
+import notebook.bundler.tools
+from dashboards_bundlers import lean
+from dashboards_bundlers.analysis import analyze
+from dashboards_bundlers.server_upload import deploy_target, make_upload_bundle
+
+PNG = base64.b64encode(os.urandom(6000)).decode('ascii')
+
+
+def make_notebook():
+    plot = {'output_type': 'display_data', 'metadata': {},
+            'data': {'image/png': PNG, 'text/plain': ['<Figure>']}}
+    return {
+        'cells': [
+            {'cell_type': 'markdown', 'metadata': {}, 'source': '# Plots'},
+            {'cell_type': 'code', 'execution_count': 1, 'metadata': {},
+             'source': 'plot()', 'outputs': [copy.deepcopy(plot)]},
+            {'cell_type': 'code', 'execution_count': 2, 'metadata': {},
+             'source': 'plot()', 'outputs': [
+                 copy.deepcopy(plot),
+                 {'output_type': 'stream', 'name': 'stdout', 'text': 'ok\n'}]}
+        ],
+        'metadata': {'widgets': {'state': {}}},
+        'nbformat': 4, 'nbformat_minor': 0
+    }
+
+
+class TestLean(unittest.TestCase):
+    def setUp(self):
+        self.origin_env = copy.deepcopy(os.environ)
+        self.tmp = tempfile.mkdtemp()
+        self.nb_path = pjoin(self.tmp, 'plots.ipynb')
+        with io.open(self.nb_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(make_notebook()))
+        with open(self.nb_path, 'rb') as f:
+            self.original = f.read()
+
+    def tearDown(self):
+        os.environ = self.origin_env
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_mode(self):
+        '''Should read the lean mode from the environment.'''
+        self.assertIsNone(lean.lean_mode())
+        os.environ['DASHBOARD_BUNDLER_LEAN'] = 'yes'
+        self.assertEqual(lean.lean_mode(), lean.CLEAR)
+        os.environ['DASHBOARD_BUNDLER_LEAN'] = 'externalize'
+        self.assertEqual(lean.lean_mode(), lean.EXTERNALIZE)
+
+    def test_deploy_target(self):
+        '''Should tell deploys of different lean settings apart.'''
+        servers = ['http://dashboard-server']
+        verbatim = deploy_target(servers)
+        os.environ['DASHBOARD_BUNDLER_LEAN'] = 'externalize'
+        externalized = deploy_target(servers)
+        os.environ['DASHBOARD_BUNDLER_LEAN_MIN_OUTPUT_SIZE'] = '100'
+        self.assertEqual(len(set([verbatim, externalized,
+                                  deploy_target(servers)])), 3)
+
+    def test_clear(self):
+        '''Should clear outputs without modifying the parsed notebook.'''
+        analysis = analyze(self.nb_path)
+        notebook, assets = lean.make_lean(analysis.notebook, lean.CLEAR)
+        self.assertEqual(assets, {})
+        self.assertEqual([c.get('outputs') for c in notebook.cells],
+                         [None, [], []])
+        self.assertIsNone(notebook.cells[1].execution_count)
+        self.assertNotIn('widgets', notebook.metadata)
+        self.assertEqual(len(analysis.notebook.cells[1].outputs), 1)
+
+    def test_externalize(self):
+        '''Should move large outputs to deduplicated files.'''
+        notebook, assets = lean.make_lean(analyze(self.nb_path).notebook,
+                                          lean.EXTERNALIZE)
+        self.assertEqual(len(assets), 1, 'identical plots share a file')
+        arcname, content = list(assets.items())[0]
+        self.assertTrue(arcname.startswith('outputs/'))
+        self.assertTrue(arcname.endswith('.png'))
+        self.assertEqual(content, base64.b64decode(PNG))
+        for cell in notebook.cells[1:]:
+            output = cell.outputs[0]
+            self.assertEqual(list(output.data), ['text/plain'])
+            self.assertEqual(
+                output.metadata['dashboards_bundlers']['externalized'],
+                {'image/png': arcname})
+        self.assertEqual(notebook.cells[2].outputs[1].text, 'ok\n')
+
+    def test_small_outputs_kept(self):
+        '''Should keep outputs under the size threshold.'''
+        notebook, assets = lean.make_lean(analyze(self.nb_path).notebook,
+                                          lean.EXTERNALIZE, len(PNG))
+        self.assertEqual(assets, {})
+        self.assertIn('image/png', notebook.cells[1].outputs[0].data)
+
+    def test_lean_upload_bundle(self):
+        '''Should bundle a lean notebook and leave the original untouched.'''
+        os.environ['DASHBOARD_BUNDLER_LEAN'] = 'clear'
+        bundled = make_upload_bundle(self.nb_path, pjoin(self.tmp, 'out', 'plots'),
+                                     notebook.bundler.tools)
+        self.assertEqual(os.path.basename(bundled), 'plots.ipynb')
+        self.assertNotEqual(bundled, self.nb_path)
+        self.assertTrue(os.path.getsize(bundled) < len(self.original) / 4)
+        with open(self.nb_path, 'rb') as f:
+            self.assertEqual(f.read(), self.original)
+
+    def test_externalized_upload_bundle(self):
+        '''Should zip externalized outputs with the lean notebook.'''
+        os.environ['DASHBOARD_BUNDLER_LEAN'] = 'externalize'
+        bundled = make_upload_bundle(self.nb_path, pjoin(self.tmp, 'out', 'plots'),
+                                     notebook.bundler.tools)
+        self.assertTrue(bundled.endswith('.zip'))
+        with zipfile.ZipFile(bundled) as zf:
+            names = zf.namelist()
+            self.assertEqual(len(names), 2)
+            self.assertIn('index.ipynb', names)
+            index = json.loads(zf.read('index.ipynb').decode('utf-8'))
+        self.assertNotIn(PNG[:100], json.dumps(index))
+        with open(self.nb_path, 'rb') as f:
+            self.assertEqual(f.read(), self.original)
+
+    def test_never_overwrites(self):
+        '''Should not write through existing files, which may be links.'''
+        os.makedirs(pjoin(self.tmp, 'out', 'outputs'))
+        _, assets = lean.make_lean(analyze(self.nb_path).notebook,
+                                   lean.EXTERNALIZE)
+        arcname = list(assets)[0]
+        with open(pjoin(self.tmp, 'out', arcname), 'wb') as f:
+            f.write(b'user file')
+        lean.write_lean_bundle(analyze(self.nb_path),
+                               pjoin(self.tmp, 'out', 'index.ipynb'),
+                               pjoin(self.tmp, 'out'), lean.EXTERNALIZE)
+        with open(pjoin(self.tmp, 'out', arcname), 'rb') as f:
+            self.assertEqual(f.read(), b'user file')
@@ -0,0 +1,83 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import shutil
+import tempfile
+import unittest
+from os.path import join as pjoin
+
+import notebook.bundler.tools
+from dashboards_bundlers import metrics
+from dashboards_bundlers.server_upload import make_upload_bundle
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_render_counter(self):
+        '''Should render counters with their labels.'''
+        metrics.inc('files_total', 3, bundler='server_upload', stage='archive')
+        metrics.inc('files_total', 2, bundler='server_upload', stage='archive')
+        text = metrics.render()
+        self.assertIn('# TYPE dashboards_bundlers_files_total counter', text)
+        self.assertIn('dashboards_bundlers_files_total{bundler="server_upload",'
+                      'stage="archive"} 5', text)
+
+    def test_render_histogram(self):
+        '''Should render cumulative histogram buckets, sum and count.'''
+        metrics.observe('archive_bytes', 2000, bundler='server_download')
+        metrics.observe('archive_bytes', 10, bundler='server_download')
+        text = metrics.render()
+        self.assertIn('dashboards_bundlers_archive_bytes_bucket{'
+                      'bundler="server_download",le="1024.0"} 1', text)
+        self.assertIn('dashboards_bundlers_archive_bytes_bucket{'
+                      'bundler="server_download",le="16384.0"} 2', text)
+        self.assertIn('dashboards_bundlers_archive_bytes_bucket{'
+                      'bundler="server_download",le="+Inf"} 2', text)
+        self.assertIn('dashboards_bundlers_archive_bytes_sum{'
+                      'bundler="server_download"} 2010', text)
+        self.assertIn('dashboards_bundlers_archive_bytes_count{'
+                      'bundler="server_download"} 2', text)
+
+    def test_stage_recorded_on_error(self):
+        '''Should time a stage that raises.'''
+        request = metrics.RequestMetrics('server_upload', 'some.ipynb')
+        with self.assertRaises(ValueError):
+            with request.stage('archive'):
+                raise ValueError()
+        request.done('error')
+        text = metrics.render()
+        self.assertIn('dashboards_bundlers_stage_seconds_count{'
+                      'bundler="server_upload",stage="archive"} 1', text)
+        self.assertIn('dashboards_bundlers_requests_total{'
+                      'bundler="server_upload",outcome="error"} 1', text)
+
+    def test_upload(self):
+        '''Should count uploads under their bundler.'''
+        metrics.RequestMetrics('batch', 'some.ipynb').upload(100, 201, 0.5)
+        text = metrics.render()
+        self.assertIn('dashboards_bundlers_upload_bytes_total{'
+                      'bundler="batch"} 100', text)
+        self.assertIn('dashboards_bundlers_upload_responses_total{'
+                      'bundler="batch",status="201"} 1', text)
+
+    def test_upload_bundle_stages(self):
+        '''Should record the stages of assembling an upload bundle.'''
+        tmp = tempfile.mkdtemp()
+        try:
+            request = metrics.RequestMetrics('server_upload', 'some.ipynb')
+            make_upload_bundle('test/resources/some.ipynb', pjoin(tmp, 'some'),
+                               notebook.bundler.tools, metrics=request)
+        finally:
+            shutil.rmtree(tmp, True)
+        stages = dict((s.name, s) for s in request.stages)
+        self.assertEqual(sorted(stages), ['analyze', 'archive',
+                                          'declarative_widgets',
+                                          'file_references', 'preflight'])
+        self.assertEqual(stages['file_references'].files, 2)
+        self.assertEqual(stages['archive'].files, 2)
+        self.assertGreater(stages['archive'].bytes_written, 0)
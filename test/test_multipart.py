@@ -0,0 +1,66 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from os.path import join as pjoin
+
+from dashboards_bundlers.multipart import MultipartFile
+
+
+class TestMultipartFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = pjoin(self.tmp, 'bundle.zip')
+        self.data = os.urandom(200000)
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def expected(self, body):
+        return (
+            b'--' + body.boundary.encode('utf-8') + b'\r\n'
+            b'Content-Disposition: form-data; name="file"; '
+            b'filename="bundle.zip"\r\n\r\n' + self.data +
+            b'\r\n--' + body.boundary.encode('utf-8') + b'--\r\n'
+        )
+
+    def test_read(self):
+        '''Should present the file as a multipart body.'''
+        with MultipartFile(self.path) as body:
+            expected = self.expected(body)
+            self.assertEqual(len(body), len(expected))
+            self.assertEqual(body.read(), expected)
+            self.assertEqual(body.read(), b'')
+
+    def test_small_reads(self):
+        '''Should produce the same body one block at a time.'''
+        with MultipartFile(self.path) as body:
+            blocks = []
+            while True:
+                block = body.read(8192)
+                if not block:
+                    break
+                self.assertTrue(len(block) <= 8192)
+                blocks.append(block)
+            self.assertEqual(b''.join(blocks), self.expected(body))
+
+    def test_seek(self):
+        '''Should rewind for retries.'''
+        with MultipartFile(self.path) as body:
+            body.read(1000)
+            self.assertEqual(body.tell(), 1000)
+            body.seek(0)
+            self.assertEqual(body.read(), self.expected(body))
+            self.assertEqual(body.seek(0, os.SEEK_END), len(body))
+
+    def test_chunked(self):
+        '''Should restart chunked iteration from the beginning.'''
+        with MultipartFile(self.path, chunk_size=4096) as body:
+            chunked = body.chunked()
+            self.assertEqual(b''.join(chunked), self.expected(body))
+            self.assertEqual(b''.join(chunked), self.expected(body))
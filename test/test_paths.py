@@ -0,0 +1,102 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from os.path import join as pjoin
+
+from dashboards_bundlers import paths
+
+
+def touch(path, content=b'x'):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def bump_mtime(path):
+    '''Moves the modification time of path forward regardless of clock resolution.'''
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+
+
+class TestPathCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = paths.PathCache()
+        self.calls = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def resolve(self):
+        self.calls += 1
+        return os.listdir(self.tmp), [self.tmp]
+
+    def test_reuse(self):
+        '''Should resolve once while the directory is unchanged.'''
+        self.assertEqual(self.cache.get('key', self.resolve), [])
+        self.assertEqual(self.cache.get('key', self.resolve), [])
+        self.assertEqual(self.calls, 1)
+
+    def test_invalidate(self):
+        '''Should resolve again once the directory changes.'''
+        self.cache.get('key', self.resolve)
+        touch(pjoin(self.tmp, 'new'))
+        bump_mtime(self.tmp)
+        self.assertEqual(self.cache.get('key', self.resolve), ['new'])
+        self.assertEqual(self.calls, 2)
+
+
+class TestAssetIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.makedirs(pjoin(self.tmp, 'a', 'b'))
+        touch(pjoin(self.tmp, 'a', 'b', 'one.html'), b'12345')
+        touch(pjoin(self.tmp, 'two.js'), b'12')
+        paths.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        paths.clear()
+
+    def test_entries(self):
+        '''Should list every file under the destination with its size.'''
+        index = paths.get_index(self.tmp, 'static')
+        self.assertEqual(index.files, [
+            (pjoin('static', 'two.js'), pjoin(self.tmp, 'two.js')),
+            (pjoin('static', 'a', 'b', 'one.html'),
+             pjoin(self.tmp, 'a', 'b', 'one.html'))
+        ])
+        self.assertEqual(index.size, 7)
+
+    def test_reuse(self):
+        '''Should reuse the index of an unchanged tree.'''
+        index = paths.get_index(self.tmp, 'static')
+        self.assertIs(paths.get_index(self.tmp, 'static'), index)
+
+    def test_invalidate(self):
+        '''Should rebuild the index when a nested directory changes.'''
+        index = paths.get_index(self.tmp, 'static')
+        touch(pjoin(self.tmp, 'a', 'b', 'three.css'))
+        bump_mtime(pjoin(self.tmp, 'a', 'b'))
+        rebuilt = paths.get_index(self.tmp, 'static')
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(len(rebuilt.files), 3)
+        self.assertNotEqual(rebuilt.digest, index.digest)
+
+    def test_rewrite_in_place(self):
+        '''Should rebuild the index when a file is copied over in place.'''
+        index = paths.get_index(self.tmp, 'static')
+        upgrade = pjoin(self.tmp, 'upgrade.js')
+        touch(upgrade, b'123')
+        os.utime(upgrade, (1, 1))
+        shutil.copy2(upgrade, pjoin(self.tmp, 'two.js'))
+        # Only the file changed, not its directory
+        os.remove(upgrade)
+        dir_mtime = index._dir_mtimes[0][1]
+        os.utime(self.tmp, (dir_mtime, dir_mtime))
+        rebuilt = paths.get_index(self.tmp, 'static')
+        self.assertIsNot(rebuilt, index)
+        self.assertNotEqual(rebuilt.digest, index.digest)
@@ -0,0 +1,187 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import copy
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from os.path import join as pjoin
+
+from dashboards_bundlers import resumable, sessions
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ResumableHandler(BaseHTTPRequestHandler):
+    '''
+    Stand-in dashboard server implementing the resumable upload protocol.
+    Chunks listed in server.drops are cut off halfway, chunks listed in
+    server.stalls are answered too late and chunks after server.down_after
+    are refused.
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def respond(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_POST(self):
+        server = self.server
+        body = self.read_body()
+        if not server.supported:
+            return self.respond(404, {})
+        if self.path == '/_api/uploads':
+            spec = json.loads(body.decode('utf-8'))
+            upload_id = str(len(server.uploads) + 1)
+            server.uploads[upload_id] = {'spec': spec, 'data': b''}
+            return self.respond(201, {'id': upload_id, 'offset': 0})
+        upload_id = self.path.split('/')[3]
+        upload = server.uploads[upload_id]
+        if len(upload['data']) != upload['spec']['size']:
+            return self.respond(400, {})
+        server.deployed[upload['spec']['name']] = upload['data']
+        self.respond(200, {'link': 'http://dashboard-server/dashboards/x'})
+
+    def do_GET(self):
+        upload = self.server.uploads.get(self.path.split('/')[3])
+        if upload is None:
+            return self.respond(404, {})
+        self.respond(200, {'offset': len(upload['data'])})
+
+    def do_PUT(self):
+        server = self.server
+        upload = server.uploads[self.path.split('/')[3]]
+        body = self.read_body()
+        server.put_bytes += len(body)
+        server.puts += 1
+        first = int(self.headers['Content-Range'].split()[1].split('-')[0])
+        if first != len(upload['data']):
+            return self.respond(409, {'offset': len(upload['data'])})
+        if server.down_after is not None and server.puts > server.down_after:
+            return self.respond(503, {})
+        if server.puts in server.drops:
+            # Keep half the chunk, then hang up without answering
+            upload['data'] += body[:len(body) // 2]
+            self.close_connection = True
+            return
+        upload['data'] += body
+        if server.puts in server.stalls:
+            time.sleep(0.5)
+        self.respond(200, {'offset': len(upload['data'])})
+
+    def log_message(self, *args):
+        pass
+
+
+class TestResumable(unittest.TestCase):
+    def setUp(self):
+        self.origin_env = copy.deepcopy(os.environ)
+        os.environ['DASHBOARD_SERVER_RETRY_BACKOFF'] = '0'
+        os.environ['DASHBOARD_SERVER_MAX_RETRIES'] = '2'
+        os.environ['DASHBOARD_SERVER_CHUNK_SIZE'] = '1000'
+        self.tmp = tempfile.mkdtemp()
+        self.bundle = pjoin(self.tmp, 'bundle.zip')
+        with open(self.bundle, 'wb') as f:
+            f.write(os.urandom(4500))
+        with open(self.bundle, 'rb') as f:
+            self.data = f.read()
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ResumableHandler)
+        self.server.supported = True
+        self.server.uploads = {}
+        self.server.deployed = {}
+        self.server.puts = 0
+        self.server.put_bytes = 0
+        self.server.drops = []
+        self.server.stalls = []
+        self.server.down_after = None
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        sessions.close_sessions()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        os.environ = self.origin_env
+
+    def upload(self, timeout=5):
+        stats = {}
+        result = resumable.upload(self.url, 'test', self.bundle, {}, True,
+                                  timeout=timeout, stats=stats)
+        return result, stats
+
+    def test_upload(self):
+        '''Should deploy a bundle sent in chunks.'''
+        result, stats = self.upload()
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(self.server.deployed['test'], self.data)
+        self.assertEqual(self.server.puts, 5)
+        self.assertEqual(stats['bytes_sent'], len(self.data))
+
+    def test_unsupported(self):
+        '''Should return None if the server does not support the protocol.'''
+        self.server.supported = False
+        result, _ = self.upload()
+        self.assertIsNone(result)
+
+    def test_resume_after_disconnect(self):
+        '''Should resume from the acknowledged offset after a disconnect.'''
+        self.server.drops = [3]
+        result, stats = self.upload()
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(self.server.deployed['test'], self.data)
+        self.assertEqual(stats['bytes_sent'], len(self.data))
+        # The interrupted chunk may be sent again in full by the connection
+        # retries before resuming, but no more
+        self.assertTrue(self.server.put_bytes <= len(self.data) + 2000,
+                        'upload should not start over')
+
+    def test_resume_after_timeout(self):
+        '''Should resume after a chunk times out.'''
+        self.server.stalls = [2]
+        result, _ = self.upload(timeout=0.2)
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(self.server.deployed['test'], self.data)
+
+    def test_resume_later(self):
+        '''Should resume an upload that failed when it is retried.'''
+        self.server.down_after = 2
+        result, _ = self.upload()
+        self.assertEqual(result.status_code, 503)
+        self.assertNotIn('test', self.server.deployed)
+
+        self.server.down_after = None
+        result, stats = self.upload()
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(len(self.server.uploads), 1, 'upload should resume')
+        self.assertEqual(stats['bytes_sent'], len(self.data) - 2000)
+        self.assertEqual(self.server.deployed['test'], self.data)
+
+    def test_timeout_setting(self):
+        '''Should read the request timeout from the environment.'''
+        self.assertEqual(sessions.timeout(), 60)
+        os.environ['DASHBOARD_SERVER_TIMEOUT'] = '2.5'
+        self.assertEqual(sessions.timeout(), 2.5)
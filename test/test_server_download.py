@@ -1,13 +1,19 @@
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
 
+import copy
+import io
+import os
 import shutil
 import tempfile
 import unittest
+import zipfile
 from os.path import join as pjoin, isdir
 
 import dashboards_bundlers.server_download as converter
 import notebook.bundler.tools
+from tornado import gen, web
+from tornado.ioloop import IOLoop
 
 
 class MockContentsManager(object):
@@ -16,7 +22,7 @@ class MockContentsManager(object):
 
 
 class MockHandler(object):
-    def __init__(self, notebook_dir):
+    def __init__(self, notebook_dir, request_headers=None):
         self.settings = {
             'base_url': '/',
             'contents_manager': MockContentsManager()
@@ -24,17 +30,29 @@ class MockHandler(object):
         self.headers = {}
         self.request = type('HTTPRequest', (object,), {
             'protocol': 'http',
-            'host': 'fake-host:5555'
+            'host': 'fake-host:5555',
+            'headers': request_headers or {}
         })
+        self.status = 200
         self.written = False
+        self.body = io.BytesIO()
+        self.flushes = 0
         self.finished = False
         self.tools = notebook.bundler.tools
 
     def set_header(self, name, value):
         self.headers[name] = value
 
-    def write(self, *args):
+    def set_status(self, status):
+        self.status = status
+
+    def write(self, chunk):
         self.written = True
+        self.body.write(chunk)
+
+    def flush(self):
+        self.flushes += 1
+        return gen.maybe_future(None)
 
     def finish(self):
         self.finished = True
@@ -42,15 +60,23 @@ class MockHandler(object):
 
 class TestServerDownload(unittest.TestCase):
     def setUp(self):
+        self.origin_env = copy.deepcopy(os.environ)
         self.tmp = tempfile.mkdtemp()
+        self.cache_tmp = tempfile.mkdtemp()
+        os.environ['DASHBOARD_BUNDLER_CACHE_DIR'] = self.cache_tmp
+
+    def bundle(self, handler, model):
+        IOLoop.current().run_sync(lambda: converter.bundle(handler, model))
 
     def tearDown(self):
+        os.environ = self.origin_env
         shutil.rmtree(self.tmp, ignore_errors=True)
+        shutil.rmtree(self.cache_tmp, ignore_errors=True)
 
     def test_bundle_ipynb(self):
         '''Should initialize an ipynb file download.'''
         handler = MockHandler(self.tmp)
-        converter.bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+        self.bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
 
         output_dir = pjoin(self.tmp, 'no_imports')
         self.assertFalse(isdir(output_dir),
@@ -66,7 +92,7 @@ class TestServerDownload(unittest.TestCase):
     def test_bundle_zip(self):
         '''Should bundle and initiate a zip file download.'''
         handler = MockHandler(self.tmp)
-        converter.bundle(handler, {'path': 'test/resources/some.ipynb'})
+        self.bundle(handler, {'path': 'test/resources/some.ipynb'})
 
         output_dir = pjoin(self.tmp, 'some')
         self.assertFalse(isdir(output_dir),
@@ -77,3 +103,104 @@ class TestServerDownload(unittest.TestCase):
                       'headers should set zip content type')
         self.assertIn('some.zip', handler.headers['Content-Disposition'],
                       'headers should name the zip file')
+        with zipfile.ZipFile(handler.body) as bundle_zip:
+            self.assertIsNone(bundle_zip.testzip(), 'zip should be valid')
+            self.assertEqual(sorted(bundle_zip.namelist()),
+                             ['index.ipynb', 'some.csv'],
+                             'zip should contain the notebook and references')
+
+    def test_bundle_ipynb_content(self):
+        '''Should stream the unmodified notebook.'''
+        handler = MockHandler(self.tmp)
+        self.bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+
+        with open('test/resources/no_imports.ipynb', 'rb') as f:
+            self.assertEqual(handler.body.getvalue(), f.read(),
+                             'notebook should be sent as-is')
+        self.assertTrue(handler.flushes > 0, 'chunks should be flushed')
+
+    def test_deterministic_etag(self):
+        '''Should send identical bytes under the same ETag.'''
+        first = MockHandler(self.tmp)
+        self.bundle(first, {'path': 'test/resources/some.ipynb'})
+        second = MockHandler(self.tmp)
+        self.bundle(second, {'path': 'test/resources/some.ipynb'})
+
+        self.assertIn('Etag', first.headers)
+        self.assertEqual(first.headers['Etag'], second.headers['Etag'])
+        self.assertEqual(first.body.getvalue(), second.body.getvalue())
+
+    def test_not_modified(self):
+        '''Should answer a matching conditional request with 304.'''
+        first = MockHandler(self.tmp)
+        self.bundle(first, {'path': 'test/resources/some.ipynb'})
+        etag = first.headers['Etag']
+
+        handler = MockHandler(self.tmp, {'If-None-Match': 'W/"other", ' + etag})
+        self.bundle(handler, {'path': 'test/resources/some.ipynb'})
+        self.assertEqual(handler.status, 304)
+        self.assertFalse(handler.written, 'no body should be sent')
+        self.assertTrue(handler.finished, 'response should be finished')
+
+        handler = MockHandler(self.tmp, {'If-None-Match': '"other"'})
+        self.bundle(handler, {'path': 'test/resources/some.ipynb'})
+        self.assertEqual(handler.status, 200)
+        self.assertTrue(handler.written, 'bundle should be sent')
+
+    def test_cached_zip(self):
+        '''Should send a cached zip with its length while unchanged.'''
+        first = MockHandler(self.tmp)
+        self.bundle(first, {'path': 'test/resources/some.ipynb'})
+        downloads = pjoin(self.cache_tmp, 'downloads')
+        self.assertEqual(len(os.listdir(downloads)), 1, 'zip should be cached')
+        self.assertNotIn('Content-Length', first.headers,
+                         'first download should be streamed')
+        cached = pjoin(downloads, os.listdir(downloads)[0])
+        # Prove the second download comes from the cache
+        with open(cached, 'ab') as f:
+            f.write(b'cached')
+
+        second = MockHandler(self.tmp)
+        self.bundle(second, {'path': 'test/resources/some.ipynb'})
+        self.assertEqual(second.body.getvalue(),
+                         first.body.getvalue() + b'cached')
+        self.assertEqual(second.headers['Content-Length'],
+                         len(second.body.getvalue()))
+
+    def test_cache_disabled(self):
+        '''Should stream zips without caching them if disabled.'''
+        os.environ['DASHBOARD_BUNDLER_CACHE_SIZE'] = '0'
+        handler = MockHandler(self.tmp)
+        self.bundle(handler, {'path': 'test/resources/some.ipynb'})
+        self.assertNotIn('Content-Length', handler.headers)
+        self.assertEqual(os.listdir(self.cache_tmp), [])
+        with zipfile.ZipFile(handler.body) as bundle_zip:
+            self.assertIsNone(bundle_zip.testzip(), 'zip should be valid')
+
+    def test_cache_too_large(self):
+        '''Should stream zips larger than the cache without keeping them.'''
+        os.environ['DASHBOARD_BUNDLER_DOWNLOAD_CACHE_SIZE'] = '10'
+        handler = MockHandler(self.tmp)
+        self.bundle(handler, {'path': 'test/resources/some.ipynb'})
+        self.assertEqual(os.listdir(pjoin(self.cache_tmp, 'downloads')), [])
+        with zipfile.ZipFile(handler.body) as bundle_zip:
+            self.assertIsNone(bundle_zip.testzip(), 'zip should be valid')
+
+    def test_abandoned_download(self):
+        '''Should not cache a zip whose download did not complete.'''
+        handler = MockHandler(self.tmp)
+
+        def flush():
+            raise IOError('Stream closed')
+        handler.flush = flush
+        with self.assertRaises(IOError):
+            self.bundle(handler, {'path': 'test/resources/some.ipynb'})
+        self.assertEqual(os.listdir(pjoin(self.cache_tmp, 'downloads')), [])
+
+    def test_too_large(self):
+        '''Should reject a bundle over the size limits before sending it.'''
+        os.environ['DASHBOARD_BUNDLER_MAX_BUNDLE_SIZE'] = '10'
+        handler = MockHandler(self.tmp)
+        with self.assertRaises(web.HTTPError) as cm:
+            self.bundle(handler, {'path': 'test/resources/some.ipynb'})
+        self.assertEqual(cm.exception.status_code, 413)
@@ -3,9 +3,13 @@
 
 import copy
 import errno
+import io
 import os
 import shutil
+import subprocess
+import sys
 import tempfile
+import threading
 import unittest
 import zipfile
 from os.path import exists, join as pjoin
@@ -14,13 +18,32 @@ import dashboards_bundlers.server_upload as converter
 import notebook.bundler.tools
 from jupyter_core.paths import jupyter_data_dir
 from tornado import web
+from tornado.ioloop import IOLoop
 
 dashboard_link = 'http://notebook-server:3000/dashboards/test'
 
 
+def read_upload(kwargs):
+    '''Returns the contents of the file in a posted multipart body.'''
+    body = b''.join(kwargs['data'])
+    boundary = kwargs['headers']['Content-Type'].split('boundary=')[1]
+    _, _, content = body.partition(b'\r\n\r\n')
+    suffix = '\r\n--{}--\r\n'.format(boundary).encode('utf-8')
+    assert content.endswith(suffix), 'multipart body should be terminated'
+    return content[:-len(suffix)]
+
+
+def request_headers(kwargs):
+    '''Returns the posted headers other than the multipart content type.'''
+    headers = dict(kwargs['headers'])
+    assert headers.pop('Content-Type').startswith('multipart/form-data')
+    return headers
+
+
 class MockResult(object):
     def __init__(self, status_code, include_link=True):
         self.status_code = status_code
+        self.reason = 'Reason'
         if (include_link):
             self.json = lambda: {'link': dashboard_link}
         else:
@@ -37,8 +60,10 @@ class MockPost(object):
     def __call__(self, *args, **kwargs):
         if self.args or self.kwargs:
             raise RuntimeError('MockPost already invoked')
+        self.thread = threading.current_thread()
         self.args = args
         self.kwargs = kwargs
+        self.uploaded = read_upload(kwargs)
         return MockResult(self.status_code, self.include_result_link)
 
 
@@ -56,11 +81,57 @@ class MockZipPost(object):
             raise RuntimeError('MockZipPost already invoked')
         self.args = args
         self.kwargs = kwargs
-        uploaded_zip = zipfile.ZipFile(kwargs['files']['file'], 'r')
+        self.uploaded = read_upload(kwargs)
+        uploaded_zip = zipfile.ZipFile(io.BytesIO(self.uploaded), 'r')
         self.zipped_files = uploaded_zip.namelist()
         return MockResult(self.status_code)
 
 
+class MockSession(object):
+    '''
+    Stands in for the pooled session used to reach the dashboard server
+    '''
+    def __init__(self, post, put=None):
+        self.post = post
+        self.put = put
+
+
+class MockDeltaServer(object):
+    '''
+    Stand-in dashboard server implementing the delta upload protocol
+    '''
+    def __init__(self, supported=True):
+        self.supported = supported
+        self.blobs = {}
+        self.put_hashes = []
+        self.manifests = {}
+        self.full_uploads = []
+
+    def post(self, url, **kwargs):
+        if url.endswith('/_api/blobs/missing'):
+            if not self.supported:
+                return MockResult(404)
+            missing = [h for h in kwargs['json']['hashes']
+                       if h not in self.blobs]
+            result = MockResult(200)
+            result.json = lambda: {'missing': missing}
+            return result
+        elif url.endswith('/manifest'):
+            files = kwargs['json']['files']
+            if not all(h in self.blobs for h in files.values()):
+                return MockResult(400)
+            self.manifests[url] = files
+            return MockResult(200)
+        self.full_uploads.append(url)
+        return MockResult(200)
+
+    def put(self, url, data, **kwargs):
+        sha = url.rsplit('/', 1)[1]
+        self.blobs[sha] = data.read()
+        self.put_hashes.append(sha)
+        return MockResult(201)
+
+
 class MockRequest(object):
     def __init__(self, host, protocol):
         self.host = host
@@ -73,45 +144,62 @@ class MockContentsManager(object):
 
 
 class MockHandler(object):
-    def __init__(self, host='notebook-server:8888', protocol='http'):
+    def __init__(self, host='notebook-server:8888', protocol='http',
+                 arguments=None):
         self.settings = {
             'base_url': '/',
             'contents_manager': MockContentsManager()
         }
         self.request = MockRequest(host, protocol)
+        self.arguments = arguments or {}
         self.last_redirect = None
         self.tools = notebook.bundler.tools
 
+    def get_query_argument(self, name, default=None):
+        return self.arguments.get(name, default)
+
     def redirect(self, location):
         self.last_redirect = location
 
 
+def bundle(handler, model):
+    '''Runs the bundler coroutine to completion.'''
+    IOLoop.current().run_sync(lambda: converter.bundle(handler, model))
+
+
 class TestServerUpload(unittest.TestCase):
     def setUp(self):
         self.origin_env = copy.deepcopy(os.environ)
-        converter.requests.post = MockPost(200)
+        self.origin_get_session = converter.sessions.get_session
+        self.use_post(MockPost(200))
 
     def tearDown(self):
         os.environ = self.origin_env
+        converter.sessions.get_session = self.origin_get_session
+
+    def use_post(self, post):
+        self.post = post
+        converter.sessions.get_session = lambda url, verify=True: MockSession(post)
 
     def test_no_server(self):
         '''Should error if no server URL is set.'''
         handler = MockHandler('fake-host:8000', 'http')
-        self.assertRaises(web.HTTPError, converter.bundle, handler,
+        self.assertRaises(web.HTTPError, bundle, handler,
                           {'path': 'test/resources/no_imports.ipynb'})
 
     def test_upload_notebook(self):
         '''Should POST the notebook and redirect to the dashboard server.'''
         os.environ['DASHBOARD_SERVER_URL'] = 'http://dashboard-server'
         handler = MockHandler()
-        converter.bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+        bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
 
-        args = converter.requests.post.args
-        kwargs = converter.requests.post.kwargs
+        args = self.post.args
+        kwargs = self.post.kwargs
         self.assertEqual(args[0],
                          'http://dashboard-server/_api/notebooks/no_imports')
-        self.assertTrue(kwargs['files']['file'])
-        self.assertEqual(kwargs['headers'], {})
+        with open('test/resources/no_imports.ipynb', 'rb') as f:
+            self.assertEqual(self.post.uploaded, f.read())
+        self.assertEqual(request_headers(kwargs), {})
         self.assertEqual(handler.last_redirect, dashboard_link)
 
     def test_upload_zip(self):
@@ -121,50 +209,95 @@ class TestServerUpload(unittest.TestCase):
         '''
         os.environ['DASHBOARD_SERVER_URL'] = 'http://dashboard-server'
         handler = MockHandler()
-        converter.requests.post = MockZipPost(200)
-        converter.bundle(handler, {'path': 'test/resources/some.ipynb'})
+        self.use_post(MockZipPost(200))
+        bundle(handler, {'path': 'test/resources/some.ipynb'})
 
-        args = converter.requests.post.args
-        kwargs = converter.requests.post.kwargs
+        args = self.post.args
+        kwargs = self.post.kwargs
         self.assertEqual(args[0],
                          'http://dashboard-server/_api/notebooks/some')
-        self.assertTrue(kwargs['files']['file'])
-        self.assertEqual(kwargs['headers'], {})
+        self.assertTrue(self.post.uploaded)
+        self.assertEqual(request_headers(kwargs), {})
+        self.assertEqual(handler.last_redirect, dashboard_link)
+        self.assertTrue('index.ipynb' in self.post.zipped_files)
+        self.assertTrue('some.csv' in self.post.zipped_files)
+
+    def test_upload_off_ioloop(self):
+        '''Should POST from a worker thread, not the IOLoop thread.'''
+        os.environ['DASHBOARD_SERVER_URL'] = 'http://dashboard-server'
+        handler = MockHandler()
+        bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+
+        self.assertIsNot(self.post.thread,
+                         threading.current_thread())
+        self.assertEqual(handler.last_redirect, dashboard_link)
+
+    def test_staging_wait_on_ioloop(self):
+        '''Should wait for the staging area on the IOLoop thread.'''
+        os.environ['DASHBOARD_SERVER_URL'] = 'http://dashboard-server'
+        area = converter.get_area()
+        callers = []
+
+        class Area(object):
+            def acquire(self, size=0):
+                callers.append(threading.current_thread())
+                return area.acquire(size)
+
+            def __getattr__(self, name):
+                return getattr(area, name)
+        origin_get_area = converter.get_area
+        converter.get_area = Area
+        try:
+            handler = MockHandler()
+            bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+        finally:
+            converter.get_area = origin_get_area
+        self.assertEqual(callers, [threading.current_thread()])
         self.assertEqual(handler.last_redirect, dashboard_link)
-        self.assertTrue('index.ipynb' in converter.requests.post.zipped_files)
-        self.assertTrue('some.csv' in converter.requests.post.zipped_files)
+
+    def test_upload_chunked(self):
+        '''Should stream the upload with chunked transfer encoding.'''
+        os.environ['DASHBOARD_SERVER_URL'] = 'http://dashboard-server'
+        os.environ['DASHBOARD_SERVER_CHUNKED_UPLOAD'] = 'yes'
+        handler = MockHandler()
+        bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+
+        self.assertFalse(hasattr(self.post.kwargs['data'], '__len__'),
+                         'body should have no length')
+        with open('test/resources/no_imports.ipynb', 'rb') as f:
+            self.assertEqual(self.post.uploaded, f.read())
 
     def test_upload_token(self):
         '''Should include an auth token in the request.'''
         os.environ['DASHBOARD_SERVER_URL'] = 'http://dashboard-server'
         os.environ['DASHBOARD_SERVER_AUTH_TOKEN'] = 'fake-token'
         handler = MockHandler()
-        converter.bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+        bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
 
-        kwargs = converter.requests.post.kwargs
-        self.assertEqual(kwargs['headers'],
+        kwargs = self.post.kwargs
+        self.assertEqual(request_headers(kwargs),
                          {'Authorization': 'token fake-token'})
 
     def test_url_interpolation(self):
         '''Should build the server URL from the request Host header.'''
         os.environ['DASHBOARD_SERVER_URL'] = '{protocol}://{hostname}:8889'
         handler = MockHandler('notebook-server:8888', 'https')
-        converter.bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+        bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
 
-        args = converter.requests.post.args
+        args = self.post.args
         self.assertEqual(args[0],
                          'https://notebook-server:8889/_api/notebooks/no_imports')
         self.assertEqual(handler.last_redirect, dashboard_link)
 
     def test_redirect_fallback(self):
         '''Should redirect to the given URL'''
-        converter.requests.post = MockPost(200, False)
+        self.use_post(MockPost(200, False))
         os.environ['DASHBOARD_SERVER_URL'] = '{protocol}://{hostname}:8889'
         os.environ['DASHBOARD_REDIRECT_URL'] = 'http://{hostname}:3000'
         handler = MockHandler('notebook-server:8888', 'https')
-        converter.bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+        bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
 
-        args = converter.requests.post.args
+        args = self.post.args
         self.assertEqual(args[0],
                          'https://notebook-server:8889/_api/notebooks/no_imports')
         self.assertEqual(handler.last_redirect,
@@ -174,8 +307,8 @@ class TestServerUpload(unittest.TestCase):
         '''Should verify SSL certificate by default.'''
         handler = MockHandler()
         os.environ['DASHBOARD_SERVER_URL'] = '{protocol}://{hostname}:8889'
-        converter.bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
-        kwargs = converter.requests.post.kwargs
+        bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+        kwargs = self.post.kwargs
         self.assertEqual(kwargs['verify'], True)
 
     def test_no_ssl_verify(self):
@@ -183,11 +316,260 @@ class TestServerUpload(unittest.TestCase):
         os.environ['DASHBOARD_SERVER_NO_SSL_VERIFY'] = 'yes'
         os.environ['DASHBOARD_SERVER_URL'] = '{protocol}://{hostname}:8889'
         handler = MockHandler()
-        converter.bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
-        kwargs = converter.requests.post.kwargs
+        bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+        kwargs = self.post.kwargs
         self.assertEqual(kwargs['verify'], False)
 
 
+class TestSizeLimits(unittest.TestCase):
+    def setUp(self):
+        self.origin_env = copy.deepcopy(os.environ)
+        self.origin_get_session = converter.sessions.get_session
+        self.post = MockPost(200)
+        converter.sessions.get_session = lambda url, verify=True: MockSession(self.post)
+        os.environ['DASHBOARD_SERVER_URL'] = 'http://dashboard-server'
+
+    def tearDown(self):
+        os.environ = self.origin_env
+        converter.sessions.get_session = self.origin_get_session
+
+    def assertTooLarge(self, path):
+        with self.assertRaises(web.HTTPError) as cm:
+            bundle(MockHandler(), {'path': path})
+        self.assertEqual(cm.exception.status_code, 413)
+        self.assertIsNone(self.post.args, 'nothing should be uploaded')
+
+    def test_bundle_sizes(self):
+        '''Should list the size of every file in the bundle.'''
+        sizes = dict(converter.bundle_sizes('test/resources/some.ipynb',
+                                            notebook.bundler.tools))
+        self.assertEqual(sorted(sizes), ['index.ipynb', 'some.csv'])
+        self.assertEqual(sizes['some.csv'],
+                         os.path.getsize('test/resources/some.csv'))
+
+    def test_max_bundle_size(self):
+        '''Should reject a bundle over the total size limit up front.'''
+        os.environ['DASHBOARD_BUNDLER_MAX_BUNDLE_SIZE'] = '10'
+        self.assertTooLarge('test/resources/some.ipynb')
+
+    def test_max_file_size(self):
+        '''Should reject a bundle with a file over the size limit.'''
+        os.environ['DASHBOARD_BUNDLER_MAX_FILE_SIZE'] = '10'
+        self.assertTooLarge('test/resources/no_imports.ipynb')
+
+    def test_within_limits(self):
+        '''Should deploy a bundle within the size limits.'''
+        os.environ['DASHBOARD_BUNDLER_MAX_FILE_SIZE'] = '1000000'
+        os.environ['DASHBOARD_BUNDLER_MAX_BUNDLE_SIZE'] = '1000000'
+        handler = MockHandler()
+        bundle(handler, {'path': 'test/resources/some.ipynb'})
+        self.assertEqual(handler.last_redirect, dashboard_link)
+
+    def test_server_rejects(self):
+        '''Should pass on the status of a bundle the server rejects.'''
+        self.post.status_code = 413
+        with self.assertRaises(web.HTTPError) as cm:
+            bundle(MockHandler(), {'path': 'test/resources/no_imports.ipynb'})
+        self.assertEqual(cm.exception.status_code, 413)
+        self.assertIn('no_imports', cm.exception.log_message % cm.exception.args)
+
+
+class TestFanOut(unittest.TestCase):
+    def setUp(self):
+        self.origin_env = copy.deepcopy(os.environ)
+        self.origin_get_session = converter.sessions.get_session
+        self.posts = {}
+        self.statuses = {}
+        self.in_flight = []
+        self.all_in_flight = threading.Event()
+        os.environ['DASHBOARD_SERVER_URLS'] = ('http://a:3000 http://b:3000,'
+                                               'http://c:3000')
+
+        def get_session(url, verify=True):
+            server = url.split('/')[2]
+            post = MockPost(self.statuses.get(server, 200), False)
+            self.posts[server] = post
+
+            def concurrent_post(*args, **kwargs):
+                # Hold each upload until all of them are in flight
+                self.in_flight.append(server)
+                if len(self.in_flight) == 3:
+                    self.all_in_flight.set()
+                self.all_in_flight.wait(5)
+                return post(*args, **kwargs)
+            return MockSession(concurrent_post)
+        converter.sessions.get_session = get_session
+
+    def tearDown(self):
+        os.environ = self.origin_env
+        converter.sessions.get_session = self.origin_get_session
+
+    def test_servers(self):
+        '''Should read the list of servers, or the single server.'''
+        self.assertEqual(converter.get_dashboard_servers('http', 'nb', '8888'),
+                         ['http://a:3000', 'http://b:3000', 'http://c:3000'])
+        del os.environ['DASHBOARD_SERVER_URLS']
+        os.environ['DASHBOARD_SERVER_URL'] = '{protocol}://{hostname}:3000'
+        self.assertEqual(converter.get_dashboard_servers('http', 'nb', '8888'),
+                         ['http://nb:3000'])
+
+    def test_fan_out(self):
+        '''Should upload the bundle to every server concurrently.'''
+        handler = MockHandler()
+        bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+
+        self.assertEqual(sorted(self.posts), ['a:3000', 'b:3000', 'c:3000'])
+        with open('test/resources/no_imports.ipynb', 'rb') as f:
+            expected = f.read()
+        for post in self.posts.values():
+            self.assertEqual(post.uploaded, expected)
+        self.assertTrue(self.all_in_flight.is_set(),
+                        'uploads should run concurrently')
+        self.assertEqual(handler.last_redirect,
+                         'http://a:3000/dashboards/no_imports')
+
+    def test_quorum(self):
+        '''Should redirect to a server that accepted the bundle.'''
+        os.environ['DASHBOARD_SERVER_QUORUM'] = '2'
+        self.statuses['a:3000'] = 500
+        handler = MockHandler()
+        bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+        self.assertEqual(handler.last_redirect,
+                         'http://b:3000/dashboards/no_imports')
+
+    def test_quorum_not_met(self):
+        '''Should fail if too few servers accepted the bundle.'''
+        os.environ['DASHBOARD_SERVER_QUORUM'] = '2'
+        self.statuses['a:3000'] = self.statuses['c:3000'] = 503
+        handler = MockHandler()
+        with self.assertRaises(web.HTTPError) as cm:
+            bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+        self.assertEqual(cm.exception.status_code, 502)
+        self.assertIsNone(handler.last_redirect)
+
+    def test_quorum_redeploy(self):
+        '''Should redeploy an unchanged dashboard a server missed.'''
+        state_tmp = tempfile.mkdtemp()
+        try:
+            os.environ['DASHBOARD_BUNDLER_STATE_DIR'] = state_tmp
+            os.environ['DASHBOARD_SERVER_SKIP_UNCHANGED'] = 'yes'
+            os.environ['DASHBOARD_SERVER_QUORUM'] = '1'
+            self.statuses['b:3000'] = 500
+            bundle(MockHandler(), {'path': 'test/resources/no_imports.ipynb'})
+            self.posts.clear()
+            bundle(MockHandler(), {'path': 'test/resources/no_imports.ipynb'})
+            self.assertEqual(sorted(self.posts), ['a:3000', 'b:3000',
+                                                  'c:3000'])
+        finally:
+            shutil.rmtree(state_tmp, ignore_errors=True)
+
+    def test_all_required(self):
+        '''Should require every server to accept the bundle by default.'''
+        self.statuses['c:3000'] = 500
+        self.assertRaises(web.HTTPError, bundle, MockHandler(),
+                          {'path': 'test/resources/no_imports.ipynb'})
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_import(self):
+        '''Should not import the dependencies only needed to bundle.'''
+        heavy = ['nbformat', 'notebook.base.handlers', 'notebook.utils',
+                 'jupyter_core.paths', 'requests']
+        output = subprocess.check_output([sys.executable, '-c', '''
+import sys
+import dashboards_bundlers.jobs, dashboards_bundlers.metrics
+import dashboards_bundlers.server_download, dashboards_bundlers.server_upload
+print(' '.join(name for name in {} if name in sys.modules))
+'''.format(heavy)])
+        self.assertEqual(output.decode('utf-8').strip(), '')
+
+
+class TestDeltaUpload(unittest.TestCase):
+    def setUp(self):
+        self.origin_env = copy.deepcopy(os.environ)
+        self.origin_get_session = converter.sessions.get_session
+        os.environ['DASHBOARD_SERVER_URL'] = 'http://dashboard-server'
+        os.environ['DASHBOARD_SERVER_DELTA_UPLOAD'] = 'yes'
+
+    def tearDown(self):
+        os.environ = self.origin_env
+        converter.sessions.get_session = self.origin_get_session
+
+    def use_server(self, server):
+        session = MockSession(server.post, server.put)
+        converter.sessions.get_session = lambda url, verify=True: session
+
+    def test_delta_upload(self):
+        '''Should only upload files the server does not have.'''
+        server = MockDeltaServer()
+        self.use_server(server)
+        handler = MockHandler()
+        bundle(handler, {'path': 'test/resources/some.ipynb'})
+
+        manifest = server.manifests[
+            'http://dashboard-server/_api/notebooks/some/manifest']
+        self.assertEqual(sorted(manifest), ['index.ipynb', 'some.csv'])
+        self.assertEqual(len(server.put_hashes), 2)
+        self.assertEqual(handler.last_redirect, dashboard_link)
+
+        # Redeploying unchanged files uploads no blobs
+        server.put_hashes = []
+        bundle(MockHandler(), {'path': 'test/resources/some.ipynb'})
+        self.assertEqual(server.put_hashes, [])
+        self.assertEqual(server.full_uploads, [])
+
+    def test_delta_unsupported(self):
+        '''Should fall back to a full upload.'''
+        server = MockDeltaServer(supported=False)
+        self.use_server(server)
+        handler = MockHandler()
+        bundle(handler, {'path': 'test/resources/some.ipynb'})
+
+        self.assertEqual(server.full_uploads,
+                         ['http://dashboard-server/_api/notebooks/some'])
+        self.assertEqual(server.put_hashes, [])
+        self.assertEqual(handler.last_redirect, dashboard_link)
+
+
+class TestSkipUnchanged(unittest.TestCase):
+    def setUp(self):
+        self.origin_env = copy.deepcopy(os.environ)
+        self.origin_get_session = converter.sessions.get_session
+        self.state_tmp = tempfile.mkdtemp()
+        os.environ['DASHBOARD_BUNDLER_STATE_DIR'] = self.state_tmp
+        os.environ['DASHBOARD_SERVER_SKIP_UNCHANGED'] = 'yes'
+        os.environ['DASHBOARD_SERVER_URL'] = 'http://dashboard-server'
+
+    def tearDown(self):
+        os.environ = self.origin_env
+        converter.sessions.get_session = self.origin_get_session
+        shutil.rmtree(self.state_tmp, ignore_errors=True)
+
+    def deploy(self, status_code=200, **arguments):
+        post = MockPost(status_code)
+        converter.sessions.get_session = lambda url, verify=True: MockSession(post)
+        handler = MockHandler(arguments=arguments)
+        bundle(handler, {'path': 'test/resources/no_imports.ipynb'})
+        self.assertEqual(handler.last_redirect, dashboard_link)
+        return post
+
+    def test_skip_unchanged(self):
+        '''Should redirect without uploading an unchanged dashboard.'''
+        self.assertIsNotNone(self.deploy().args)
+        self.assertIsNone(self.deploy().args, 'upload should be skipped')
+
+    def test_force(self):
+        '''Should upload an unchanged dashboard when forced.'''
+        self.deploy()
+        self.assertIsNotNone(self.deploy(force='true').args)
+
+    def test_redeploy_after_failure(self):
+        '''Should upload again after a failed deploy.'''
+        self.deploy()
+        self.assertRaises(web.HTTPError, self.deploy, 500, force='yes')
+        self.assertIsNotNone(self.deploy().args)
+
+
 # Mock existence of declarative widgets
 DECL_WIDGETS_DIR = pjoin(jupyter_data_dir(), 'nbextensions/urth_widgets/')
 DECL_WIDGETS_JS_DIR = pjoin(DECL_WIDGETS_DIR, 'js')
@@ -196,6 +578,12 @@ DECL_CORE_DIR = pjoin(DECL_WIDGETS_DIR, 'components/urth-core')
 BOWER_COMPONENT_DIR = pjoin(jupyter_data_dir(),
                             'nbextensions/urth_widgets/urth_components/component-a')
 
+IMPORTS_NOTEBOOK = u'''{
+ "cells": [{"cell_type": "markdown", "metadata": {}, "source":
+  "<link rel='import' href='urth_components/component-a/component-a.html' is='urth-core-import'>"}],
+ "metadata": {}, "nbformat": 4, "nbformat_minor": 0
+}'''
+
 
 class TestBundleWidgets(unittest.TestCase):
     @classmethod
@@ -209,10 +597,21 @@ class TestBundleWidgets(unittest.TestCase):
                     raise
 
     def setUp(self):
+        self.origin_env = copy.deepcopy(os.environ)
         self.tmp = tempfile.mkdtemp()
+        self.cache_tmp = tempfile.mkdtemp()
+        os.environ['DASHBOARD_BUNDLER_CACHE_DIR'] = self.cache_tmp
 
     def tearDown(self):
+        os.environ = self.origin_env
         shutil.rmtree(self.tmp, ignore_errors=True)
+        shutil.rmtree(self.cache_tmp, ignore_errors=True)
+
+    def write_component(self):
+        component_file = pjoin(BOWER_COMPONENT_DIR, 'component-a.html')
+        with open(component_file, 'w') as f:
+            f.write('<link rel="import" href="../polymer/polymer.html">')
+        return component_file
 
     def test_bundle_declarative_widgets(self):
         '''Should write declarative widgets to output.'''
@@ -232,3 +631,78 @@ class TestBundleWidgets(unittest.TestCase):
                          'urth_widgets should not exist')
         self.assertFalse(exists(pjoin(self.tmp, 'static/urth_components')),
                          'urth_components should not exist')
+
+    def test_list_declarative_widgets(self):
+        '''Should list widget files without copying them.'''
+        os.environ['DASHBOARD_BUNDLER_CACHE_SIZE'] = '0'
+        component_file = self.write_component()
+        files, fragments = converter.list_bundle_contents(
+            os.path.abspath('test/resources/env.ipynb'), None)
+
+        self.assertEqual(fragments, [])
+        self.assertEqual(files[0][0], 'index.ipynb')
+        self.assertIn((pjoin('urth_components', 'component-a', 'component-a.html'),
+                       component_file), files)
+        self.assertEqual(os.listdir(self.tmp), [],
+                         'nothing should be staged')
+
+    def test_prune_declarative_widgets(self):
+        '''Should only list the components the notebook imports.'''
+        os.environ['DASHBOARD_BUNDLER_CACHE_SIZE'] = '0'
+        os.environ['DASHBOARD_BUNDLER_PRUNE_COMPONENTS'] = 'yes'
+        self.write_component()
+        unused_dir = pjoin(os.path.dirname(BOWER_COMPONENT_DIR), 'unused')
+        os.makedirs(unused_dir)
+        try:
+            with open(pjoin(unused_dir, 'unused.html'), 'w') as f:
+                f.write('')
+            nb_path = pjoin(self.tmp, 'imports.ipynb')
+            with open(nb_path, 'w') as f:
+                f.write(IMPORTS_NOTEBOOK)
+            files, _ = converter.list_bundle_contents(nb_path, None)
+        finally:
+            shutil.rmtree(unused_dir)
+        arcnames = [arcname for arcname, _ in files]
+        self.assertIn(pjoin('urth_components', 'component-a',
+                            'component-a.html'), arcnames)
+        self.assertNotIn(pjoin('urth_components', 'unused', 'unused.html'),
+                         arcnames)
+
+    def test_cached_identical(self):
+        '''Should produce the same bundle with or without cached assets.'''
+        self.write_component()
+        nb_path = os.path.abspath('test/resources/env.ipynb')
+        bundles = []
+        for cache_size in ('', '', '0'):
+            os.environ['DASHBOARD_BUNDLER_CACHE_SIZE'] = cache_size
+            zip_path = converter.make_upload_bundle(
+                nb_path, pjoin(self.tmp, 'env{}'.format(len(bundles))), None)
+            with open(zip_path, 'rb') as f:
+                bundles.append(f.read())
+        self.assertEqual(len(os.listdir(pjoin(self.cache_tmp, 'fragments'))),
+                         1, 'widget assets should be cached')
+        self.assertEqual(bundles[0], bundles[1])
+        self.assertEqual(bundles[1], bundles[2])
+
+    def test_cached_declarative_widgets(self):
+        '''Should splice cached widget assets into the upload bundle.'''
+        self.write_component()
+        nb_path = os.path.abspath('test/resources/env.ipynb')
+        zip_path = converter.make_upload_bundle(nb_path, pjoin(self.tmp, 'env'),
+                                                None)
+
+        self.assertFalse(exists(pjoin(self.tmp, 'env', 'urth_components')),
+                         'widget assets should not be copied')
+        fragments_dir = pjoin(self.cache_tmp, 'fragments')
+        self.assertEqual(len(os.listdir(fragments_dir)), 1,
+                         'widget assets should be cached')
+        with zipfile.ZipFile(zip_path) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertIn('urth_components/component-a/component-a.html',
+                          zf.namelist())
+
+        # A second bundle reuses the cached fragment
+        _, fragments = converter.list_bundle_contents(nb_path, None)
+        with fragments[0]:
+            self.assertEqual(os.listdir(fragments_dir),
+                             [os.path.basename(fragments[0].name)])
@@ -0,0 +1,107 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import copy
+import os
+import threading
+import unittest
+
+from dashboards_bundlers import metrics, sessions
+from dashboards_bundlers.multipart import MultipartFile
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    '''Answers with 502 until told otherwise, keeping connections alive'''
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.server.bodies.append(
+            self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        self.server.posts += 1
+        if self.server.failures > 0:
+            self.server.failures -= 1
+            status = 502
+        else:
+            status = 200
+        body = b'{}'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSessions(unittest.TestCase):
+    def setUp(self):
+        self.origin_env = copy.deepcopy(os.environ)
+        os.environ['DASHBOARD_SERVER_RETRY_BACKOFF'] = '0'
+        self.server = HTTPServer(('127.0.0.1', 0), FlakyHandler)
+        self.server.posts = 0
+        self.server.bodies = []
+        self.server.failures = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{}/_api/notebooks/test'.format(
+            self.server.server_address[1])
+
+    def tearDown(self):
+        sessions.close_sessions()
+        self.server.shutdown()
+        self.server.server_close()
+        os.environ = self.origin_env
+
+    def test_shared_session(self):
+        '''Should share one session per server and verification setting.'''
+        session = sessions.get_session(self.url)
+        self.assertIs(sessions.get_session(self.url + '/other'), session)
+        self.assertIsNot(sessions.get_session(self.url, False), session)
+
+    def test_retry(self):
+        '''Should retry transient gateway errors.'''
+        self.server.failures = 2
+        result = sessions.get_session(self.url).post(self.url, data=b'nb')
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(self.server.posts, 3)
+
+    def test_retry_streamed_body(self):
+        '''Should resend a complete streamed body when retrying.'''
+        self.server.failures = 1
+        with MultipartFile(__file__) as body:
+            result = sessions.get_session(self.url).post(
+                self.url, data=body,
+                headers={'Content-Type': body.content_type})
+            body.seek(0)
+            expected = body.read()
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(self.server.bodies, [expected, expected])
+
+    def test_retry_bounded(self):
+        '''Should give up after the configured number of retries.'''
+        os.environ['DASHBOARD_SERVER_MAX_RETRIES'] = '1'
+        self.server.failures = 5
+        result = sessions.get_session(self.url).post(self.url, data=b'nb')
+        self.assertEqual(result.status_code, 502)
+        self.assertEqual(self.server.posts, 2)
+
+    def test_connection_reuse(self):
+        '''Should reuse kept-alive connections.'''
+        before = sessions.get_pool_stats()
+        session = sessions.get_session(self.url)
+        for _ in range(4):
+            session.post(self.url, data=b'nb')
+        after = sessions.get_pool_stats()
+
+        self.assertEqual(after['requests'] - before['requests'], 4)
+        self.assertEqual(after['connections'] - before['connections'], 1)
+        self.assertTrue(after['reuse_rate'] > 0)
+        text = metrics.render()
+        self.assertIn('dashboards_bundlers_pool_requests_total', text)
+        self.assertIn('dashboards_bundlers_pool_connections_total', text)
@@ -0,0 +1,182 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import copy
+import errno
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from os.path import exists, join as pjoin
+
+from dashboards_bundlers import staging
+
+
+class TestStaging(unittest.TestCase):
+    def setUp(self):
+        self.origin_env = copy.deepcopy(os.environ)
+        self.tmp = tempfile.mkdtemp()
+        self.src = pjoin(self.tmp, 'src')
+        self.dst = pjoin(self.tmp, 'dst')
+        os.makedirs(pjoin(self.src, 'sub'))
+        os.makedirs(self.dst)
+        for name in ('a.csv', 'sub/b.css'):
+            with open(pjoin(self.src, name), 'w') as f:
+                f.write(name)
+
+    def tearDown(self):
+        os.environ = self.origin_env
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_stage_file_link(self):
+        '''Should hardlink files on the same filesystem.'''
+        method = staging.stage_file(pjoin(self.src, 'a.csv'),
+                                    pjoin(self.dst, 'a.csv'))
+        self.assertEqual(method, 'link')
+        self.assertTrue(os.path.samefile(pjoin(self.src, 'a.csv'),
+                                         pjoin(self.dst, 'a.csv')))
+
+    def test_stage_file_link_failure(self):
+        '''Should only stop linking across filesystems that cannot link.'''
+        origin_link = os.link
+        errors = [errno.EACCES, errno.EXDEV]
+
+        def link(src, dst):
+            raise OSError(errors.pop(0), 'link failed')
+        os.link = link
+        try:
+            staging._no_link.clear()
+            src = pjoin(self.src, 'a.csv')
+            staging.stage_file(src, pjoin(self.dst, 'a.csv'))
+            self.assertEqual(len(staging._no_link), 0)
+            staging.stage_file(src, pjoin(self.dst, 'b.csv'))
+            self.assertEqual(len(staging._no_link), 1)
+            self.assertEqual(errors, [])
+        finally:
+            os.link = origin_link
+            staging._no_link.clear()
+        self.assertEqual(staging.stage_file(src, pjoin(self.dst, 'c.csv')),
+                         'link')
+
+    def test_stage_file_copy(self):
+        '''Should copy files when links are disabled.'''
+        os.environ['DASHBOARD_BUNDLER_STAGING_LINKS'] = 'no'
+        method = staging.stage_file(pjoin(self.src, 'a.csv'),
+                                    pjoin(self.dst, 'a.csv'))
+        self.assertEqual(method, 'copy')
+        self.assertFalse(os.path.samefile(pjoin(self.src, 'a.csv'),
+                                          pjoin(self.dst, 'a.csv')))
+
+    def test_stage_filelist(self):
+        '''Should stage existing files and skip missing ones.'''
+        staging.stage_filelist(self.src, self.dst,
+                               ['a.csv', pjoin('sub', 'b.css'), 'missing.txt'])
+        self.assertTrue(exists(pjoin(self.dst, 'a.csv')))
+        self.assertTrue(exists(pjoin(self.dst, 'sub', 'b.css')))
+        self.assertFalse(exists(pjoin(self.dst, 'missing.txt')))
+
+    def test_stage_filelist_duplicates(self):
+        '''Should leave the source intact when staging a file twice.'''
+        staging.stage_filelist(self.src, self.dst, ['a.csv', 'a.csv'])
+        with open(pjoin(self.src, 'a.csv')) as f:
+            self.assertEqual(f.read(), 'a.csv')
+        os.environ['DASHBOARD_BUNDLER_STAGING_LINKS'] = 'no'
+        staging.stage_filelist(self.src, self.dst, ['a.csv'])
+        with open(pjoin(self.src, 'a.csv')) as f:
+            self.assertEqual(f.read(), 'a.csv')
+        self.assertFalse(os.path.samefile(pjoin(self.src, 'a.csv'),
+                                          pjoin(self.dst, 'a.csv')))
+
+    def test_stage_tree(self):
+        '''Should stage a whole directory tree.'''
+        staging.stage_tree(self.src, pjoin(self.dst, 'tree'))
+        with open(pjoin(self.dst, 'tree', 'sub', 'b.css')) as f:
+            self.assertEqual(f.read(), 'sub/b.css')
+
+
+class TestStagingArea(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = pjoin(self.tmp, 'staging')
+        self.areas = []
+
+    def tearDown(self):
+        for area in self.areas:
+            area.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def make_area(self, quota=0, slots=0):
+        area = staging.StagingArea(self.root, quota, slots)
+        self.areas.append(area)
+        return area
+
+    def test_slots(self):
+        '''Should queue requests beyond the number of slots.'''
+        area = self.make_area(slots=1)
+        first = area.acquire().result(timeout=1)
+        waiting = area.acquire()
+        self.assertFalse(waiting.done())
+        area.release(first)
+        self.assertFalse(exists(first))
+        second = waiting.result(timeout=1)
+        self.assertTrue(os.path.isdir(second))
+        area.release(second)
+
+    def test_quota(self):
+        '''Should queue requests beyond the quota in arrival order.'''
+        area = self.make_area(quota=100)
+        first = area.acquire(60).result(timeout=1)
+        large = area.acquire(60)
+        small = area.acquire(10)
+        self.assertFalse(large.done())
+        self.assertFalse(small.done())
+        area.release(first)
+        area.release(large.result(timeout=1))
+        area.release(small.result(timeout=1))
+
+    def test_oversized(self):
+        '''Should stage a bundle larger than the quota by itself.'''
+        area = self.make_area(quota=100)
+        path = area.acquire(500).result(timeout=1)
+        self.assertFalse(area.acquire(1).done())
+        area.release(path)
+
+    def test_acquire_off_caller(self):
+        '''Should create directories off the calling thread.'''
+        area = self.make_area()
+        callers = []
+        origin_start = area.start
+
+        def start():
+            callers.append(threading.current_thread())
+            return origin_start()
+        area.start = start
+        area.release(area.acquire().result(timeout=1))
+        self.assertNotIn(threading.current_thread(), callers)
+
+    @unittest.skipIf(staging.fcntl is None, 'needs file locks')
+    def test_sweep(self):
+        '''Should remove the staging directories of dead processes only.'''
+        alive = self.make_area()
+        alive_dir = alive.start()
+        os.makedirs(pjoin(self.root, 'bundler-dead', 'tmp1', 'notebook'))
+        with open(pjoin(self.root, 'bundler-dead.lock'), 'w') as f:
+            f.write('1234')
+        old = time.time() - 3600
+        for name in ['bundler-dead.lock', os.path.basename(alive_dir) + '.lock']:
+            os.utime(pjoin(self.root, name), (old, old))
+        other = self.make_area()
+        other.start()
+        self.assertFalse(exists(pjoin(self.root, 'bundler-dead')))
+        self.assertFalse(exists(pjoin(self.root, 'bundler-dead.lock')))
+        self.assertTrue(exists(alive_dir))
+
+    def test_close(self):
+        '''Should remove the directory of the process on close.'''
+        area = self.make_area()
+        owner_dir = area.start()
+        area.close()
+        self.assertEqual(os.listdir(self.root), [])
+        self.assertNotEqual(area.start(), owner_dir)
@@ -0,0 +1,204 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join as pjoin
+
+from dashboards_bundlers import zipstream
+from dashboards_bundlers.zipstream import (iter_zip, verify_fragment,
+                                           write_fragment)
+
+
+class TestZipStream(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write_file(self, name, data):
+        path = pjoin(self.tmp, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_roundtrip(self):
+        '''Should produce an archive readable by zipfile.'''
+        files = [
+            ('index.ipynb', self.write_file('a.ipynb', b'{"cells": []}')),
+            ('data/empty.csv', self.write_file('data/empty.csv', b'')),
+            ('data/big.bin', self.write_file('big.bin', os.urandom(300000)))
+        ]
+        archive = io.BytesIO(b''.join(iter_zip(files, chunk_size=1024)))
+
+        with zipfile.ZipFile(archive) as zf:
+            self.assertIsNone(zf.testzip(), 'CRCs should match')
+            self.assertEqual(zf.namelist(),
+                             ['data/big.bin', 'data/empty.csv', 'index.ipynb'])
+            for arcname, path in files:
+                with open(path, 'rb') as f:
+                    self.assertEqual(zf.read(arcname), f.read())
+
+    def test_chunk_size(self):
+        '''Should yield chunks close to the requested size.'''
+        files = [('big.bin', self.write_file('big.bin', os.urandom(300000)))]
+        chunks = list(iter_zip(files, chunk_size=4096))
+
+        self.assertTrue(len(chunks) > 10, 'archive should be chunked')
+        self.assertTrue(max(len(c) for c in chunks[:-1]) < 2 * 65536,
+                        'chunks should stay bounded')
+
+    def test_empty(self):
+        '''Should produce a valid empty archive.'''
+        archive = io.BytesIO(b''.join(iter_zip([])))
+        with zipfile.ZipFile(archive) as zf:
+            self.assertEqual(zf.namelist(), [])
+
+    def test_fragment(self):
+        '''Should splice fragment entries into an archive unchanged.'''
+        fragment_files = [
+            ('static/a.js', self.write_file('a.js', b'var a = 1;' * 1000)),
+            ('static/b.css', self.write_file('b.css', b'body {}'))
+        ]
+        fragment = pjoin(self.tmp, 'assets.frag')
+        with open(fragment, 'wb') as f:
+            write_fragment(fragment_files, f)
+        files = [('index.ipynb', self.write_file('a.ipynb', b'{}'))]
+        archive = io.BytesIO(b''.join(iter_zip(files, [fragment])))
+
+        with zipfile.ZipFile(archive) as zf:
+            self.assertIsNone(zf.testzip(), 'CRCs should match')
+            self.assertEqual(zf.namelist(),
+                             ['index.ipynb', 'static/a.js', 'static/b.css'])
+            self.assertEqual(zf.read('static/a.js'), b'var a = 1;' * 1000)
+
+    def test_verify_fragment(self):
+        '''Should only accept fragments of exactly the given files.'''
+        data = {'static/a.js': b'var a = 1;' * 1000, 'static/b.png': b'png'}
+        fragment_files = [(arcname, self.write_file(arcname, value))
+                          for arcname, value in sorted(data.items())]
+        digests = dict((arcname, (len(value),
+                                  hashlib.sha256(value).hexdigest()))
+                       for arcname, value in data.items())
+        fragment = io.BytesIO()
+        write_fragment(fragment_files, fragment)
+        self.assertTrue(verify_fragment(fragment, digests))
+
+        self.write_file('static/a.js', b'var a = 2;' * 1000)
+        forged = io.BytesIO()
+        write_fragment(fragment_files, forged)
+        self.assertFalse(verify_fragment(forged, digests))
+        del digests['static/b.png']
+        self.assertFalse(verify_fragment(fragment, digests))
+        self.assertFalse(verify_fragment(io.BytesIO(b'garbage'), digests))
+
+    def test_zip64(self):
+        '''Should write zip64 records for entries past the zip limits.'''
+        limit, count_limit = zipstream.ZIP64_LIMIT, zipstream.ZIP_FILECOUNT_LIMIT
+        zipstream.ZIP64_LIMIT, zipstream.ZIP_FILECOUNT_LIMIT = 1000, 3
+        try:
+            fragment_files = [('static/a.js',
+                               self.write_file('a.js', os.urandom(5000)))]
+            fragment = pjoin(self.tmp, 'assets.frag')
+            with open(fragment, 'wb') as f:
+                write_fragment(fragment_files, f)
+            files = [
+                ('index.ipynb', self.write_file('a.ipynb', b'{}')),
+                ('big.bin', self.write_file('big.bin', os.urandom(3000))),
+                ('data.csv', self.write_file('data.csv', b'a,b\n' * 2000)),
+                ('small.txt', self.write_file('small.txt', b'small'))
+            ]
+            archive = io.BytesIO(b''.join(iter_zip(files, [fragment])))
+        finally:
+            zipstream.ZIP64_LIMIT, zipstream.ZIP_FILECOUNT_LIMIT = limit, count_limit
+
+        self.assertIn(b'PK\x06\x06', archive.getvalue())
+        with zipfile.ZipFile(archive) as zf:
+            self.assertIsNone(zf.testzip(), 'CRCs should match')
+            self.assertEqual(len(zf.namelist()), 5)
+            for arcname, path in files + fragment_files:
+                with open(path, 'rb') as f:
+                    self.assertEqual(zf.read(arcname), f.read())
+
+    def test_parallel_identical(self):
+        '''Should produce the same bytes with and without threads.'''
+        files = [('f{}.txt'.format(i),
+                  self.write_file('f{}.txt'.format(i),
+                                  (u'line %d\n' % i).encode('utf-8') * 5000))
+                 for i in range(20)]
+        # One file too large to compress on the pool
+        files.append(('big.txt', self.write_file(
+            'big.txt', b'abc' * zipstream.PARALLEL_MAX_SIZE)))
+        executor = ThreadPoolExecutor(max_workers=4)
+        try:
+            parallel = b''.join(iter_zip(files, executor=executor))
+        finally:
+            executor.shutdown()
+        os.environ['DASHBOARD_BUNDLER_COMPRESSION_THREADS'] = '1'
+        try:
+            serial = b''.join(iter_zip(files))
+        finally:
+            del os.environ['DASHBOARD_BUNDLER_COMPRESSION_THREADS']
+
+        self.assertEqual(parallel, serial)
+        with zipfile.ZipFile(io.BytesIO(parallel)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.namelist(),
+                             sorted(name for name, _ in files))
+
+    def test_deterministic(self):
+        '''Should produce the same bytes for the same content.'''
+        fragment_files = [
+            ('static/b.css', self.write_file('b.css', b'body {}')),
+            ('static/a.js', self.write_file('a.js', b'var a = 1;'))
+        ]
+        fragment = pjoin(self.tmp, 'assets.frag')
+        with open(fragment, 'wb') as f:
+            write_fragment(fragment_files, f)
+        files = [('z.txt', self.write_file('z.txt', b'z')),
+                 ('index.ipynb', self.write_file('a.ipynb', b'{}'))]
+        first = b''.join(iter_zip(files, [fragment]))
+
+        # Same content, other order, times and permissions
+        for _, path in files + fragment_files:
+            os.utime(path, (1e9, 1e9))
+            os.chmod(path, 0o600)
+        second = b''.join(iter_zip(list(reversed(files)), [fragment]))
+
+        self.assertEqual(first, second)
+        with zipfile.ZipFile(io.BytesIO(first)) as zf:
+            self.assertEqual(zf.namelist(), ['index.ipynb', 'static/a.js',
+                                             'static/b.css', 'z.txt'])
+            info = zf.getinfo('z.txt')
+            self.assertEqual(info.date_time, (1980, 1, 1, 0, 0, 0))
+            self.assertEqual(info.external_attr >> 16, 0o100644)
+
+    def test_stored_extensions(self):
+        '''Should store already compressed files without deflating them.'''
+        files = [('logo.png', self.write_file('logo.png', b'\x89PNG' * 100)),
+                 ('a.js', self.write_file('a.js', b'var a;' * 100))]
+        archive = io.BytesIO(b''.join(iter_zip(files)))
+        with zipfile.ZipFile(archive) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.getinfo('logo.png').compress_type,
+                             zipfile.ZIP_STORED)
+            self.assertEqual(zf.getinfo('a.js').compress_type,
+                             zipfile.ZIP_DEFLATED)
+
+    def test_compression_level(self):
+        '''Should store everything at compression level 0.'''
+        files = [('a.js', self.write_file('a.js', b'var a;' * 100))]
+        archive = io.BytesIO(b''.join(iter_zip(files, compresslevel=0)))
+        with zipfile.ZipFile(archive) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.getinfo('a.js').compress_type,
+                             zipfile.ZIP_STORED)